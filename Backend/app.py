@@ -5,160 +5,196 @@
 
 import os
 import re
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, current_app, g, request, jsonify, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import event
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
 import jwt
 import datetime
 from functools import wraps
-from models import db, User, Trick, Comment, ForumTopic, ForumReply, Skatepark, TrickUpvote, ReplyUpvote
+from models import db, User, Trick, Comment, ForumTopic, ForumReply, Skatepark
+import leaderboards
+from counters import increment_counter, backfill_counters
+from pagination import paginated_response, ranked_response
+from serializers import comment_serializer, forum_topic_serializer, forum_reply_serializer
+import search
+import suggest
+import skateparks as skatepark_queries
+import clusters
+from cache import response_cache, RedisBackend, DEFAULT_TTL_SECONDS, ALL_TAG
+from versions import conditional, bump_versions
+import database
+from database import (REPLICA, DEFAULT_STATEMENT_TIMEOUTS, DEFAULT_STICKY_SECONDS, normalize_database_url,
+                      engine_options, pool_stats, sticky_reads, read_from_primary)
+import roles
+from roles import role_versions
+import outbox
+import migrations
+import moderation
+import events
+from events import live_events
+import upvotes
+from upvotes import upvote_buffer
 from dotenv import load_dotenv
 from urllib.parse import urlparse
-from flask_mail import Mail, Message
+from flask_mail import Mail
 from itsdangerous import URLSafeTimedSerializer
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from google_tokens import GoogleTokenVerifier, KeyCache, HTTPKeySource
+from token_store import MemoryTokenStore, RedisTokenStore
+from passwords import PasswordHasher, HasherBusy, DEFAULT_ROUNDS, DEFAULT_MAX_PENDING
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-import redis
 import logging
 import secrets
+import threading
+import click
 
 # ═══════════════════════════════════════════════════════════════════════════════════════
-# Environment Configuration & Validation
+# Configuration
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
 load_dotenv()
 
-# Critical environment variables validation
-required_env_vars = [
-    'DATABASE_URL',
-    'SECRET_KEY',
-    'MAIL_USERNAME',
-    'MAIL_PASSWORD',
-    'FRONTEND_URL',
-    'GOOGLE_CLIENT_ID'
-]
-
-missing_vars = [var for var in required_env_vars if not os.environ.get(var)]
-if missing_vars:
-    raise RuntimeError(f"Missing required environment variables: {', '.join(missing_vars)}")
+# Settings the app can't run without, by config key, with the environment variable they come from
+REQUIRED_SETTINGS = {
+    'SQLALCHEMY_DATABASE_URI': 'DATABASE_URL',
+    'SECRET_KEY': 'SECRET_KEY',
+    'MAIL_USERNAME': 'MAIL_USERNAME',
+    'MAIL_PASSWORD': 'MAIL_PASSWORD',
+    'FRONTEND_URL': 'FRONTEND_URL',
+    'GOOGLE_CLIENT_ID': 'GOOGLE_CLIENT_ID'
+}
+
+def config_from_env():
+    """Application settings read from the environment"""
+    return dict(
+        SQLALCHEMY_DATABASE_URI=normalize_database_url(os.environ.get('DATABASE_URL')),
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Optional read replica, used for GET requests except by users who just wrote
+        DATABASE_REPLICA_URL=normalize_database_url(os.environ.get('DATABASE_REPLICA_URL')),
+        REPLICA_STICKY_SECONDS=float(os.environ.get('REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)),
+        # Connection pool; pre-ping replaces connections dropped by a database restart
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 5)),
+        DB_MAX_OVERFLOW=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        DB_POOL_RECYCLE=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        DB_POOL_TIMEOUT=int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        DB_POOL_PRE_PING=os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False'),
+        # Per request class (read, write, admin), e.g. DB_ADMIN_STATEMENT_TIMEOUT_MS
+        STATEMENT_TIMEOUTS={
+            kind: int(os.environ.get(f'DB_{kind.upper()}_STATEMENT_TIMEOUT_MS', timeout))
+            for kind, timeout in DEFAULT_STATEMENT_TIMEOUTS.items()
+        },
+        SECRET_KEY=os.environ.get('SECRET_KEY'),
+        FRONTEND_URL=os.environ.get('FRONTEND_URL'),
+        GOOGLE_CLIENT_ID=os.environ.get('GOOGLE_CLIENT_ID'),
+        # Email configuration for Gmail SMTP, overridable to point at a local sink (smtp_sink.py)
+        MAIL_SERVER=os.environ.get('MAIL_SERVER', 'smtp.gmail.com'),
+        MAIL_PORT=int(os.environ.get('MAIL_PORT', 587)),
+        MAIL_USE_TLS=os.environ.get('MAIL_USE_TLS', '1') not in ('0', 'false', 'False'),
+        MAIL_USERNAME=os.environ.get('MAIL_USERNAME'),
+        MAIL_PASSWORD=os.environ.get('MAIL_PASSWORD'),
+        MAIL_DEFAULT_SENDER=os.environ.get('MAIL_USERNAME'),
+        # Redis is optional; the rate limiter, caches and refresh tokens fall back to memory
+        REDIS_URL=os.environ.get('REDIS_URL'),
+        RATELIMIT_STORAGE_URI=os.environ.get('REDIS_URL', 'memory://'),
+        RESPONSE_CACHE_TTL=int(os.environ.get('RESPONSE_CACHE_TTL', DEFAULT_TTL_SECONDS)),
+        LIVE_EVENTS_HEARTBEAT_SECONDS=float(os.environ.get('LIVE_EVENTS_HEARTBEAT_SECONDS',
+                                                           events.DEFAULT_HEARTBEAT_SECONDS)),
+        # Upvote toggles are written to the database in batches this often; 0 writes each one
+        UPVOTE_FLUSH_SECONDS=float(os.environ.get('UPVOTE_FLUSH_SECONDS', upvotes.DEFAULT_FLUSH_SECONDS)),
+        BCRYPT_LOG_ROUNDS=int(os.environ.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS)),
+        PASSWORD_HASH_WORKERS=int(os.environ.get('PASSWORD_HASH_WORKERS', 0)),
+        PASSWORD_HASH_MAX_PENDING=int(os.environ.get('PASSWORD_HASH_MAX_PENDING', DEFAULT_MAX_PENDING)),
+        # CORS configuration for development and production
+        CORS_ORIGINS=[
+            'https://wikitricks.netlify.app',
+            'http://localhost:3000'
+        ] if os.environ.get('FLASK_ENV') == 'development' else [
+            'https://wikitricks.netlify.app'
+        ]
+    )
 
-print("✓ Environment variables validated successfully")
+# Token expiration configuration
+ACCESS_TOKEN_EXPIRES_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRES_MINUTES', 15))
+REFRESH_TOKEN_EXPIRES_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRES_DAYS', 7))
+REFRESH_TOKEN_EXPIRES_SECONDS = REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600
+REFRESH_TOKEN_SECRET = os.environ.get('REFRESH_TOKEN_SECRET', 'refresh-secret-key')
 
 # ═══════════════════════════════════════════════════════════════════════════════════════
-# Application Setup & Configuration
+# Extensions & Shared State
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-app = Flask(__name__)
-
-# CORS configuration for development and production
-CORS(app, 
-    origins=[
-        'https://wikitricks.netlify.app',
-        'http://localhost:3000'
-    ] if os.environ.get('FLASK_ENV') == 'development' else [
-        'https://wikitricks.netlify.app'
-    ],
-    supports_credentials=True,
-    methods=['GET', 'POST', 'PUT', 'DELETE'],
-    allow_headers=['Content-Type', 'Authorization']
+# Nothing here opens a connection: create_app() binds the extensions, and
+# connect_shared_state() reaches Redis on a worker's first request.
+api = Blueprint('api', __name__, cli_group=None)
+mail = Mail()
+limiter = Limiter(
+    key_func=get_remote_address,
+    default_limits=["200 per day", "50 per hour"]
 )
 
-bcrypt = Bcrypt(app)
-
-# Database configuration with PostgreSQL support
-database_url = os.environ.get('DATABASE_URL')
-if database_url:
-    print(f"✓ Connecting to database: {database_url}")
-    # Handle legacy postgres:// URLs
-    if database_url.startswith("postgres://"):
-        database_url = database_url.replace("postgres://", "postgresql://", 1)
-else:
-    raise RuntimeError("DATABASE_URL is not set in environment variables")
-
-app.config.update(
-    SQLALCHEMY_DATABASE_URI=database_url,
-    SQLALCHEMY_TRACK_MODIFICATIONS=False,
-    SECRET_KEY=os.environ.get('SECRET_KEY', 'dev-secret-key')
-)
+# Password hashing cost; PASSWORD_HASH_WORKERS > 0 runs bcrypt in a bounded process pool
+password_hasher = PasswordHasher()
 
-# Email configuration for Gmail SMTP
-app.config.update(
-    MAIL_SERVER='smtp.gmail.com',
-    MAIL_PORT=587,
-    MAIL_USE_TLS=True,
-    MAIL_USERNAME=os.environ.get('MAIL_USERNAME'),
-    MAIL_PASSWORD=os.environ.get('MAIL_PASSWORD'),
-    MAIL_DEFAULT_SENDER=os.environ.get('MAIL_USERNAME')
-)
+# Google ID tokens are checked locally against signing keys fetched on first use
+google_verifier = GoogleTokenVerifier(None, KeyCache(HTTPKeySource()))
 
-# Initialize extensions
-mail = Mail(app)
-serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
-db.init_app(app)
+# Refresh tokens move to Redis when available; the in-memory fallback only suits a single worker
+refresh_tokens = MemoryTokenStore()
+event.listen(User.__table__, 'after_drop', lambda *args, **kwargs: refresh_tokens.reset())
 
-# Database connection verification
-with app.app_context():
+_shared_state_lock = threading.Lock()
+_shared_state_connected = False
+
+def connect_redis(url):
+    """Return a Redis client for url, or None when it is not a Redis URL or is unreachable"""
+    if not url or not url.startswith(('redis://', 'rediss://', 'unix://')):
+        return None
+    import redis
     try:
-        from sqlalchemy import text
-        db.session.execute(text('SELECT 1'))
-        print("✓ Database connection successful!")
+        client = redis.StrictRedis.from_url(url)
+        client.ping()
+        return client
     except Exception as e:
-        print(f"✗ Database connection failed: {e}")
-
-# Rate limiting configuration
-redis_url = os.environ.get('REDIS_URL', 'memory://')
-limiter = Limiter(
-    key_func=get_remote_address,
-    app=app,
-    default_limits=["200 per day", "50 per hour"],
-    storage_uri=redis_url
-)
-
-# Google OAuth configuration
-GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
-
-# Token expiration configuration
-ACCESS_TOKEN_EXPIRES_MINUTES = int(os.environ.get('ACCESS_TOKEN_EXPIRES_MINUTES', 15))
-REFRESH_TOKEN_EXPIRES_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRES_DAYS', 7))
-REFRESH_TOKEN_SECRET = os.environ.get('REFRESH_TOKEN_SECRET', 'refresh-secret-key')
+        print(f"✗ Redis unavailable, using per-process memory: {e}")
+        return None
 
-# Use Redis for refresh token storage if available, else fallback to dict
-try:
-    refresh_redis = redis.StrictRedis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
-    refresh_redis.ping()
-    def store_refresh_token(token, user_id, expires):
-        refresh_redis.setex(token, expires, user_id)
-    def get_refresh_token_user(token):
-        user_id = refresh_redis.get(token)
-        return int(user_id) if user_id else None
-    def delete_refresh_token(token):
-        refresh_redis.delete(token)
-except Exception:
-    refresh_tokens = {}
-    def store_refresh_token(token, user_id, expires):
-        refresh_tokens[token] = (user_id, datetime.datetime.utcnow() + datetime.timedelta(seconds=expires))
-    def get_refresh_token_user(token):
-        data = refresh_tokens.get(token)
-        if not data:
-            return None
-        user_id, expiry = data
-        if datetime.datetime.utcnow() > expiry:
-            del refresh_tokens[token]
-            return None
-        return user_id
-    def delete_refresh_token(token):
-        refresh_tokens.pop(token, None)
+def connect_shared_state():
+    """
+    Move the response cache, role versions, refresh tokens, replica
+    stickiness, live events and upvote buffers to Redis when REDIS_URL points at one. Runs once per process,
+    on the first request or CLI command that needs them.
+    """
+    global refresh_tokens, _shared_state_connected
+    if _shared_state_connected:
+        return
+    with _shared_state_lock:
+        if _shared_state_connected:
+            return
+        client = connect_redis(current_app.config.get('REDIS_URL'))
+        if client is not None:
+            response_cache.backend = RedisBackend(client)
+            role_versions.backend = roles.RedisBackend(client)
+            refresh_tokens = RedisTokenStore(client)
+            sticky_reads.backend = database.RedisBackend(client)
+            live_events.backend = events.RedisBackend(client)
+            upvote_buffer.backend = upvotes.RedisBackend(client)
+        _shared_state_connected = True
+
+def url_serializer():
+    """Signs email verification and password reset links"""
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
 
 # Helper to generate tokens
-def generate_access_token(user_id):
+def generate_access_token(user_id, is_admin=None):
+    """Sign an access token carrying the user's role; the role is looked up when not given"""
+    if is_admin is None:
+        is_admin = bool(db.session.query(User.is_admin).filter_by(id=user_id).scalar())
     return jwt.encode({
         'user_id': user_id,
+        **role_versions.claims(user_id, is_admin),
         'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRES_MINUTES)
-    }, app.config['SECRET_KEY'], algorithm='HS256')
+    }, current_app.config['SECRET_KEY'], algorithm='HS256')
 
 def generate_refresh_token():
     return secrets.token_urlsafe(64)
@@ -176,14 +212,28 @@ def token_required(f):
             return jsonify({'error': 'Token missing or malformed'}), 401
         token = auth_header[7:]
         try:
-            user_data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            user_data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+            g.user_id = user_data['user_id']
             return f(*args, user_data=user_data, **kwargs)
         except Exception:
             return jsonify({'error': 'Invalid token'}), 401
     return decorated
 
+def get_optional_user_id():
+    """Return the user id of a valid bearer token, or None for anonymous requests"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    try:
+        return jwt.decode(auth_header[7:], current_app.config['SECRET_KEY'], algorithms=['HS256'])['user_id']
+    except Exception:
+        return None
+
+def role_changed_response():
+    return jsonify({'error': 'Role changed, please refresh your token'}), 401
+
 def admin_required(f):
-    """Decorator to require admin privileges for admin-only routes"""
+    """Decorator to require admin privileges for admin-only routes, read from the token's role claims"""
     @wraps(f)
     def decorated(*args, **kwargs):
         token = request.headers.get('Authorization')
@@ -192,67 +242,53 @@ def admin_required(f):
         try:
             if token.startswith('Bearer '):
                 token = token[7:]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            
-            user = User.query.get(data['user_id'])
-            if not user or not user.is_admin:
-                return jsonify({'error': 'Admin access required'}), 403
-                
-            return f(*args, **kwargs)
-        except:
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+            g.user_id = data['user_id']
+            if not role_versions.is_current(data):
+                return role_changed_response()
+        except Exception:
             return jsonify({'error': 'Invalid token'}), 401
+        if not roles.is_admin(data):
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
     return decorated
 
+@api.before_request
+def route_reads():
+    """Read-your-writes: a user who just wrote keeps reading from the primary instead of the replica"""
+    if request.method in database.READ_METHODS and REPLICA in db.engines:
+        g.read_from_primary = sticky_reads.active(get_optional_user_id())
+
 # ═══════════════════════════════════════════════════════════════════════════════════════
 # Email Utility Functions
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
 def send_verification_email(email, token):
-    """Send email verification link to new users"""
-    try:
-        verification_url = f"{os.environ.get('FRONTEND_URL')}/verify-email/{token}"
-        msg = Message('Vérification de votre compte WikiTricks',
-                    sender=app.config['MAIL_DEFAULT_SENDER'],
-                    recipients=[email])
-        msg.body = f'''Pour vérifier votre compte, veuillez cliquer sur le lien suivant:
+    """Queue the email verification link of a new user; sent once the caller commits"""
+    verification_url = f"{current_app.config['FRONTEND_URL']}/verify-email/{token}"
+    outbox.queue_email(email, 'Vérification de votre compte WikiTricks', f'''Pour vérifier votre compte, veuillez cliquer sur le lien suivant:
 {verification_url}
 
 Ce lien expire dans 24 heures.
-'''
-        mail.send(msg)
-        print(f"✓ Verification email sent to {email}")
-        return True
-    except Exception as e:
-        print(f"✗ Failed to send verification email: {str(e)}")
-        return False
+''')
 
 def send_password_reset_email(email, token):
-    """Send password reset link to users"""
-    try:
-        reset_url = f"{os.environ.get('FRONTEND_URL')}/reset-password/{token}"
-        msg = Message('WikiTricks Password Reset',
-                    sender=app.config['MAIL_DEFAULT_SENDER'],
-                    recipients=[email])
-        msg.body = f'''To reset your WikiTricks password, click the link below:
+    """Queue a password reset link; sent once the caller commits"""
+    reset_url = f"{current_app.config['FRONTEND_URL']}/reset-password/{token}"
+    outbox.queue_email(email, 'WikiTricks Password Reset', f'''To reset your WikiTricks password, click the link below:
 
 {reset_url}
 
 This link will expire in 1 hour.
 
 If you didn't request this password reset, please ignore this email.
-'''
-        mail.send(msg)
-        print(f"✓ Password reset email sent to {email}")
-        return True
-    except Exception as e:
-        print(f"✗ Failed to send password reset email: {str(e)}")
-        return False
+''')
 
 # ═══════════════════════════════════════════════════════════════════════════════════════
 # Trick Management Routes
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/create-trick', methods=['POST'])
+@api.route('/create-trick', methods=['POST'])
 @token_required
 def create_trick(user_data):
     """Create a new skateboarding trick with video and details"""
@@ -274,6 +310,7 @@ def create_trick(user_data):
             user_id=user_data['user_id']
         )
         db.session.add(new_trick)
+        leaderboards.record_trick(new_trick)
         db.session.commit()
 
         return jsonify({
@@ -284,36 +321,33 @@ def create_trick(user_data):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/tricks', methods=['GET'])
+@api.route('/tricks', methods=['GET'])
+@conditional('tricks')
+@response_cache.cached('tricks')
 def get_tricks():
-    """Retrieve all tricks with YouTube embed URL processing"""
+    """Retrieve tricks with YouTube embed URL processing, optionally paginated"""
     try:
-        tricks = Trick.query.order_by(Trick.created.desc()).all()
-        trick_list = []
-        
-        for trick in tricks:
-            trick_data = trick.to_dict()
-            video_url = trick.video_url
-            trick_data['video_url'] = get_youtube_embed_url(video_url)
-            trick_list.append(trick_data)
-            
-        return jsonify(trick_list)
+        return paginated_response(
+            Trick.query,
+            [Trick.created, Trick.id],
+            serialize_trick,
+            annotate=upvoted_annotator('trick')
+        )
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/tricks/<int:trick_id>', methods=['GET'])
+@api.route('/tricks/<int:trick_id>', methods=['GET'])
+@conditional('trick:{trick_id}')
+@response_cache.cached('trick:{trick_id}')
 def get_trick(trick_id):
     """Retrieve a specific trick by ID"""
     try:
         trick = Trick.query.get_or_404(trick_id)
-        trick_data = trick.to_dict()
-        video_url = trick.video_url
-        trick_data['video_url'] = get_youtube_embed_url(video_url)
-        return jsonify(trick_data)
+        return jsonify(serialize_trick(trick, pending_upvotes=True))
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/tricks/<int:trick_id>', methods=['DELETE'])
+@api.route('/tricks/<int:trick_id>', methods=['DELETE'])
 @token_required
 def delete_own_trick(trick_id, user_data):
     """Allow users to delete their own tricks or admins to delete any trick"""
@@ -321,12 +355,13 @@ def delete_own_trick(trick_id, user_data):
         user_id = user_data['user_id']
         trick = Trick.query.get_or_404(trick_id)
         # Verify ownership or admin privileges
-        user = User.query.get(user_id)
-        if trick.user_id != user_id and not user.is_admin:
-            return jsonify({'error': 'Permission denied'}), 403
-        # Clean up related data before deletion
-        Comment.query.filter_by(trick_id=trick_id).delete()
-        TrickUpvote.query.filter_by(trick_id=trick_id).delete()
+        if trick.user_id != user_id:
+            if not role_versions.is_current(user_data):
+                return role_changed_response()
+            if not roles.is_admin(user_data):
+                return jsonify({'error': 'Permission denied'}), 403
+        # Comments and upvotes go with it through ON DELETE CASCADE
+        leaderboards.remove_trick(trick)
         db.session.delete(trick)
         db.session.commit()
         return jsonify({'message': 'Trick deleted successfully'}), 200
@@ -334,24 +369,34 @@ def delete_own_trick(trick_id, user_data):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/tricks/search', methods=['GET'])
+@api.route('/tricks/search', methods=['GET'])
+@conditional('tricks')
 def search_tricks():
-    """Search tricks by title with YouTube URL processing"""
+    """Full-text search over trick titles and descriptions, ranked by relevance"""
     query = request.args.get('q', '')
     try:
-        search_filter = f"%{query}%"
-        tricks = Trick.query.filter(
-            Trick.title.ilike(search_filter)
-        ).order_by(Trick.created.desc()).all()
-        
-        trick_list = []
-        for trick in tricks:
-            trick_data = trick.to_dict()
-            video_url = trick.video_url
-            trick_data['video_url'] = get_youtube_embed_url(video_url)
-            trick_list.append(trick_data)
-            
-        return jsonify(trick_list)
+        annotate = upvoted_annotator('trick')
+        if not search.tokenize(query):
+            return paginated_response(Trick.query, [Trick.created, Trick.id], serialize_trick, annotate=annotate)
+        return ranked_response(
+            lambda limit, offset: search.search_tricks(query, limit, offset),
+            serialize_trick,
+            annotate=annotate
+        )
+    except Exception as e:
+        return handle_internal_error(e)
+
+@api.route('/tricks/suggest', methods=['GET'])
+@conditional('tricks')
+def suggest_tricks():
+    """Typeahead suggestions returning only trick IDs and titles, tolerant of typos"""
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', suggest.DEFAULT_SUGGESTIONS)), 1), suggest.MAX_SUGGESTIONS)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        return jsonify(suggest.suggest_tricks(query, limit))
     except Exception as e:
         return handle_internal_error(e)
 
@@ -359,7 +404,7 @@ def search_tricks():
 # User Authentication & Account Management
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/register', methods=['POST'])
+@api.route('/register', methods=['POST'])
 @limiter.limit("5 per minute")
 def register():
     """Register new user with email verification"""
@@ -376,8 +421,8 @@ def register():
         if User.query.filter_by(username=data['username']).first():
             return jsonify({'error': 'Username already exists'}), 409
 
-        hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
-        verification_token = serializer.dumps(data['email'], salt='email-verify')
+        hashed_password = password_hasher.hash(data['password'])
+        verification_token = url_serializer().dumps(data['email'], salt='email-verify')
         
         new_user = User(
             email=data['email'],
@@ -387,23 +432,27 @@ def register():
             verification_token=verification_token
         )
         db.session.add(new_user)
-        db.session.commit()
-        
         send_verification_email(data['email'], verification_token)
+        db.session.commit()
         
         return jsonify({
             'message': 'User created successfully. Please check your email to verify your account.'
         }), 201
+    except HasherBusy:
+        db.session.rollback()
+        return hasher_busy_response()
     except Exception as e:
         db.session.rollback()
         print(f"Registration error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/verify-email/<token>', methods=['GET'])
+@api.route('/verify-email/<token>', methods=['GET'])
 def verify_email(token):
     """Verify user email with token"""
+    # A GET that writes, for a user who may have registered moments ago
+    read_from_primary()
     try:
-        email = serializer.loads(token, salt='email-verify', max_age=86400)  # 24 hours
+        email = url_serializer().loads(token, salt='email-verify', max_age=86400)  # 24 hours
         user = User.query.filter_by(email=email).first()
         
         if not user:
@@ -417,7 +466,7 @@ def verify_email(token):
     except:
         return jsonify({'error': 'Invalid or expired verification link'}), 400
 
-@app.route('/login', methods=['POST'])
+@api.route('/login', methods=['POST'])
 @limiter.limit("10 per minute")
 def login():
     """Authenticate user and return JWT token and refresh token"""
@@ -431,59 +480,73 @@ def login():
             return jsonify({'error': 'Invalid credentials'}), 401
         if not user.is_verified:
             return jsonify({'error': 'Please verify your email before logging in'}), 403
-        if bcrypt.check_password_hash(user.password, data['password']):
-            access_token = generate_access_token(user.id)
+        if password_hasher.check(user.password, data['password']):
+            # Upgrade hashes made at another cost while the plain password is at hand
+            if password_hasher.needs_rehash(user.password):
+                user.password = password_hasher.hash(data['password'])
+                db.session.commit()
+            access_token = generate_access_token(user.id, user.is_admin)
             refresh_token = generate_refresh_token()
-            store_refresh_token(refresh_token, user.id, REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600)
+            refresh_tokens.store(refresh_token, user.id, REFRESH_TOKEN_EXPIRES_SECONDS)
             response = jsonify({
                 'token': access_token,
                 'user': user.to_dict()
             })
             response.set_cookie(
                 'refresh_token', refresh_token,
-                httponly=True, samesite='Strict', secure=not app.debug,
-                max_age=REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600
+                httponly=True, samesite='Strict', secure=not current_app.debug,
+                max_age=REFRESH_TOKEN_EXPIRES_SECONDS
             )
             return response
         return jsonify({'error': 'Invalid credentials'}), 401
+    except HasherBusy:
+        return hasher_busy_response()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/refresh-token', methods=['POST'])
+@api.route('/refresh-token', methods=['POST'])
 def refresh_token():
     """Issue a new access token using a valid refresh token"""
     refresh_token = request.cookies.get('refresh_token')
     if not refresh_token:
         return jsonify({'error': 'Refresh token missing'}), 401
-    user_id = get_refresh_token_user(refresh_token)
+    # Rotate the refresh token; a token can only be redeemed once
+    new_refresh_token = generate_refresh_token()
+    user_id = refresh_tokens.rotate(refresh_token, new_refresh_token, REFRESH_TOKEN_EXPIRES_SECONDS)
     if not user_id:
         return jsonify({'error': 'Invalid or expired refresh token'}), 401
-    # Optionally rotate refresh token for extra security
-    new_refresh_token = generate_refresh_token()
-    store_refresh_token(new_refresh_token, user_id, REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600)
-    delete_refresh_token(refresh_token)
     access_token = generate_access_token(user_id)
     response = jsonify({'token': access_token})
     response.set_cookie(
         'refresh_token', new_refresh_token,
-        httponly=True, samesite='Strict', secure=not app.debug,
-        max_age=REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600
+        httponly=True, samesite='Strict', secure=not current_app.debug,
+        max_age=REFRESH_TOKEN_EXPIRES_SECONDS
     )
     return response
 
 # Optional: Add logout endpoint to revoke refresh token
-@app.route('/logout', methods=['POST'])
+@api.route('/logout', methods=['POST'])
 @token_required
 def logout(user_data):
     """Logout user by deleting refresh token"""
     refresh_token = request.cookies.get('refresh_token')
     if refresh_token:
-        delete_refresh_token(refresh_token)
+        refresh_tokens.delete(refresh_token)
     response = jsonify({'message': 'Logged out'})
     response.delete_cookie('refresh_token')
     return response
 
-@app.route('/auth/google', methods=['POST'])
+@api.route('/logout-all', methods=['POST'])
+@token_required
+def logout_all(user_data):
+    """Revoke every refresh token of the user, logging out all their sessions"""
+    revoked = refresh_tokens.delete_user(user_data['user_id'])
+    response = jsonify({'message': 'Logged out of all sessions', 'sessions': revoked})
+    response.delete_cookie('refresh_token')
+    return response
+
+@api.route('/auth/google', methods=['POST'])
 def google_auth():
     """Authenticate user with Google OAuth"""
     try:
@@ -491,9 +554,7 @@ def google_auth():
         token = data.get('token')
         if not token:
             return jsonify({'error': 'Token is required'}), 400
-        idinfo = id_token.verify_oauth2_token(
-            token, requests.Request(), GOOGLE_CLIENT_ID
-        )
+        idinfo = google_verifier.verify(token)
         email = idinfo.get('email')
         name = idinfo.get('name')
         google_id = idinfo.get('sub')
@@ -505,7 +566,7 @@ def google_auth():
                 user.google_id = google_id
                 db.session.commit()
         else:
-            dummy_password = bcrypt.generate_password_hash(secrets.token_urlsafe(32)).decode('utf-8')
+            dummy_password = password_hasher.hash(secrets.token_urlsafe(32))
             user = User(
                 email=email,
                 username=name or email.split('@')[0],
@@ -515,17 +576,17 @@ def google_auth():
             )
             db.session.add(user)
             db.session.commit()
-        access_token = generate_access_token(user.id)
+        access_token = generate_access_token(user.id, user.is_admin)
         refresh_token = generate_refresh_token()
-        store_refresh_token(refresh_token, user.id, REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600)
+        refresh_tokens.store(refresh_token, user.id, REFRESH_TOKEN_EXPIRES_SECONDS)
         response = jsonify({
             'token': access_token,
             'user': user.to_dict()
         })
         response.set_cookie(
             'refresh_token', refresh_token,
-            httponly=True, samesite='Strict', secure=not app.debug,
-            max_age=REFRESH_TOKEN_EXPIRES_DAYS * 24 * 3600
+            httponly=True, samesite='Strict', secure=not current_app.debug,
+            max_age=REFRESH_TOKEN_EXPIRES_SECONDS
         )
         return response
     except ValueError as e:
@@ -533,7 +594,7 @@ def google_auth():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/user/profile', methods=['PUT'])
+@api.route('/user/profile', methods=['PUT'])
 @token_required
 def update_profile(user_data):
     """Update user profile information"""
@@ -544,7 +605,7 @@ def update_profile(user_data):
         data = request.json
         # Require password check for non-Google users
         if not user.google_id:
-            if not bcrypt.check_password_hash(user.password, data.get('currentPassword', '')):
+            if not password_hasher.check(user.password, data.get('currentPassword', '')):
                 return jsonify({'error': 'Mot de passe actuel incorrect'}), 401
         else:
             # For Google users, require Google ID token verification for profile changes
@@ -552,9 +613,7 @@ def update_profile(user_data):
             if not google_token:
                 return jsonify({'error': 'Google authentication required for profile update'}), 401
             try:
-                idinfo = id_token.verify_oauth2_token(
-                    google_token, requests.Request(), GOOGLE_CLIENT_ID
-                )
+                idinfo = google_verifier.verify(google_token)
                 if idinfo.get('sub') != user.google_id or idinfo.get('email') != user.email:
                     return jsonify({'error': 'Google authentication failed'}), 401
             except Exception:
@@ -569,14 +628,14 @@ def update_profile(user_data):
             user.region = data['region']
         # Update password if provided (only for non-Google users)
         if data.get('newPassword') and not user.google_id:
-            user.password = bcrypt.generate_password_hash(data['newPassword']).decode('utf-8')
+            user.password = password_hasher.hash(data['newPassword'])
         db.session.commit()
         return jsonify(user.to_dict()), 200
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/user/me', methods=['GET'])
+@api.route('/user/me', methods=['GET'])
 @token_required
 def get_current_user(user_data):
     """Get current authenticated user information"""
@@ -588,7 +647,7 @@ def get_current_user(user_data):
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/forgot-password', methods=['POST'])
+@api.route('/forgot-password', methods=['POST'])
 @limiter.limit("3 per minute")
 def forgot_password():
     """Send password reset email"""
@@ -602,15 +661,16 @@ def forgot_password():
             # Don't reveal if email exists for security
             return jsonify({'message': 'If this email exists, you will receive a password reset link'}), 200
         
-        reset_token = serializer.dumps(user.email, salt='password-reset')
+        reset_token = url_serializer().dumps(user.email, salt='password-reset')
         send_password_reset_email(user.email, reset_token)
+        db.session.commit()
         
         return jsonify({'message': 'If this email exists, you will receive a password reset link'}), 200
         
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/reset-password/<token>', methods=['POST'])
+@api.route('/reset-password/<token>', methods=['POST'])
 def reset_password(token):
     """Reset user password with token"""
     data = request.json
@@ -619,13 +679,13 @@ def reset_password(token):
     
     try:
         # Verify token (valid for 1 hour)
-        email = serializer.loads(token, salt='password-reset', max_age=3600)
+        email = url_serializer().loads(token, salt='password-reset', max_age=3600)
         user = User.query.filter_by(email=email).first()
         
         if not user:
             return jsonify({'error': 'Invalid reset link'}), 404
         
-        user.password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        user.password = password_hasher.hash(data['password'])
         db.session.commit()
         
         return jsonify({'message': 'Password reset successfully'}), 200
@@ -637,16 +697,27 @@ def reset_password(token):
 # Comment System
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/tricks/<int:trick_id>/comments', methods=['GET'])
+@api.route('/tricks/<int:trick_id>/comments', methods=['GET'])
+@conditional('trick:{trick_id}', 'users')
 def get_comments(trick_id):
-    """Get all comments for a specific trick"""
+    """Get comments for a specific trick, optionally paginated"""
     try:
-        comments = Comment.query.filter_by(trick_id=trick_id).order_by(Comment.created.desc()).all()
-        return jsonify([comment.to_dict() for comment in comments])
+        return paginated_response(
+            comment_serializer.select(Comment.query.filter_by(trick_id=trick_id)),
+            [Comment.created, Comment.id],
+            comment_serializer
+        )
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/tricks/<int:trick_id>/comments', methods=['POST'])
+@api.route('/tricks/<int:trick_id>/events', methods=['GET'])
+def trick_events(trick_id):
+    """Server-sent events for a trick: new comments and upvote counts"""
+    if db.session.get(Trick, trick_id) is None:
+        return jsonify({'error': 'Trick not found'}), 404
+    return event_stream_response(f'trick:{trick_id}')
+
+@api.route('/tricks/<int:trick_id>/comments', methods=['POST'])
 @token_required
 def create_comment(trick_id, user_data):
     """Create a new comment on a trick"""
@@ -660,8 +731,11 @@ def create_comment(trick_id, user_data):
             user_id=user_data['user_id']
         )
         db.session.add(comment)
+        leaderboards.record_comment(comment)
         db.session.commit()
-        return jsonify(comment.to_dict()), 201
+        created = comment_serializer.one(comment.id)
+        live_events.publish(f'trick:{trick_id}', 'comment', created)
+        return jsonify(created), 201
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
@@ -670,16 +744,21 @@ def create_comment(trick_id, user_data):
 # Forum System
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/forum/topics', methods=['GET'])
+@api.route('/forum/topics', methods=['GET'])
+@conditional('forum_topics', 'users')
+@response_cache.cached('forum_topics', 'users')
 def get_forum_topics():
-    """Get all forum topics with pinned topics first"""
+    """Get forum topics with pinned topics first, optionally paginated"""
     try:
-        topics = ForumTopic.query.order_by(ForumTopic.is_pinned.desc(), ForumTopic.created.desc()).all()
-        return jsonify([topic.to_dict() for topic in topics])
+        return paginated_response(
+            forum_topic_serializer.select(),
+            [ForumTopic.is_pinned, ForumTopic.created, ForumTopic.id],
+            forum_topic_serializer
+        )
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/forum/topics', methods=['POST'])
+@api.route('/forum/topics', methods=['POST'])
 @token_required
 def create_forum_topic(user_data):
     """Create a new forum topic"""
@@ -693,31 +772,48 @@ def create_forum_topic(user_data):
             user_id=user_data['user_id']
         )
         db.session.add(topic)
+        leaderboards.record_forum_topic(topic)
         db.session.commit()
-        return jsonify(topic.to_dict()), 201
+        return jsonify(forum_topic_serializer.one(topic.id)), 201
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/forum/topics/<int:topic_id>', methods=['GET'])
+@api.route('/forum/topics/<int:topic_id>', methods=['GET'])
+@conditional('topic:{topic_id}', 'users')
 def get_forum_topic(topic_id):
     """Get a specific forum topic"""
     try:
-        topic = ForumTopic.query.get_or_404(topic_id)
-        return jsonify(topic.to_dict())
+        topic = forum_topic_serializer.one(topic_id)
+        if topic is None:
+            return jsonify({'error': 'Topic not found'}), 404
+        return jsonify(topic)
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/forum/topics/<int:topic_id>/replies', methods=['GET'])
+@api.route('/forum/topics/<int:topic_id>/replies', methods=['GET'])
+@conditional('topic:{topic_id}', 'users')
 def get_forum_replies(topic_id):
-    """Get all replies for a forum topic"""
+    """Get replies for a forum topic in chronological order, optionally paginated"""
     try:
-        replies = ForumReply.query.filter_by(topic_id=topic_id).order_by(ForumReply.created.asc()).all()
-        return jsonify([reply.to_dict() for reply in replies])
+        return paginated_response(
+            forum_reply_serializer.select(ForumReply.query.filter_by(topic_id=topic_id)),
+            [ForumReply.created, ForumReply.id],
+            forum_reply_serializer,
+            descending=False,
+            annotate=upvoted_annotator('reply')
+        )
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/forum/topics/<int:topic_id>/replies', methods=['POST'])
+@api.route('/forum/topics/<int:topic_id>/events', methods=['GET'])
+def forum_topic_events(topic_id):
+    """Server-sent events for a topic: new replies and reply upvote counts"""
+    if db.session.get(ForumTopic, topic_id) is None:
+        return jsonify({'error': 'Topic not found'}), 404
+    return event_stream_response(f'topic:{topic_id}')
+
+@api.route('/forum/topics/<int:topic_id>/replies', methods=['POST'])
 @token_required
 def create_forum_reply(topic_id, user_data):
     """Create a new reply to a forum topic"""
@@ -733,23 +829,34 @@ def create_forum_reply(topic_id, user_data):
             user_id=user_data['user_id']
         )
         db.session.add(reply)
+        increment_counter(ForumTopic, topic_id, 'reply_count')
+        leaderboards.record_forum_reply(reply)
         db.session.commit()
-        return jsonify(reply.to_dict()), 201
+        created = forum_reply_serializer.one(reply.id)
+        live_events.publish(f'topic:{topic_id}', 'reply', created)
+        return jsonify(created), 201
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/forum/search', methods=['GET'])
+@api.route('/forum/search', methods=['GET'])
+@conditional('forum_topics', 'users')
 def search_forum():
-    """Search forum topics by title"""
+    """Full-text search over forum topics and their replies, ranked by relevance"""
     query = request.args.get('q', '')
     try:
-        search_filter = f"%{query}%"
-        topics = ForumTopic.query.filter(
-            ForumTopic.title.ilike(search_filter)
-        ).order_by(ForumTopic.created.desc()).all()
-        
-        return jsonify([topic.to_dict() for topic in topics])
+        if not search.tokenize(query):
+            return paginated_response(
+                forum_topic_serializer.select(),
+                [ForumTopic.created, ForumTopic.id],
+                forum_topic_serializer
+            )
+        return ranked_response(
+            lambda limit, offset: forum_topic_serializer.rows_by_ids(
+                [topic.id for topic in search.search_forum_topics(query, limit, offset)]
+            ),
+            forum_topic_serializer
+        )
     except Exception as e:
         return handle_internal_error(e)
 
@@ -757,7 +864,7 @@ def search_forum():
 # Skatepark Management
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/create-skatepark', methods=['POST'])
+@api.route('/create-skatepark', methods=['POST'])
 def create_skatepark():
     """Create a new skatepark location"""
     if not request.is_json:
@@ -788,12 +895,69 @@ def create_skatepark():
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/skateparks', methods=['GET'])
+def parse_skatepark_area(args):
+    """
+    Read a viewport (south, west, north, east) or a circle (lat, lng, radius in km)
+    from the query string. Returns None when neither is given.
+    """
+    box_keys = ['south', 'west', 'north', 'east']
+    circle_keys = ['lat', 'lng', 'radius']
+    if any(key in args for key in box_keys):
+        south, west, north, east = (float(args[key]) for key in box_keys)
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise ValueError('Invalid bounding box')
+        return {'box': (south, west, north, east)}
+    if any(key in args for key in circle_keys):
+        lat, lng, radius = (float(args[key]) for key in circle_keys)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= skatepark_queries.MAX_RADIUS_KM):
+            raise ValueError('Invalid center or radius')
+        return {'circle': (lat, lng, radius)}
+    return None
+
+@api.route('/skateparks', methods=['GET'])
+@conditional('skateparks')
+@response_cache.cached('skateparks')
 def get_skateparks():
-    """Get all skateparks"""
+    """Get skateparks, optionally restricted to a viewport or radius and sorted by distance"""
     try:
-        skateparks = Skatepark.query.order_by(Skatepark.created_at.desc()).all()
-        return jsonify([skatepark.to_dict() for skatepark in skateparks])
+        area = parse_skatepark_area(request.args)
+        limit = min(int(request.args.get('limit', skatepark_queries.DEFAULT_RESULTS)), skatepark_queries.MAX_RESULTS)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Provide south, west, north and east, or lat, lng and radius (km)'}), 400
+
+    try:
+        if area is None:
+            skateparks = Skatepark.query.order_by(Skatepark.created_at.desc()).all()
+            return jsonify([skatepark.to_dict() for skatepark in skateparks])
+
+        if 'box' in area:
+            located = skatepark_queries.parks_in_box(*area['box'], limit=limit)
+        else:
+            located = skatepark_queries.parks_near(*area['circle'], limit=limit)
+        return jsonify([
+            dict(skatepark.to_dict(), distance_km=round(distance, 3))
+            for skatepark, distance in located
+        ])
+    except Exception as e:
+        return handle_internal_error(e)
+
+@api.route('/skateparks/clusters', methods=['GET'])
+@conditional('skateparks')
+def get_skatepark_clusters():
+    """Get skatepark clusters (count and centroid) covering a viewport at a map zoom level"""
+    try:
+        area = parse_skatepark_area(request.args)
+        zoom = int(request.args['zoom'])
+        if area is None or 'box' not in area or not 0 <= zoom <= clusters.MAX_ZOOM:
+            raise ValueError('A viewport and zoom level are required')
+        return jsonify({
+            'zoom': zoom,
+            'clusters': clusters.clusters_in_box(*area['box'], zoom)
+        })
+    except (KeyError, ValueError):
+        return jsonify({'error': f'Provide south, west, north, east and zoom (0-{clusters.MAX_ZOOM}) for a viewport of at most {clusters.MAX_TILES} tiles'}), 400
     except Exception as e:
         return handle_internal_error(e)
 
@@ -801,108 +965,158 @@ def get_skateparks():
 # Voting System
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/tricks/<int:trick_id>/upvote', methods=['POST'])
+# Maximum number of IDs accepted by the batch upvote status endpoints
+MAX_UPVOTE_STATUS_IDS = 100
+
+def get_upvoted_ids(upvote_model, foreign_key, user_id, ids=None):
+    """Return which of ids the user has upvoted, or all of their upvotes when ids is None"""
+    column = getattr(upvote_model, foreign_key)
+    query = db.session.query(column).filter(upvote_model.user_id == user_id)
+    if ids is not None:
+        query = query.filter(column.in_(ids))
+    return {row[0] for row in query}
+
+def get_upvote_statuses(kind, user_id, ids):
+    """
+    Resolve upvote status and count for many items with one IN query per
+    table, overridden by the toggles still waiting in the upvote buffer
+    """
+    model, upvote_model, foreign_key, _ = upvotes.KINDS[kind]
+    upvoted = get_upvoted_ids(upvote_model, foreign_key, user_id, ids)
+    rows = db.session.query(model.id, model.upvote_count).filter(model.id.in_(ids)).all()
+    statuses = {row.id: (row.id in upvoted, row.upvote_count) for row in rows}
+    for item_id, status in upvote_buffer.pending_statuses(kind, list(statuses), user_id).items():
+        statuses[item_id] = status
+    return {
+        str(item_id): {'upvoted': upvoted, 'upvote_count': upvote_count}
+        for item_id, (upvoted, upvote_count) in statuses.items()
+    }
+
+def upvoted_annotator(kind):
+    """Build a list annotator adding the caller's upvote status, or None when anonymous"""
+    user_id = get_optional_user_id()
+    if not user_id:
+        return None
+    _, upvote_model, foreign_key, _ = upvotes.KINDS[kind]
+
+    def annotate(items):
+        ids = [item['id'] for item in items]
+        upvoted = get_upvoted_ids(
+            upvote_model, foreign_key, user_id,
+            ids if len(ids) <= MAX_UPVOTE_STATUS_IDS else None
+        )
+        pending = upvote_buffer.pending_statuses(kind, ids, user_id)
+        for item in items:
+            item['upvoted'] = item['id'] in upvoted
+            if item['id'] in pending:
+                item['upvoted'], item['upvote_count'] = pending[item['id']]
+    return annotate
+
+def parse_id_list(value):
+    """Parse a comma-separated list of integer IDs, returning None if invalid"""
+    try:
+        ids = {int(part) for part in value.split(',') if part.strip()}
+    except ValueError:
+        return None
+    if not ids or len(ids) > MAX_UPVOTE_STATUS_IDS:
+        return None
+    return list(ids)
+
+@api.route('/tricks/upvote-status', methods=['GET'])
+@token_required
+def get_tricks_upvote_status(user_data):
+    """Get upvote status for several tricks given as ?ids=1,2,3"""
+    ids = parse_id_list(request.args.get('ids', ''))
+    if ids is None:
+        return jsonify({'error': f'ids must list between 1 and {MAX_UPVOTE_STATUS_IDS} trick IDs'}), 400
+    try:
+        return jsonify(get_upvote_statuses('trick', user_data['user_id'], ids))
+    except Exception as e:
+        return handle_internal_error(e)
+
+@api.route('/replies/upvote-status', methods=['GET'])
+@token_required
+def get_replies_upvote_status(user_data):
+    """Get upvote status for several forum replies given as ?ids=1,2,3"""
+    ids = parse_id_list(request.args.get('ids', ''))
+    if ids is None:
+        return jsonify({'error': f'ids must list between 1 and {MAX_UPVOTE_STATUS_IDS} reply IDs'}), 400
+    try:
+        return jsonify(get_upvote_statuses('reply', user_data['user_id'], ids))
+    except Exception as e:
+        return handle_internal_error(e)
+
+def publish_upvote(channel, key, item_id, delta, upvote_count):
+    """Tell the viewers of a trick or topic that an item's upvote count changed"""
+    live_events.publish(channel, 'upvote', {key: item_id, 'delta': delta, 'upvote_count': upvote_count})
+
+@api.route('/tricks/<int:trick_id>/upvote', methods=['POST'])
 @token_required
 def upvote_trick(trick_id, user_data):
-    """Toggle upvote on a trick"""
+    """Toggle upvote on a trick; the database catches up on the next flush"""
     try:
-        user_id = user_data['user_id']
-        trick = Trick.query.get_or_404(trick_id)
-        # Check if user already upvoted
-        existing_upvote = TrickUpvote.query.filter_by(
-            user_id=user_id, 
-            trick_id=trick_id
-        ).first()
-        if existing_upvote:
-            # Remove upvote (toggle off)
-            db.session.delete(existing_upvote)
-            db.session.commit()
-            return jsonify({
-                'message': 'Upvote removed',
-                'upvoted': False,
-                'upvote_count': len(trick.upvotes)
-            })
-        else:
-            # Add upvote (toggle on)
-            upvote = TrickUpvote(user_id=user_id, trick_id=trick_id)
-            db.session.add(upvote)
-            db.session.commit()
-            return jsonify({
-                'message': 'Trick upvoted',
-                'upvoted': True,
-                'upvote_count': len(trick.upvotes)
-            })
+        result = upvote_buffer.toggle('trick', trick_id, user_data['user_id'])
+        if result is None:
+            return jsonify({'error': 'Trick not found'}), 404
+        upvoted, upvote_count = result
+        publish_upvote(f'trick:{trick_id}', 'trick_id', trick_id, 1 if upvoted else -1, upvote_count)
+        return jsonify({
+            'message': 'Trick upvoted' if upvoted else 'Upvote removed',
+            'upvoted': upvoted,
+            'upvote_count': upvote_count
+        })
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/tricks/<int:trick_id>/upvote-status', methods=['GET'])
+@api.route('/tricks/<int:trick_id>/upvote-status', methods=['GET'])
 @token_required
 def get_trick_upvote_status(trick_id, user_data):
-    """Get upvote status for a trick"""
+    """Get upvote status for a trick, including toggles not flushed yet"""
     try:
-        user_id = user_data['user_id']
-        trick = Trick.query.get_or_404(trick_id)
-        upvote = TrickUpvote.query.filter_by(
-            user_id=user_id, 
-            trick_id=trick_id
-        ).first()
+        status = upvote_buffer.status('trick', trick_id, user_data['user_id'])
+        if status is None:
+            return jsonify({'error': 'Trick not found'}), 404
+        upvoted, upvote_count = status
         return jsonify({
-            'upvoted': upvote is not None,
-            'upvote_count': len(trick.upvotes)
+            'upvoted': upvoted,
+            'upvote_count': upvote_count
         })
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/replies/<int:reply_id>/upvote', methods=['POST'])
+@api.route('/replies/<int:reply_id>/upvote', methods=['POST'])
 @token_required
 def upvote_reply(reply_id, user_data):
-    """Toggle upvote on a forum reply"""
+    """Toggle upvote on a forum reply; the database catches up on the next flush"""
     try:
-        user_id = user_data['user_id']
-        reply = ForumReply.query.get_or_404(reply_id)
-        # Check if user already upvoted
-        existing_upvote = ReplyUpvote.query.filter_by(
-            user_id=user_id, 
-            reply_id=reply_id
-        ).first()
-        if existing_upvote:
-            # Remove upvote (toggle off)
-            db.session.delete(existing_upvote)
-            db.session.commit()
-            return jsonify({
-                'message': 'Upvote removed',
-                'upvoted': False,
-                'upvote_count': len(reply.upvotes)
-            })
-        else:
-            # Add upvote (toggle on)
-            upvote = ReplyUpvote(user_id=user_id, reply_id=reply_id)
-            db.session.add(upvote)
-            db.session.commit()
-            return jsonify({
-                'message': 'Reply upvoted',
-                'upvoted': True,
-                'upvote_count': len(reply.upvotes)
-            })
+        result = upvote_buffer.toggle('reply', reply_id, user_data['user_id'])
+        if result is None:
+            return jsonify({'error': 'Reply not found'}), 404
+        upvoted, upvote_count = result
+        topic_id = db.session.query(ForumReply.topic_id).filter(ForumReply.id == reply_id).scalar()
+        publish_upvote(f'topic:{topic_id}', 'reply_id', reply_id, 1 if upvoted else -1, upvote_count)
+        return jsonify({
+            'message': 'Reply upvoted' if upvoted else 'Upvote removed',
+            'upvoted': upvoted,
+            'upvote_count': upvote_count
+        })
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/replies/<int:reply_id>/upvote-status', methods=['GET'])
+@api.route('/replies/<int:reply_id>/upvote-status', methods=['GET'])
 @token_required
 def get_reply_upvote_status(reply_id, user_data):
-    """Get upvote status for a forum reply"""
+    """Get upvote status for a forum reply, including toggles not flushed yet"""
     try:
-        user_id = user_data['user_id']
-        reply = ForumReply.query.get_or_404(reply_id)
-        upvote = ReplyUpvote.query.filter_by(
-            user_id=user_id, 
-            reply_id=reply_id
-        ).first()
+        status = upvote_buffer.status('reply', reply_id, user_data['user_id'])
+        if status is None:
+            return jsonify({'error': 'Reply not found'}), 404
+        upvoted, upvote_count = status
         return jsonify({
-            'upvoted': upvote is not None,
-            'upvote_count': len(reply.upvotes)
+            'upvoted': upvoted,
+            'upvote_count': upvote_count
         })
     except Exception as e:
         return handle_internal_error(e)
@@ -911,89 +1125,13 @@ def get_reply_upvote_status(reply_id, user_data):
 # Leaderboards & Statistics
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/leaderboards', methods=['GET'])
+@api.route('/leaderboards', methods=['GET'])
+@conditional('leaderboards', 'users')
+@response_cache.cached('leaderboards', 'users')
 def get_leaderboards():
     """Get comprehensive leaderboards for different activities"""
     try:
-        trick_contributors = []
-        topic_contributors = []
-        commenters = []
-        forum_participants = []
-        top_upvoted_tricks = []
-
-        users = User.query.all()
-
-        # Calculate user statistics
-        for user in users:
-            # Trick contributions
-            trick_count = db.session.query(func.count(Trick.id)).filter(Trick.user_id == user.id).scalar() or 0
-            if trick_count > 0:
-                trick_contributors.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'region': getattr(user, 'region', None),
-                    'count': trick_count
-                })
-
-            # Forum topic contributions
-            topic_count = db.session.query(func.count(ForumTopic.id)).filter(ForumTopic.user_id == user.id).scalar() or 0
-            if topic_count > 0:
-                topic_contributors.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'region': getattr(user, 'region', None),
-                    'count': topic_count
-                })
-
-            # Comment contributions
-            comment_count = db.session.query(func.count(Comment.id)).filter(Comment.user_id == user.id).scalar() or 0
-            if comment_count > 0:
-                commenters.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'region': getattr(user, 'region', None),
-                    'count': comment_count
-                })
-
-            # Forum participation (topics + replies)
-            reply_count = db.session.query(func.count(ForumReply.id)).filter(ForumReply.user_id == user.id).scalar() or 0
-            total_forum_activity = topic_count + reply_count
-            if total_forum_activity > 0:
-                forum_participants.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'region': getattr(user, 'region', None),
-                    'count': total_forum_activity
-                })
-
-        # Get top upvoted tricks
-        tricks = db.session.query(
-            Trick.id,
-            Trick.title,
-            func.count(TrickUpvote.id).label('upvote_count')
-        ).join(TrickUpvote, Trick.id == TrickUpvote.trick_id, isouter=True).group_by(Trick.id).order_by(func.count(TrickUpvote.id).desc()).limit(10).all()
-
-        for trick in tricks:
-            top_upvoted_tricks.append({
-                'id': trick.id,
-                'title': trick.title,
-                'upvote_count': trick.upvote_count
-            })
-
-        # Sort leaderboards by count (descending)
-        trick_contributors.sort(key=lambda x: x['count'], reverse=True)
-        topic_contributors.sort(key=lambda x: x['count'], reverse=True)
-        commenters.sort(key=lambda x: x['count'], reverse=True)
-        forum_participants.sort(key=lambda x: x['count'], reverse=True)
-
-        return jsonify({
-            'trick_contributors': trick_contributors[:10],
-            'topic_contributors': topic_contributors[:10],
-            'commenters': commenters[:10],
-            'forum_participants': forum_participants[:10],
-            'top_upvoted_tricks': top_upvoted_tricks
-        })
-
+        return jsonify(leaderboards.read_leaderboards())
     except Exception as e:
         print(f"Leaderboards error: {str(e)}")
         return handle_internal_error(e)
@@ -1002,7 +1140,7 @@ def get_leaderboards():
 # Admin Management Routes
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
-@app.route('/admin/dashboard', methods=['GET'])
+@api.route('/admin/dashboard', methods=['GET'])
 @admin_required
 def admin_dashboard():
     """Get admin dashboard statistics and recent activity"""
@@ -1016,7 +1154,7 @@ def admin_dashboard():
         
         # Recent activity
         recent_tricks = Trick.query.order_by(Trick.created.desc()).limit(5).all()
-        recent_topics = ForumTopic.query.order_by(ForumTopic.created.desc()).limit(5).all()
+        recent_topics = forum_topic_serializer.select().order_by(ForumTopic.created.desc()).limit(5).all()
         recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
         
         return jsonify({
@@ -1029,7 +1167,7 @@ def admin_dashboard():
             },
             'recent_activity': {
                 'tricks': [trick.to_dict() for trick in recent_tricks],
-                'topics': [topic.to_dict() for topic in recent_topics],
+                'topics': [forum_topic_serializer(topic) for topic in recent_topics],
                 'users': [user.to_dict() for user in recent_users]
             }
         }), 200
@@ -1037,17 +1175,15 @@ def admin_dashboard():
     except Exception as e:
         return handle_internal_error(e)
 
-@app.route('/admin/tricks/<int:trick_id>', methods=['DELETE'])
+@api.route('/admin/tricks/<int:trick_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_trick(trick_id):
     """Admin delete any trick"""
     try:
         trick = Trick.query.get_or_404(trick_id)
         
-        # Clean up related data
-        Comment.query.filter_by(trick_id=trick_id).delete()
-        TrickUpvote.query.filter_by(trick_id=trick_id).delete()
-        
+        # Comments and upvotes go with it through ON DELETE CASCADE
+        leaderboards.remove_trick(trick)
         db.session.delete(trick)
         db.session.commit()
         
@@ -1057,12 +1193,13 @@ def admin_delete_trick(trick_id):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/admin/comments/<int:comment_id>', methods=['DELETE'])
+@api.route('/admin/comments/<int:comment_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_comment(comment_id):
     """Admin delete any comment"""
     try:
         comment = Comment.query.get_or_404(comment_id)
+        leaderboards.remove_comment(comment)
         db.session.delete(comment)
         db.session.commit()
         
@@ -1072,19 +1209,15 @@ def admin_delete_comment(comment_id):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/admin/forum/topics/<int:topic_id>', methods=['DELETE'])
+@api.route('/admin/forum/topics/<int:topic_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_forum_topic(topic_id):
     """Admin delete any forum topic and its replies"""
     try:
         topic = ForumTopic.query.get_or_404(topic_id)
         
-        # Clean up related data
-        reply_ids = [reply.id for reply in topic.replies]
-        for reply_id in reply_ids:
-            ReplyUpvote.query.filter_by(reply_id=reply_id).delete()
-        
-        ForumReply.query.filter_by(topic_id=topic_id).delete()
+        # Replies and their upvotes go with it through ON DELETE CASCADE
+        leaderboards.remove_forum_topic(topic)
         db.session.delete(topic)
         db.session.commit()
         
@@ -1094,16 +1227,16 @@ def admin_delete_forum_topic(topic_id):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/admin/forum/replies/<int:reply_id>', methods=['DELETE'])
+@api.route('/admin/forum/replies/<int:reply_id>', methods=['DELETE'])
 @admin_required
 def admin_delete_forum_reply(reply_id):
     """Admin delete any forum reply"""
     try:
         reply = ForumReply.query.get_or_404(reply_id)
         
-        # Clean up related upvotes
-        ReplyUpvote.query.filter_by(reply_id=reply_id).delete()
-        
+        # Upvotes go with it through ON DELETE CASCADE
+        leaderboards.remove_forum_reply(reply)
+        increment_counter(ForumTopic, reply.topic_id, 'reply_count', -1)
         db.session.delete(reply)
         db.session.commit()
         
@@ -1113,7 +1246,51 @@ def admin_delete_forum_reply(reply_id):
         db.session.rollback()
         return handle_internal_error(e)
 
-@app.route('/admin/users/<int:user_id>/toggle-admin', methods=['POST'])
+@api.route('/admin/moderation/delete', methods=['POST'])
+@admin_required
+def admin_bulk_delete():
+    """
+    Delete many tricks, comments, topics and replies at once, given by id
+    ({"tricks": [1, 2], "replies": [7]}) and/or as everything a user posted
+    ({"user_id": 3, "since": "2024-05-01T00:00:00"}). Items are deleted in
+    chunked transactions and the results are streamed as NDJSON, one line
+    per chunk, so a long cleanup shows progress and a failed chunk doesn't
+    undo the others.
+    """
+    data = request.json or {}
+    try:
+        ids_by_type = {}
+        for name in moderation.CONTENT_TYPES_BY_NAME:
+            ids = data.get(name, [])
+            if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                raise ValueError(f'{name} must be a list of ids')
+            ids_by_type[name] = ids
+        user_id = data.get('user_id')
+        if user_id is not None and (not isinstance(user_id, int) or isinstance(user_id, bool)):
+            raise ValueError('user_id must be an id')
+        since = datetime.datetime.fromisoformat(data['since']) if data.get('since') else None
+        if since is not None and user_id is None:
+            raise ValueError('since requires user_id')
+        if since is not None and since.tzinfo is not None:
+            # Timestamps are stored as naive UTC
+            since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        items = moderation.select_items(ids_by_type, user_id, since, limit=moderation.MAX_ITEMS + 1)
+    except Exception as e:
+        return handle_internal_error(e)
+    if not items:
+        return jsonify({'error': 'Nothing to delete'}), 400
+    if len(items) > moderation.MAX_ITEMS:
+        return jsonify({'error': f'At most {moderation.MAX_ITEMS} items can be deleted at once'}), 400
+    return current_app.response_class(
+        stream_with_context(moderation.bulk_delete(items)),
+        mimetype='application/x-ndjson'
+    )
+
+@api.route('/admin/users/<int:user_id>/toggle-admin', methods=['POST'])
 @admin_required
 def toggle_admin_status(user_id):
     """Toggle admin status for a user"""
@@ -1121,16 +1298,24 @@ def toggle_admin_status(user_id):
         user = User.query.get_or_404(user_id)
         user.is_admin = not user.is_admin
         db.session.commit()
+        # Tokens issued before the change carry the old role
+        role_versions.revoke(user.id)
         
         return jsonify({
             'message': f'Admin status {"granted" if user.is_admin else "revoked"} for user {user.username}',
             'is_admin': user.is_admin
         }), 200
-        
+
     except Exception as e:
         db.session.rollback()
         return handle_internal_error(e)
 
+@api.route('/admin/cache/stats', methods=['GET'])
+@admin_required
+def cache_stats():
+    """Response cache hit and miss counters of the worker serving this request"""
+    return jsonify(response_cache.stats()), 200
+
 # ═══════════════════════════════════════════════════════════════════════════════════════
 # System Health & Utilities
 # ═══════════════════════════════════════════════════════════════════════════════════════
@@ -1139,15 +1324,32 @@ def handle_internal_error(e, message="An internal server error occurred."):
     logging.exception(e)
     return jsonify({'error': message}), 500
 
-@app.route('/health', methods=['GET'])
+def event_stream_response(channel):
+    """
+    Stream a live events channel. The stream runs outside the request context,
+    so the database session is released as soon as the response starts.
+    """
+    response = current_app.response_class(live_events.stream(channel), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def hasher_busy_response():
+    response = jsonify({'error': 'Too many login attempts in progress, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api.route('/health', methods=['GET'])
 def health_check():
-    """Application health check endpoint"""
+    """Application health check endpoint, with the connection counts of each database pool"""
     try:
         from sqlalchemy import text
         db.session.execute(text('SELECT 1'))
         return jsonify({
             'status': 'healthy',
-            'database': 'connected'
+            'database': 'connected',
+            'pools': {bind or 'primary': pool_stats(engine) for bind, engine in db.engines.items()}
         }), 200
     except Exception as e:
         logging.exception(e)
@@ -1156,11 +1358,65 @@ def health_check():
             'database': 'Database connection error.'
         }), 500
 
-@app.cli.command("init-db")
+@api.cli.command("init-db")
 def init_db():
-    """Initialize the database tables"""
-    db.create_all()
-    print('✓ Database initialized!')
+    """Create the database or bring it up to date by applying pending migrations"""
+    for name in migrations.upgrade():
+        print(f'✓ Applied migration: {name}')
+    print('✓ Database schema is up to date!')
+
+@api.cli.command("rebuild-leaderboards")
+def rebuild_leaderboards():
+    """Rebuild the leaderboard snapshot from scratch to repair drift"""
+    leaderboards.rebuild_snapshot()
+    connect_shared_state()
+    bump_versions(['leaderboards'])
+    print('✓ Leaderboards rebuilt!')
+
+@api.cli.command("backfill-geohashes")
+def backfill_geohashes():
+    """Compute the geohash of skateparks written without one, e.g. by raw SQL imports"""
+    migrations.backfill_geohashes(db.session.connection())
+    db.session.commit()
+    connect_shared_state()
+    bump_versions(['skateparks'])
+    print('✓ Geohashes backfilled!')
+
+@api.cli.command("invalidate-caches")
+def invalidate_caches():
+    """Expire every cached response and ETag after writing to the database outside the app"""
+    connect_shared_state()
+    bump_versions([ALL_TAG])
+    print('✓ Caches invalidated!')
+
+@api.cli.command("send-emails")
+@click.option('--once', is_flag=True, help='Drain the outbox once and exit instead of polling.')
+def send_emails(once):
+    """Run the email outbox worker, sending queued emails over a reused SMTP connection"""
+    outbox.run_worker(mail, current_app.config['MAIL_DEFAULT_SENDER'],
+                      poll_interval=float(os.environ.get('EMAIL_POLL_INTERVAL', outbox.POLL_INTERVAL_SECONDS)),
+                      once=once)
+
+@api.cli.command("backfill-counters")
+def backfill_counter_columns():
+    """Recompute denormalized upvote and reply counters"""
+    backfill_counters()
+    connect_shared_state()
+    bump_versions([ALL_TAG])
+    print('✓ Counters backfilled!')
+
+def serialize_trick(trick, pending_upvotes=False):
+    """
+    Serialize a trick with its video URL converted to an embed URL. With
+    pending_upvotes, the count includes the toggles still in the upvote
+    buffer; listings merge them for the whole page at once instead.
+    """
+    trick_data = trick.to_dict()
+    trick_data['video_url'] = get_youtube_embed_url(trick.video_url)
+    if pending_upvotes:
+        pending = upvote_buffer.pending_counts('trick', [trick.id])
+        trick_data['upvote_count'] = pending.get(trick.id, trick_data['upvote_count'])
+    return trick_data
 
 def get_youtube_embed_url(url):
     """
@@ -1175,9 +1431,55 @@ def get_youtube_embed_url(url):
         return f'https://www.youtube.com/embed/{match.group(1)}'
     return url
 
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Application Factory
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def create_app(config=None):
+    """
+    Build the app from the environment, with config overriding any setting.
+    Extensions are only bound here; the database, Redis, SMTP and Google are
+    contacted when first needed.
+    """
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+
+    missing = [env for key, env in REQUIRED_SETTINGS.items() if not app.config.get(key)]
+    if missing:
+        raise RuntimeError(f"Missing required environment variables: {', '.join(missing)}")
+
+    CORS(app,
+        origins=app.config['CORS_ORIGINS'],
+        supports_credentials=True,
+        methods=['GET', 'POST', 'PUT', 'DELETE'],
+        allow_headers=['Content-Type', 'Authorization']
+    )
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    if app.config['DATABASE_REPLICA_URL'] and 'SQLALCHEMY_BINDS' not in app.config:
+        replica_url = app.config['DATABASE_REPLICA_URL']
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA: {'url': replica_url, **engine_options(replica_url, app.config)}}
+    db.init_app(app)
+    mail.init_app(app)
+    limiter.init_app(app)
+
+    response_cache.ttl = app.config['RESPONSE_CACHE_TTL']
+    password_hasher.rounds = app.config['BCRYPT_LOG_ROUNDS']
+    password_hasher.workers = app.config['PASSWORD_HASH_WORKERS']
+    password_hasher.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+    google_verifier.client_id = app.config['GOOGLE_CLIENT_ID']
+    sticky_reads.seconds = app.config['REPLICA_STICKY_SECONDS']
+    live_events.heartbeat = app.config['LIVE_EVENTS_HEARTBEAT_SECONDS']
+    upvote_buffer.interval = app.config['UPVOTE_FLUSH_SECONDS']
+
+    app.before_request(connect_shared_state)
+    app.register_blueprint(api)
+    return app
+
 # ═══════════════════════════════════════════════════════════════════════════════════════
 # Application Entry Point
 # ═══════════════════════════════════════════════════════════════════════════════════════
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,80 @@
+from flask import Flask
+from sqlalchemy import event
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import db, User, Trick, Comment, ForumTopic, ForumReply, TrickUpvote
+from leaderboards import compute_leaderboards
+
+USER_COUNTS = [500, 5000, 50000]
+
+app = Flask(__name__)
+app.config.update(
+    SQLALCHEMY_DATABASE_URI=os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:'),
+    SQLALCHEMY_TRACK_MODIFICATIONS=False
+)
+db.init_app(app)
+
+def seed(user_count):
+    """Insert users and a proportional amount of content with bulk inserts"""
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(42)
+
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'email': f'user{i}@example.com', 'username': f'user{i}', 'password': 'x'}
+        for i in range(1, user_count + 1)
+    ])
+    trick_count = user_count // 5
+    db.session.execute(Trick.__table__.insert(), [
+        {'id': i, 'title': f'Trick {i}', 'description': 'Bench', 'video_url': 'https://youtu.be/x',
+         'difficulty': 'beginner', 'user_id': rng.randint(1, user_count)}
+        for i in range(1, trick_count + 1)
+    ])
+    topic_count = user_count // 10
+    db.session.execute(ForumTopic.__table__.insert(), [
+        {'id': i, 'title': f'Topic {i}', 'description': 'Bench', 'user_id': rng.randint(1, user_count)}
+        for i in range(1, topic_count + 1)
+    ])
+    db.session.execute(Comment.__table__.insert(), [
+        {'content': 'Bench', 'trick_id': rng.randint(1, trick_count), 'user_id': rng.randint(1, user_count)}
+        for _ in range(user_count)
+    ])
+    db.session.execute(ForumReply.__table__.insert(), [
+        {'content': 'Bench', 'topic_id': rng.randint(1, topic_count), 'user_id': rng.randint(1, user_count)}
+        for _ in range(user_count)
+    ])
+    db.session.execute(TrickUpvote.__table__.insert(), [
+        {'user_id': user_id, 'trick_id': rng.randint(1, trick_count)}
+        for user_id in range(1, user_count + 1)
+    ])
+    db.session.commit()
+
+def run_benchmark():
+    with app.app_context():
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: statements.append(args[2]))
+
+        query_counts = set()
+        for user_count in USER_COUNTS:
+            seed(user_count)
+            statements.clear()
+            start = time.perf_counter()
+            compute_leaderboards()
+            elapsed = time.perf_counter() - start
+            query_counts.add(len(statements))
+            print(f"{user_count:>6} users: {len(statements)} queries in {elapsed * 1000:.1f} ms")
+
+        if len(query_counts) != 1:
+            print("✗ Query count grows with the number of users")
+            return False
+        print("✓ Query count is constant")
+        return True
+
+if __name__ == '__main__':
+    sys.exit(0 if run_benchmark() else 1)
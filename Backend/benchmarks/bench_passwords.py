@@ -0,0 +1,33 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from passwords import PasswordHasher
+
+ROUNDS = [10, 11, 12, 13, 14]
+# Spend about this long on each cost so the faster ones get a stable average
+SECONDS_PER_COST = 3
+
+def logins_per_second(rounds):
+    """Password checks per second on one core, i.e. the login rate one worker sustains"""
+    hasher = PasswordHasher(rounds=rounds)
+    hashed = hasher.hash('correct horse battery staple')
+    checks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < SECONDS_PER_COST or checks < 3:
+        hasher.check(hashed, 'correct horse battery staple')
+        checks += 1
+    return checks / (time.perf_counter() - start)
+
+def run_benchmark():
+    print(f"{'cost':>4}  {'ms/login':>9}  {'logins/s/core':>13}")
+    for rounds in ROUNDS:
+        rate = logins_per_second(rounds)
+        print(f"{rounds:>4}  {1000 / rate:>9.1f}  {rate:>13.1f}")
+    print(f"A pool of PASSWORD_HASH_WORKERS processes sustains up to that many times these rates "
+          f"({os.cpu_count()} cores here)")
+
+if __name__ == '__main__':
+    run_benchmark()
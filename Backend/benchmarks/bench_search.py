@@ -0,0 +1,75 @@
+from flask import Flask
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import db, User, Trick
+import search
+
+ROW_COUNT = 100000
+QUERIES = ['kickflip', 'boneless', 'varial heel', 'impossible', 'nosegrind ledge', 'w1234']
+REPEAT = 5
+
+TRICK_WORDS = ['kickflip', 'heelflip', 'ollie', 'nollie', 'fakie', 'switch', 'grind', 'slide', 'ledge',
+               'rail', 'manual', 'board', 'spin', 'shove', 'pop', 'catch', 'land', 'stair', 'gap', 'tre',
+               'varial', 'impossible', 'boneless', 'nosegrind', 'tail', 'heel', 'toe', 'bowl', 'ramp', 'bank']
+# Natural text follows a Zipf distribution: a few very common words and a long tail
+WORDS = TRICK_WORDS + [f'w{i}' for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+app = Flask(__name__)
+app.config.update(
+    SQLALCHEMY_DATABASE_URI=os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:'),
+    SQLALCHEMY_TRACK_MODIFICATIONS=False
+)
+db.init_app(app)
+
+def seed():
+    """Insert ROW_COUNT tricks with random titles and descriptions"""
+    db.drop_all()
+    db.create_all()
+    rng = random.Random(42)
+    db.session.execute(User.__table__.insert(), [
+        {'id': 1, 'email': 'bench@example.com', 'username': 'bench', 'password': 'x'}
+    ])
+    db.session.execute(Trick.__table__.insert(), [
+        {'title': ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=2)).title(),
+         'description': ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=20)),
+         'video_url': 'https://youtu.be/x', 'difficulty': 'beginner', 'user_id': 1}
+        for _ in range(ROW_COUNT)
+    ])
+    db.session.commit()
+
+def ilike_search(text):
+    """The previous implementation: every unranked title match, newest first"""
+    return Trick.query.filter(Trick.title.ilike(f"%{text}%")).order_by(Trick.created.desc()).all()
+
+def time_queries(run):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for text in QUERIES:
+            run(text)
+    return (time.perf_counter() - start) * 1000 / (REPEAT * len(QUERIES))
+
+def run_benchmark():
+    with app.app_context():
+        seed()
+        engine = 'tsvector + GIN' if search.uses_full_text_search() else 'inverted index'
+        print(f"Searching {ROW_COUNT} tricks on {db.engine.dialect.name}")
+
+        start = time.perf_counter()
+        search.search_tricks(QUERIES[0], limit=20)
+        print(f"First search (includes index warm-up): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        ilike_ms = time_queries(ilike_search)
+        search_ms = time_queries(lambda text: search.search_tricks(text, limit=20))
+        print(f"ILIKE scan (all): {ilike_ms:8.2f} ms/query")
+        print(f"{engine + ' (top 20):':<17} {search_ms:8.2f} ms/query")
+        print(f"✓ Speedup: {ilike_ms / search_ms:.1f}x")
+
+if __name__ == '__main__':
+    run_benchmark()
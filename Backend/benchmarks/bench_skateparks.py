@@ -0,0 +1,77 @@
+from flask import Flask
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import db, Skatepark
+from geo import encode_geohash, haversine_km
+import skateparks
+
+PARK_COUNT = 1000000
+REPEAT = 20
+# (label, half-height of the viewport in degrees)
+VIEWPORTS = [('street', 0.02), ('city', 0.2), ('region', 2.0)]
+
+app = Flask(__name__)
+app.config.update(
+    SQLALCHEMY_DATABASE_URI=os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:'),
+    SQLALCHEMY_TRACK_MODIFICATIONS=False
+)
+db.init_app(app)
+
+def seed(rng):
+    """Scatter parks around population centres, as a national import would"""
+    db.drop_all()
+    db.create_all()
+    centres = [(rng.uniform(-45, 60), rng.uniform(-125, 150)) for _ in range(500)]
+    batch = []
+    for i in range(PARK_COUNT):
+        lat_centre, lng_centre = rng.choice(centres)
+        lat = max(-90.0, min(90.0, rng.gauss(lat_centre, 1.5)))
+        lng = max(-180.0, min(180.0, rng.gauss(lng_centre, 1.5)))
+        batch.append({'name': f'Park {i}', 'address': 'Bench', 'description': 'Bench',
+                      'lat': lat, 'lng': lng, 'geohash': encode_geohash(lat, lng)})
+        if len(batch) == 50000:
+            db.session.execute(Skatepark.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Skatepark.__table__.insert(), batch)
+    db.session.commit()
+    return centres
+
+def scan_box(south, west, north, east):
+    """The unindexed alternative: filter lat/lng directly, sort by distance in Python"""
+    parks = Skatepark.query.filter(
+        Skatepark.lat.between(south, north), Skatepark.lng.between(west, east)
+    ).all()
+    lat, lng = (south + north) / 2, (west + east) / 2
+    return sorted(parks, key=lambda park: haversine_km(lat, lng, park.lat, park.lng))[:skateparks.DEFAULT_RESULTS]
+
+def time_boxes(run, boxes):
+    start = time.perf_counter()
+    for box in boxes:
+        run(*box)
+    return (time.perf_counter() - start) * 1000 / len(boxes)
+
+def run_benchmark():
+    rng = random.Random(42)
+    with app.app_context():
+        start = time.perf_counter()
+        centres = seed(rng)
+        print(f"Seeded {PARK_COUNT} parks in {time.perf_counter() - start:.1f} s")
+
+        for label, half in VIEWPORTS:
+            boxes = []
+            for _ in range(REPEAT):
+                lat, lng = rng.choice(centres)
+                boxes.append((lat - half, lng - half * 1.5, lat + half, lng + half * 1.5))
+            scan_ms = time_boxes(scan_box, boxes)
+            indexed_ms = time_boxes(skateparks.parks_in_box, boxes)
+            print(f"{label:>7} viewport: lat/lng scan {scan_ms:8.2f} ms, geohash index {indexed_ms:8.2f} ms "
+                  f"({scan_ms / indexed_ms:.1f}x)")
+
+if __name__ == '__main__':
+    run_benchmark()
@@ -0,0 +1,83 @@
+from flask import Flask
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import db, User, Trick
+import suggest
+
+ROW_COUNT = 100000
+QUERY_COUNT = 2000
+P99_BUDGET_MS = 10
+
+SYLLABLES = ['kick', 'heel', 'flip', 'ol', 'lie', 'no', 'var', 'ial', 'tre', 'shove', 'it', 'grind',
+             'slide', 'man', 'ual', 'fa', 'kie', 'bone', 'less', 'im', 'poss', 'ible', 'nose', 'tail']
+
+app = Flask(__name__)
+app.config.update(
+    SQLALCHEMY_DATABASE_URI=os.environ.get('BENCH_DATABASE_URL', 'sqlite:///:memory:'),
+    SQLALCHEMY_TRACK_MODIFICATIONS=False
+)
+db.init_app(app)
+
+def random_word(rng):
+    return ''.join(rng.choices(SYLLABLES, k=rng.randint(1, 3)))
+
+def misspell(rng, word):
+    """Drop, swap or duplicate one character, like a hurried typist"""
+    if len(word) < 5:
+        return word
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(['drop', 'swap', 'double'])
+    if edit == 'drop':
+        return word[:position] + word[position + 1:]
+    if edit == 'swap':
+        return word[:position - 1] + word[position] + word[position - 1] + word[position + 1:]
+    return word[:position] + word[position] + word[position:]
+
+def seed(rng):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(User.__table__.insert(), [
+        {'id': 1, 'email': 'bench@example.com', 'username': 'bench', 'password': 'x'}
+    ])
+    titles = [' '.join(random_word(rng) for _ in range(rng.randint(1, 3))).title() for _ in range(ROW_COUNT)]
+    db.session.execute(Trick.__table__.insert(), [
+        {'title': title, 'description': 'Bench', 'video_url': 'https://youtu.be/x',
+         'difficulty': 'beginner', 'user_id': 1}
+        for title in titles
+    ])
+    db.session.commit()
+    return titles
+
+def run_benchmark():
+    rng = random.Random(42)
+    with app.app_context():
+        titles = seed(rng)
+        start = time.perf_counter()
+        suggest.suggest_tricks('warm up')
+        print(f"Warm-up over {ROW_COUNT} titles: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        latencies = []
+        for _ in range(QUERY_COUNT):
+            word = rng.choice(rng.choice(titles).lower().split())
+            query = misspell(rng, word)[:rng.randint(2, 10)]
+            start = time.perf_counter()
+            suggest.suggest_tricks(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print(f"p50: {p50:.2f} ms, p99: {p99:.2f} ms, max: {latencies[-1]:.2f} ms")
+        if p99 > P99_BUDGET_MS:
+            print(f"✗ p99 exceeds the {P99_BUDGET_MS} ms budget")
+            return False
+        print(f"✓ p99 within the {P99_BUDGET_MS} ms budget")
+        return True
+
+if __name__ == '__main__':
+    sys.exit(0 if run_benchmark() else 1)
@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlencode
+from flask import request, current_app
+from sqlalchemy import event
+from models import db
+
+DEFAULT_TTL_SECONDS = 60
+MAX_CACHED_RESPONSES = 1024
+MAX_CACHED_BYTES = 64 * 1024 * 1024
+
+# Implicit tag of every entry, bumped to clear the whole cache
+ALL_TAG = '*'
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Backends
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Per-process LRU cache with a TTL, bounded by entry count and total body size"""
+
+    name = 'memory'
+    # Tag versions counted here are only seen by this process
+    shared = False
+
+    def __init__(self, max_entries=MAX_CACHED_RESPONSES, max_bytes=MAX_CACHED_BYTES):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        mimetype, body = value
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._bytes += len(body)
+            while len(self._entries) > self._max_entries or self._bytes > self._max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1][1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def versions(self, tags):
+        """(version, updated_at) of each tag, (0, None) for tags never bumped"""
+        with self._lock:
+            return [self._versions.get(tag, (0, None)) for tag in tags]
+
+    def bump(self, tags):
+        now = datetime.utcnow()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = (self._versions.get(tag, (0, None))[0] + 1, now)
+
+class RedisBackend:
+    """Cache shared by every worker, stored in Redis under a key prefix"""
+
+    name = 'redis'
+    shared = True
+
+    def __init__(self, client, prefix='response-cache:'):
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        stored = self._client.get(self._prefix + key)
+        if stored is None:
+            return None
+        mimetype, _, body = stored.partition(b'\n')
+        return mimetype.decode('ascii'), body
+
+    def set(self, key, value, ttl):
+        mimetype, body = value
+        self._client.setex(self._prefix + key, ttl, mimetype.encode('ascii') + b'\n' + body)
+
+    def clear(self):
+        # Entries expire on their own once no key refers to them
+        self.bump([ALL_TAG])
+
+    def versions(self, tags):
+        values = self._client.mget([self._prefix + 'tag:' + tag for tag in tags] +
+                                   [self._prefix + 'tag-updated:' + tag for tag in tags])
+        return [
+            (int(version or 0), datetime.utcfromtimestamp(float(updated)) if updated else None)
+            for version, updated in zip(values[:len(tags)], values[len(tags):])
+        ]
+
+    def bump(self, tags):
+        # MULTI/EXEC, so a reader never sees a new version with the previous timestamp
+        pipeline = self._client.pipeline()
+        now = time.time()
+        for tag in tags:
+            pipeline.incr(self._prefix + 'tag:' + tag)
+            pipeline.set(self._prefix + 'tag-updated:' + tag, now)
+        pipeline.execute()
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Response Cache
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class ResponseCache:
+    """
+    Caches successful JSON responses of public GET routes. Each entry is keyed
+    by the request URL and the current version of its tags, so invalidating a
+    tag only bumps its version and stale entries are never read again.
+    Requests carrying a token bypass the cache since their bodies are per-user.
+    """
+
+    def __init__(self, backend, ttl=DEFAULT_TTL_SECONDS):
+        self.backend = backend
+        self.ttl = ttl
+        # Where the versions keying entries come from; versions.py points it at the
+        # versions behind the ETags, so an entry and the ETag sent with it always agree
+        self.read_versions = self.backend_versions
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    def backend_versions(self, tags):
+        """{tag: (version, updated_at)} as counted by the backend, for the tags bumped at least once"""
+        return {tag: stamp for tag, stamp in zip(tags, self.backend.versions(tags)) if stamp[0]}
+
+    def _count(self, endpoint, outcome):
+        with self._lock:
+            self._stats[(endpoint, outcome)] += 1
+
+    def stats(self):
+        """Hit, miss and bypass counts of this process, in total and per endpoint"""
+        with self._lock:
+            counts = dict(self._stats)
+        endpoints = {}
+        totals = Counter()
+        for (endpoint, outcome), count in counts.items():
+            endpoints.setdefault(endpoint, {'hits': 0, 'misses': 0, 'bypassed': 0})[outcome] = count
+            totals[outcome] += count
+        lookups = totals['hits'] + totals['misses']
+        return {
+            'backend': self.backend.name,
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'bypassed': totals['bypassed'],
+            'hit_ratio': round(totals['hits'] / lookups, 4) if lookups else None,
+            'endpoints': endpoints
+        }
+
+    def _key(self, tags):
+        versions = self.read_versions(tags)
+        query = urlencode(sorted(request.args.items(multi=True)))
+        stamps = []
+        for tag in tags:
+            version, updated_at = versions.get(tag, (0, None))
+            # The timestamp tells apart counters restarted from zero, e.g. a recreated table
+            stamps.append(f"{tag}={version}@{updated_at.isoformat() if updated_at else ''}")
+        raw = f"{request.path}?{query}|" + ','.join(stamps)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def cached(self, *tags, ttl=None):
+        """
+        Decorate a GET view. Tags may reference view arguments, e.g.
+        'trick:{trick_id}', so a write can invalidate a single detail page.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                endpoint = request.endpoint
+                if 'Authorization' in request.headers:
+                    self._count(endpoint, 'bypassed')
+                    return view(*args, **kwargs)
+
+                entry_tags = [ALL_TAG] + [tag.format(**kwargs) for tag in tags]
+                try:
+                    key = self._key(entry_tags)
+                    cached = self.backend.get(key)
+                except Exception as e:
+                    logging.warning(f"Response cache unavailable: {e}")
+                    self._count(endpoint, 'bypassed')
+                    return view(*args, **kwargs)
+
+                if cached is not None:
+                    self._count(endpoint, 'hits')
+                    mimetype, body = cached
+                    response = current_app.response_class(body, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count(endpoint, 'misses')
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and response.is_json and not response.is_streamed:
+                    try:
+                        self.backend.set(key, (response.mimetype, response.get_data()), ttl or self.ttl)
+                    except Exception as e:
+                        logging.warning(f"Response cache unavailable: {e}")
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        try:
+            self.backend.bump(tags)
+        except Exception as e:
+            logging.warning(f"Response cache invalidation failed for {tags}: {e}")
+
+    def clear(self):
+        try:
+            self.backend.clear()
+        except Exception as e:
+            logging.warning(f"Response cache could not be cleared: {e}")
+
+response_cache = ResponseCache(MemoryBackend())
+
+# Recreated tables must not serve responses cached from the previous ones
+event.listen(db.metadata, 'after_create', lambda *args, **kwargs: response_cache.clear())
+event.listen(db.metadata, 'after_drop', lambda *args, **kwargs: response_cache.clear())
@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import and_, event, func
+from models import db, Skatepark
+from geo import GEOHASH_PRECISION, count_cells, covering_cells, prefix_range
+from cache import ALL_TAG
+from versions import read_versions
+
+MAX_ZOOM = 22
+# Upper bound on the cached tiles answering one viewport
+MAX_TILES = 64
+TILE_TTL_SECONDS = 300
+MAX_CACHED_TILES = 10000
+
+def _lng_bits(precision):
+    return math.ceil(5 * precision / 2)
+
+def tile_precision(zoom):
+    """Finest geohash precision whose cells are at least as wide as a 256px map tile"""
+    precision = 1
+    while precision < GEOHASH_PRECISION and _lng_bits(precision + 1) <= zoom:
+        precision += 1
+    return precision
+
+def cluster_precision(zoom):
+    """Coarsest geohash precision whose cells are at most a quarter of a map tile wide"""
+    precision = 1
+    while precision < GEOHASH_PRECISION and _lng_bits(precision) < zoom + 2:
+        precision += 1
+    return precision
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Tile Cache
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class TileCache:
+    """
+    Cluster tiles keyed by (skateparks version, zoom, tile geohash), evicted
+    least recently used and expired after a TTL. The version is shared by all
+    workers, so a park added through any of them retires every worker's tiles.
+    """
+
+    def __init__(self, ttl=TILE_TTL_SECONDS, max_entries=MAX_CACHED_TILES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, clusters = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return clusters
+
+    def set(self, key, clusters):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, clusters)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+tile_cache = TileCache()
+
+event.listen(Skatepark.__table__, 'after_create', lambda *args, **kwargs: tile_cache.reset())
+event.listen(Skatepark.__table__, 'after_drop', lambda *args, **kwargs: tile_cache.reset())
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Cluster Queries
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _compute_tile(tile, precision):
+    """Bucket the parks of one tile by geohash prefix with a single grouped range scan"""
+    low, high = prefix_range(tile)
+    cell = func.substr(Skatepark.geohash, 1, precision).label('cell')
+    in_tile = and_(Skatepark.geohash >= low, Skatepark.geohash < high) if high else Skatepark.geohash >= low
+    rows = db.session.query(
+        cell,
+        func.count(Skatepark.id).label('count'),
+        func.avg(Skatepark.lat).label('lat'),
+        func.avg(Skatepark.lng).label('lng'),
+        func.min(Skatepark.id).label('park_id')
+    ).filter(in_tile).group_by(cell).order_by(cell).all()
+
+    clusters = []
+    for row in rows:
+        cluster = {
+            'geohash': row.cell,
+            'count': row.count,
+            'lat': float(row.lat),
+            'lng': float(row.lng)
+        }
+        if row.count == 1:
+            cluster['id'] = row.park_id
+        clusters.append(cluster)
+    return clusters
+
+def clusters_in_box(south, west, north, east, zoom):
+    """
+    Return the park clusters covering a viewport at a zoom level. Tiles are
+    whole geohash cells, so clusters slightly outside the viewport are included.
+    Raises ValueError when the viewport needs more than MAX_TILES tiles.
+    """
+    precision = tile_precision(zoom)
+    if count_cells(south, west, north, east, precision) > MAX_TILES:
+        raise ValueError('Viewport too large for this zoom level')
+
+    version = tuple(sorted(read_versions([ALL_TAG, 'skateparks']).items()))
+    clusters = []
+    for tile in sorted(covering_cells(south, west, north, east, precision)):
+        tile_clusters = tile_cache.get((version, zoom, tile))
+        if tile_clusters is None:
+            tile_clusters = _compute_tile(tile, cluster_precision(zoom))
+            tile_cache.set((version, zoom, tile), tile_clusters)
+        clusters.extend(tile_clusters)
+    return clusters
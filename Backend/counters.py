@@ -0,0 +1,43 @@
+from sqlalchemy import func, select
+from models import db, Trick, ForumTopic, ForumReply, TrickUpvote, ReplyUpvote
+
+# Denormalized counter columns and the child rows they count
+COUNTERS = [
+    (Trick, 'upvote_count', TrickUpvote, 'trick_id'),
+    (ForumReply, 'upvote_count', ReplyUpvote, 'reply_id'),
+    (ForumTopic, 'reply_count', ForumReply, 'topic_id')
+]
+
+def increment_counter(model, row_id, column, delta=1):
+    """
+    Atomically add delta to a counter column with a single UPDATE.
+    Loaded instances are refreshed on the next access after commit.
+    """
+    counter = getattr(model, column)
+    model.query.filter_by(id=row_id).update(
+        {counter: counter + delta}, synchronize_session=False
+    )
+
+def recount_counters(model, ids):
+    """Recompute the counter columns of some rows of model from the child tables"""
+    for counter_model, column, child, foreign_key in COUNTERS:
+        if counter_model is not model:
+            continue
+        total = select(func.count(child.id)).where(
+            getattr(child, foreign_key) == model.id
+        ).scalar_subquery()
+        db.session.execute(model.__table__.update().where(model.id.in_(ids)).values({column: total}))
+
+def backfill_counters(connection=None):
+    """
+    Recompute every counter column from the child tables. Commits, unless
+    run on a migration's connection, which commits with the migration.
+    """
+    execute = connection.execute if connection is not None else db.session.execute
+    for model, column, child, foreign_key in COUNTERS:
+        total = select(func.count(child.id)).where(
+            getattr(child, foreign_key) == model.id
+        ).scalar_subquery()
+        execute(model.__table__.update().values({column: total}))
+    if connection is None:
+        db.session.commit()
@@ -0,0 +1,197 @@
+import sqlite3
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+# Bind key of the read replica engine
+REPLICA = 'replica'
+
+# Server-side statement timeouts by request class, in milliseconds
+DEFAULT_STATEMENT_TIMEOUTS = {'read': 5000, 'write': 10000, 'admin': 30000}
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# How long a user reads from the primary after writing, to cover replication lag
+DEFAULT_STICKY_SECONDS = 5
+MAX_STICKY_USERS = 10000
+
+def normalize_database_url(url):
+    """Handle legacy postgres:// URLs"""
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+def engine_options(url, config):
+    """
+    Pool options for the engine of url from the DB_POOL_* settings. SQLite
+    keeps Flask-SQLAlchemy's own pool, which takes no size options.
+    """
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if not url.startswith('sqlite'):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_timeout=config['DB_POOL_TIMEOUT']
+        )
+    return options
+
+def pool_stats(engine):
+    """Connection counts of an engine's pool, for the pool types that track them"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    for name, method in (('size', 'size'), ('checked_in', 'checkedin'),
+                         ('checked_out', 'checkedout'), ('overflow', 'overflow')):
+        if callable(getattr(pool, method, None)):
+            stats[name] = getattr(pool, method)()
+    return stats
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores foreign keys, and so ON DELETE CASCADE, unless asked per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Request Classes
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def request_class():
+    """'admin', 'read' or 'write' for the current request; None outside requests (CLI, workers)"""
+    if not has_request_context():
+        return None
+    if request.path.startswith('/admin'):
+        return 'admin'
+    return 'read' if request.method in READ_METHODS else 'write'
+
+def reads_from_replica():
+    """Whether the current request may read from the replica: a read by a user with no recent write"""
+    return (has_request_context() and request.method in READ_METHODS
+            and not g.get('read_from_primary', False))
+
+def read_from_primary():
+    """Send the rest of a GET request's queries to the primary, for the few GET routes that write"""
+    g.read_from_primary = True
+
+class RoutingSession(Session):
+    """
+    Session that sends the queries of read requests (GET, including admin
+    pages) to the replica bind when one is configured, and everything else,
+    including any flush and the reads following it in the same transaction,
+    to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not self.info.get('wrote') and reads_from_replica():
+            replica = self._db.engines.get(REPLICA)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def primary_bind(self):
+        """The primary engine, whatever the request"""
+        return super().get_bind()
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_writing_transaction(session, flush_context):
+    session.info['wrote'] = True
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _unpin_transaction(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
+
+@event.listens_for(RoutingSession, 'after_begin')
+def apply_statement_timeout(session, transaction, connection):
+    """Bound every query of a request by its class's timeout, for this transaction only"""
+    kind = request_class()
+    if kind is None or connection.dialect.name != 'postgresql':
+        return
+    timeout = current_app.config['STATEMENT_TIMEOUTS'].get(kind)
+    if timeout:
+        connection.execute(text("SELECT set_config('statement_timeout', :timeout, true)"),
+                           {'timeout': str(timeout)})
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Read-Your-Writes
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Per-process deadlines of sticky users, bounded by dropping the earliest"""
+
+    name = 'memory'
+
+    def __init__(self, max_users=MAX_STICKY_USERS):
+        self._max_users = max_users
+        self._lock = threading.Lock()
+        self._deadlines = {}
+
+    def set(self, user_id, seconds):
+        with self._lock:
+            now = time.monotonic()
+            self._deadlines.pop(user_id, None)
+            self._deadlines[user_id] = now + seconds
+            # Insertion order is deadline order, so expired users are at the front
+            while self._deadlines:
+                oldest = next(iter(self._deadlines))
+                if self._deadlines[oldest] > now and len(self._deadlines) <= self._max_users:
+                    break
+                del self._deadlines[oldest]
+
+    def active(self, user_id):
+        with self._lock:
+            return self._deadlines.get(user_id, 0) > time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._deadlines.clear()
+
+class RedisBackend:
+    """Sticky users shared by every worker, as keys expiring with the sticky window"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='replica-sticky:'):
+        self.client = client
+        self.prefix = prefix
+
+    def set(self, user_id, seconds):
+        self.client.set(f'{self.prefix}{user_id}', 1, px=int(seconds * 1000))
+
+    def active(self, user_id):
+        return bool(self.client.exists(f'{self.prefix}{user_id}'))
+
+    def reset(self):
+        pass
+
+class StickyReads:
+    """
+    Users who committed a write recently keep reading from the primary for a
+    few seconds, so they see their own post even if the replica lags.
+    """
+
+    def __init__(self, backend, seconds=DEFAULT_STICKY_SECONDS):
+        self.backend = backend
+        self.seconds = seconds
+
+    def mark(self, user_id):
+        self.backend.set(user_id, self.seconds)
+
+    def active(self, user_id):
+        return user_id is not None and self.backend.active(user_id)
+
+    def reset(self):
+        self.backend.reset()
+
+sticky_reads = StickyReads(MemoryBackend())
+
+@event.listens_for(RoutingSession, 'after_commit')
+def mark_sticky_writer(session):
+    """Make the author of a committed write read their own writes, when a replica is in use"""
+    if (has_request_context() and request.method not in READ_METHODS
+            and g.get('user_id') is not None and REPLICA in session._db.engines):
+        sticky_reads.mark(g.user_id)
@@ -1,6 +1,7 @@
 from flask import Flask 
 from flask_sqlalchemy import SQLAlchemy
 from models import db
+import migrations
 import os
 import sys
 import time
@@ -46,7 +47,7 @@ def clear_database():
                 db.drop_all()
                 print("Tables dropped successfully")
                 
-                db.create_all()
+                migrations.upgrade(db.engine)
                 print("Tables recreated successfully")
                 
                 db.session.commit()
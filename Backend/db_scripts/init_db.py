@@ -1,5 +1,6 @@
 from flask import Flask
-from models import db, Trick, User, Comment, ForumTopic, ForumReply, Skatepark, TrickUpvote, ReplyUpvote
+from models import db
+import migrations
 import time
 from sqlalchemy import text
 from dotenv import load_dotenv
@@ -40,15 +41,9 @@ def init_db_connection():
                 db.session.execute(text('SELECT 1'))
                 print("Database connection successful")
                 
-                # Drop all existing tables
-                db.drop_all()
-                print("Existing tables dropped")
-                
-                # Create all tables from models
-                db.create_all()
-                print("New tables created")
-                
-                db.session.commit()
+                # Apply pending migrations; existing data is kept
+                for name in migrations.upgrade(db.engine):
+                    print(f"Applied migration: {name}")
                 print("Database initialized successfully!")
                 return True
                 
@@ -0,0 +1,164 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+# Comment lines sent to idle streams so proxies don't close them
+DEFAULT_HEARTBEAT_SECONDS = 15
+# Events buffered per subscriber; a client falling further behind is told to refetch
+MAX_PENDING_EVENTS = 100
+# Reconnection delay suggested to EventSource clients, in milliseconds
+RETRY_MS = 3000
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Transports
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Delivers events to the subscribers of this process only; suits a single worker"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._deliver = lambda channel, message: None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+class RedisBackend:
+    """
+    Fans events out to every worker through Redis pub/sub. Each process holds
+    one pattern subscription, read by a background thread that hands events
+    to the local subscribers, so the number of Redis connections doesn't grow
+    with the number of open streams.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='live:'):
+        self.client = client
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def start(self, deliver):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, args=(deliver,), daemon=True)
+                self._listener.start()
+
+    def _listen(self, deliver):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f'{self.prefix}*')
+                for message in pubsub.listen():
+                    channel = message['channel']
+                    channel = channel.decode() if isinstance(channel, bytes) else channel
+                    deliver(channel[len(self.prefix):], json.loads(message['data']))
+            except Exception as e:
+                logging.warning(f"Live events subscription lost, reconnecting: {e}")
+                time.sleep(1)
+
+    def publish(self, channel, message):
+        self.client.publish(f'{self.prefix}{channel}', json.dumps(message))
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Live Events
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class Subscription:
+    def __init__(self, channel, max_pending):
+        self.channel = channel
+        self.queue = queue.Queue(max_pending)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class LiveEvents:
+    """
+    Pushes new comments, replies and upvote counts to the clients watching a
+    trick or topic. Events are published after the write commits; a stream
+    carries no history, so clients load the current list first and then apply
+    the events, and refetch when told to reset.
+    """
+
+    def __init__(self, backend, heartbeat=DEFAULT_HEARTBEAT_SECONDS, max_pending=MAX_PENDING_EVENTS):
+        self.backend = backend
+        self.heartbeat = heartbeat
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event, data):
+        """Publish an event; a failure is logged, as the write it reports has already succeeded"""
+        try:
+            self.backend.publish(channel, {'event': event, 'data': data})
+        except Exception as e:
+            logging.warning(f"Could not publish live event to {channel}: {e}")
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+    def subscribe(self, channel):
+        self.backend.start(self._deliver)
+        subscription = Subscription(channel, self.max_pending)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def stream(self, channel):
+        """
+        Server-sent events of a channel, for a streamed response. The
+        subscription lives as long as the response: closing the connection
+        closes the generator, which unsubscribes.
+        """
+        subscription = self.subscribe(channel)
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                message = subscription.get(self.heartbeat)
+                if subscription.overflowed:
+                    yield format_event('reset', {})
+                    return
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(message['event'], message['data'])
+        finally:
+            self.unsubscribe(subscription)
+
+live_events = LiveEvents(MemoryBackend())
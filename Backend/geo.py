@@ -0,0 +1,137 @@
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Upper bound on the geohash cells used to cover one bounding box
+MAX_COVER_CELLS = 32
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash; nearby points share long prefixes"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lng_bits
+    return 180 / 2 ** lat_bits, 360 / 2 ** lng_bits
+
+def _next_prefix(prefix):
+    """Smallest geohash sorting after every hash starting with prefix, or None"""
+    chars = list(prefix)
+    while chars:
+        index = GEOHASH_ALPHABET.index(chars[-1])
+        if index + 1 < len(GEOHASH_ALPHABET):
+            chars[-1] = GEOHASH_ALPHABET[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+def split_antimeridian(south, west, north, east):
+    """Split a box crossing the 180th meridian into boxes that do not"""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+def count_cells(south, west, north, east, precision):
+    """Upper bound on the number of geohash cells of a precision touching the box"""
+    height, width = cell_size(precision)
+    return sum(
+        (math.floor(box_north / height) - math.floor(box_south / height) + 1) *
+        (math.floor(box_east / width) - math.floor(box_west / width) + 1)
+        for box_south, box_west, box_north, box_east in split_antimeridian(south, west, north, east)
+    )
+
+def covering_cells(south, west, north, east, precision):
+    """Geohashes of the given precision whose cells together cover the box"""
+    height, width = cell_size(precision)
+    prefixes = set()
+    for box_south, box_west, box_north, box_east in split_antimeridian(south, west, north, east):
+        lat = box_south
+        while True:
+            lng = box_west
+            while True:
+                prefixes.add(encode_geohash(min(lat, 90.0), min(lng, 180.0), precision))
+                if lng >= box_east:
+                    break
+                lng = min(lng + width, box_east)
+            if lat >= box_north:
+                break
+            lat = min(lat + height, box_north)
+    return prefixes
+
+def prefix_range(prefix):
+    """(low, high) bounds of the geohashes starting with prefix; high may be None"""
+    return prefix, _next_prefix(prefix)
+
+def covering_ranges(south, west, north, east):
+    """
+    Return (low, high) geohash ranges whose union covers the box, using the
+    finest precision that needs at most MAX_COVER_CELLS cells. Each range is
+    one B-tree index scan; high is None for a range open at the top.
+    """
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        if count_cells(south, west, north, east, candidate) <= MAX_COVER_CELLS:
+            precision = candidate
+            break
+    prefixes = covering_cells(south, west, north, east, precision)
+
+    # Adjacent cells have consecutive hashes, so merge them into fewer ranges
+    ranges = []
+    for prefix in sorted(prefixes):
+        high = _next_prefix(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((prefix, high))
+    return ranges
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two coordinates in kilometres"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(lat, lng, radius_km):
+    """(south, west, north, east) box containing the circle around a point"""
+    delta_lat = radius_km / KM_PER_DEGREE
+    south = max(-90.0, lat - delta_lat)
+    north = min(90.0, lat + delta_lat)
+    cos_lat = math.cos(math.radians(lat))
+    if south == -90.0 or north == 90.0 or cos_lat < 1e-6:
+        return south, -180.0, north, 180.0
+    delta_lng = radius_km / (KM_PER_DEGREE * cos_lat)
+    if delta_lng >= 180:
+        return south, -180.0, north, 180.0
+    west = lng - delta_lng
+    east = lng + delta_lng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return south, west, north, east
@@ -0,0 +1,112 @@
+import logging
+import re
+import threading
+import time
+import jwt
+
+GOOGLE_JWKS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+# Used when the certs response carries no max-age
+DEFAULT_MAX_AGE_SECONDS = 3600
+# Minimum delay between refreshes forced by an unknown key id
+MIN_REFRESH_INTERVAL_SECONDS = 60
+CLOCK_SKEW_SECONDS = 10
+
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Key Sources
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class HTTPKeySource:
+    """Fetches Google's JWKS over a pooled keep-alive HTTP session, opened on first use"""
+
+    def __init__(self, url=GOOGLE_JWKS_URL, session=None, timeout=5):
+        self.url = url
+        self.session = session
+        self.timeout = timeout
+
+    def fetch(self):
+        """Return (jwks, max_age) with max_age taken from Cache-Control"""
+        if self.session is None:
+            import requests
+            self.session = requests.Session()
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        match = MAX_AGE_PATTERN.search(response.headers.get('Cache-Control', ''))
+        return response.json(), int(match.group(1)) if match else DEFAULT_MAX_AGE_SECONDS
+
+class StaticKeySource:
+    """Serves a fixed key set without any network access, e.g. in tests"""
+
+    def __init__(self, jwks, max_age=DEFAULT_MAX_AGE_SECONDS):
+        self.jwks = jwks
+        self.max_age = max_age
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return self.jwks, self.max_age
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Key Cache & Verifier
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class KeyCache:
+    """
+    Process-wide cache of signing keys by key id. Keys are refetched when the
+    source's max-age expires, or early when a token names an unknown key
+    (Google rotated its keys), at most once per MIN_REFRESH_INTERVAL_SECONDS.
+    If a refresh fails, the expired keys keep being used until the next attempt.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._expires = 0
+        self._fetched = None
+
+    def _refresh(self):
+        try:
+            jwks, max_age = self.source.fetch()
+        except Exception as e:
+            if not self._keys:
+                raise
+            logging.warning(f"Could not refresh Google signing keys, using cached ones: {e}")
+            self._fetched = time.monotonic()
+            self._expires = self._fetched + MIN_REFRESH_INTERVAL_SECONDS
+            return
+        self._keys = {key.key_id: key for key in jwt.PyJWKSet.from_dict(jwks).keys if key.key_id}
+        self._fetched = time.monotonic()
+        self._expires = self._fetched + max_age
+
+    def get(self, kid):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._expires or (kid not in self._keys and (
+                    self._fetched is None or now - self._fetched >= MIN_REFRESH_INTERVAL_SECONDS)):
+                self._refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise ValueError(f'Unknown signing key: {kid}')
+        return key
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens locally against cached signing keys"""
+
+    def __init__(self, client_id, keys):
+        self.client_id = client_id
+        self.keys = keys
+
+    def verify(self, token):
+        """Return the claims of a valid ID token for this client; raise ValueError otherwise"""
+        try:
+            key = self.keys.get(jwt.get_unverified_header(token).get('kid'))
+            return jwt.decode(
+                token, key.key, algorithms=[key.algorithm_name],
+                audience=self.client_id, issuer=GOOGLE_ISSUERS, leeway=CLOCK_SKEW_SECONDS
+            )
+        except jwt.PyJWTError as e:
+            raise ValueError(f'Invalid Google token: {e}') from e
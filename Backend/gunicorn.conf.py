@@ -0,0 +1,18 @@
+# Gunicorn reads this file from the working directory on start.
+#
+# Live event streams stay open for as long as a page is, so workers are
+# gevent-based: an idle stream is a parked greenlet rather than a busy
+# sync worker, and one process serves many of them.
+import os
+
+worker_class = 'gevent'
+worker_connections = 1000
+
+# bcrypt run inline holds the event loop, stalling every stream and request of
+# the worker for the length of a hash; hash in a process pool instead
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '2')
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole worker on queries unless it yields to gevent
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
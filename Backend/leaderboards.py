@@ -0,0 +1,266 @@
+from sqlalchemy import func, select, union_all, insert, literal
+from models import db, User, Trick, Comment, ForumTopic, ForumReply, TrickUpvote, LeaderboardCounter
+
+# Number of entries returned for each ranking
+LEADERBOARD_SIZE = 10
+
+# Snapshot boards, keyed by user id except for trick upvotes which are keyed by trick id
+TRICKS_BOARD = 'tricks'
+TOPICS_BOARD = 'topics'
+COMMENTS_BOARD = 'comments'
+FORUM_BOARD = 'forum'
+TRICK_UPVOTES_BOARD = 'trick_upvotes'
+
+USER_BOARDS = {
+    'trick_contributors': TRICKS_BOARD,
+    'topic_contributors': TOPICS_BOARD,
+    'commenters': COMMENTS_BOARD,
+    'forum_participants': FORUM_BOARD
+}
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Live Aggregates
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _count_by_user(model):
+    """Build a (user_id, total) aggregate over a table with a user_id column"""
+    return db.session.query(
+        model.user_id.label('user_id'),
+        func.count(model.id).label('total')
+    ).group_by(model.user_id)
+
+def _forum_activity_by_user():
+    """Build a (user_id, total) aggregate over forum topics and replies combined"""
+    activity = union_all(
+        select(ForumTopic.user_id.label('user_id')),
+        select(ForumReply.user_id.label('user_id'))
+    ).subquery()
+    return db.session.query(
+        activity.c.user_id.label('user_id'),
+        func.count().label('total')
+    ).group_by(activity.c.user_id)
+
+def _upvotes_by_trick():
+    """Build a (trick_id, total) aggregate including tricks without upvotes"""
+    return db.session.query(
+        Trick.id.label('trick_id'),
+        func.count(TrickUpvote.id).label('total')
+    ).join(TrickUpvote, Trick.id == TrickUpvote.trick_id, isouter=True).group_by(Trick.id)
+
+def _user_aggregates():
+    return {
+        TRICKS_BOARD: _count_by_user(Trick),
+        TOPICS_BOARD: _count_by_user(ForumTopic),
+        COMMENTS_BOARD: _count_by_user(Comment),
+        FORUM_BOARD: _forum_activity_by_user()
+    }
+
+def _top_users(counts, limit):
+    """Join an aggregate to users and let the database sort and truncate it"""
+    counts = counts.subquery()
+    rows = db.session.query(
+        User.id,
+        User.username,
+        User.region,
+        counts.c.total
+    ).join(counts, counts.c.user_id == User.id).order_by(
+        counts.c.total.desc(), User.id.asc()
+    ).limit(limit).all()
+
+    return [{
+        'user_id': row.id,
+        'username': row.username,
+        'region': row.region,
+        'count': row.total
+    } for row in rows]
+
+def top_upvoted_tricks(limit=LEADERBOARD_SIZE):
+    """Return the most upvoted tricks"""
+    counts = _upvotes_by_trick().subquery()
+    rows = db.session.query(
+        Trick.id,
+        Trick.title,
+        counts.c.total
+    ).join(counts, counts.c.trick_id == Trick.id).order_by(
+        counts.c.total.desc(), Trick.id.asc()
+    ).limit(limit).all()
+
+    return [{
+        'id': row.id,
+        'title': row.title,
+        'upvote_count': row.total
+    } for row in rows]
+
+def compute_leaderboards(limit=LEADERBOARD_SIZE):
+    """
+    Compute every leaderboard with one grouped query per ranking.
+    The number of queries is fixed regardless of how many users exist.
+    """
+    aggregates = _user_aggregates()
+    leaderboards = {
+        name: _top_users(aggregates[board], limit)
+        for name, board in USER_BOARDS.items()
+    }
+    leaderboards['top_upvoted_tricks'] = top_upvoted_tricks(limit)
+    return leaderboards
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Persisted Snapshot
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def read_leaderboards(limit=LEADERBOARD_SIZE):
+    """Read every leaderboard from the snapshot table with one indexed lookup per ranking"""
+    leaderboards = {}
+    for name, board in USER_BOARDS.items():
+        rows = db.session.query(
+            User.id,
+            User.username,
+            User.region,
+            LeaderboardCounter.total
+        ).join(User, User.id == LeaderboardCounter.subject_id).filter(
+            LeaderboardCounter.board == board,
+            LeaderboardCounter.total > 0
+        ).order_by(
+            LeaderboardCounter.total.desc(), LeaderboardCounter.subject_id.asc()
+        ).limit(limit).all()
+        leaderboards[name] = [{
+            'user_id': row.id,
+            'username': row.username,
+            'region': row.region,
+            'count': row.total
+        } for row in rows]
+
+    rows = db.session.query(
+        Trick.id,
+        Trick.title,
+        LeaderboardCounter.total
+    ).join(Trick, Trick.id == LeaderboardCounter.subject_id).filter(
+        LeaderboardCounter.board == TRICK_UPVOTES_BOARD
+    ).order_by(
+        LeaderboardCounter.total.desc(), LeaderboardCounter.subject_id.asc()
+    ).limit(limit).all()
+    leaderboards['top_upvoted_tricks'] = [{
+        'id': row.id,
+        'title': row.title,
+        'upvote_count': row.total
+    } for row in rows]
+    return leaderboards
+
+def _upsert_counter(board, subject_id, initial, updated_total):
+    """Insert a snapshot counter at initial, or set an existing one to updated_total"""
+    table = LeaderboardCounter.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        updated = db.session.execute(
+            table.update().where(
+                table.c.board == board, table.c.subject_id == subject_id
+            ).values(total=updated_total)
+        )
+        if updated.rowcount == 0:
+            db.session.execute(table.insert().values(board=board, subject_id=subject_id, total=initial))
+        return
+
+    statement = dialect_insert(table).values(board=board, subject_id=subject_id, total=initial)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.board, table.c.subject_id],
+        set_={'total': updated_total}
+    ))
+
+def bump_counter(board, subject_id, delta=1):
+    """Add delta to a snapshot counter inside the caller's transaction"""
+    _upsert_counter(board, subject_id, delta, LeaderboardCounter.__table__.c.total + delta)
+
+def set_counter(board, subject_id, total):
+    """Overwrite a snapshot counter inside the caller's transaction"""
+    _upsert_counter(board, subject_id, total, total)
+
+def _bump_grouped(board, model, *criteria):
+    """Decrement a user board once per author of the rows matching criteria"""
+    rows = db.session.query(model.user_id, func.count(model.id)).filter(*criteria).group_by(model.user_id).all()
+    for user_id, count in rows:
+        bump_counter(board, user_id, -count)
+
+def record_trick(trick):
+    if trick.id is None:
+        db.session.flush()
+    bump_counter(TRICKS_BOARD, trick.user_id)
+    bump_counter(TRICK_UPVOTES_BOARD, trick.id, 0)
+
+def record_comment(comment):
+    bump_counter(COMMENTS_BOARD, comment.user_id)
+
+def record_forum_topic(topic):
+    bump_counter(TOPICS_BOARD, topic.user_id)
+    bump_counter(FORUM_BOARD, topic.user_id)
+
+def record_forum_reply(reply):
+    bump_counter(FORUM_BOARD, reply.user_id)
+
+def sync_trick_upvotes(trick_ids):
+    """Copy the stored upvote counts of these tricks to the snapshot; safe to repeat"""
+    for row in db.session.query(Trick.id, Trick.upvote_count).filter(Trick.id.in_(trick_ids)):
+        set_counter(TRICK_UPVOTES_BOARD, row.id, row.upvote_count)
+
+def remove_trick(trick):
+    """Retract a trick and its comments; call before the rows are deleted"""
+    bump_counter(TRICKS_BOARD, trick.user_id, -1)
+    _bump_grouped(COMMENTS_BOARD, Comment, Comment.trick_id == trick.id)
+    LeaderboardCounter.query.filter_by(board=TRICK_UPVOTES_BOARD, subject_id=trick.id).delete()
+
+def remove_comment(comment):
+    bump_counter(COMMENTS_BOARD, comment.user_id, -1)
+
+def remove_forum_topic(topic):
+    """Retract a topic and its replies; call before the rows are deleted"""
+    bump_counter(TOPICS_BOARD, topic.user_id, -1)
+    bump_counter(FORUM_BOARD, topic.user_id, -1)
+    _bump_grouped(FORUM_BOARD, ForumReply, ForumReply.topic_id == topic.id)
+
+def remove_forum_reply(reply):
+    bump_counter(FORUM_BOARD, reply.user_id, -1)
+
+def remove_tricks(trick_ids):
+    """Retract many tricks and their comments at once, for bulk deletes"""
+    _bump_grouped(TRICKS_BOARD, Trick, Trick.id.in_(trick_ids))
+    _bump_grouped(COMMENTS_BOARD, Comment, Comment.trick_id.in_(trick_ids))
+    LeaderboardCounter.query.filter(
+        LeaderboardCounter.board == TRICK_UPVOTES_BOARD, LeaderboardCounter.subject_id.in_(trick_ids)
+    ).delete(synchronize_session=False)
+
+def remove_comments(comment_ids):
+    _bump_grouped(COMMENTS_BOARD, Comment, Comment.id.in_(comment_ids))
+
+def remove_forum_topics(topic_ids):
+    """Retract many topics and their replies at once, for bulk deletes"""
+    _bump_grouped(TOPICS_BOARD, ForumTopic, ForumTopic.id.in_(topic_ids))
+    _bump_grouped(FORUM_BOARD, ForumTopic, ForumTopic.id.in_(topic_ids))
+    _bump_grouped(FORUM_BOARD, ForumReply, ForumReply.topic_id.in_(topic_ids))
+
+def remove_forum_replies(reply_ids):
+    _bump_grouped(FORUM_BOARD, ForumReply, ForumReply.id.in_(reply_ids))
+
+def rebuild_snapshot(connection=None):
+    """
+    Recompute the whole snapshot from the source tables to repair any drift.
+    Commits, unless run on a migration's connection.
+    """
+    execute = connection.execute if connection is not None else db.session.execute
+    table = LeaderboardCounter.__table__
+    execute(table.delete())
+
+    columns = ['board', 'subject_id', 'total']
+    for board, aggregate in _user_aggregates().items():
+        counts = aggregate.subquery()
+        execute(insert(table).from_select(
+            columns, select(literal(board), counts.c.user_id, counts.c.total)
+        ))
+    counts = _upvotes_by_trick().subquery()
+    execute(insert(table).from_select(
+        columns, select(literal(TRICK_UPVOTES_BOARD), counts.c.trick_id, counts.c.total)
+    ))
+    if connection is None:
+        db.session.commit()
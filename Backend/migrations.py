@@ -0,0 +1,364 @@
+import datetime
+import re
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String,
+                        Table, Text, UniqueConstraint, bindparam, column, inspect, select, table, text)
+from sqlalchemy.schema import CreateColumn
+from models import db, SchemaMigration
+from geo import encode_geohash
+from counters import backfill_counters
+from leaderboards import rebuild_snapshot
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Frozen Schema
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# Tables as each migration creates them, copied rather than read from the models:
+# a migration must do the same thing on every database, whatever the models say later
+SCHEMA = MetaData()
+
+BASELINE_TABLES = [
+    Table('users', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('email', String(120), unique=True, nullable=False),
+          Column('username', String(50), unique=True, nullable=False),
+          Column('region', String(100)),
+          Column('password', String(255), nullable=False),
+          Column('is_verified', Boolean),
+          Column('verification_token', String(255)),
+          Column('created_at', DateTime),
+          Column('google_id', String(100), unique=True),
+          Column('is_admin', Boolean)),
+    Table('tricks', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('title', String(100), nullable=False),
+          Column('description', Text, nullable=False),
+          Column('video_url', String(255), nullable=False),
+          Column('difficulty', String(50), nullable=False),
+          Column('created', DateTime),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False)),
+    Table('forum_topics', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('title', String(200), nullable=False),
+          Column('description', Text),
+          Column('created', DateTime),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('is_pinned', Boolean)),
+    Table('skateparks', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False),
+          Column('address', String(200), nullable=False),
+          Column('description', Text, nullable=False),
+          Column('lat', Float, nullable=False),
+          Column('lng', Float, nullable=False),
+          Column('created_at', DateTime),
+          Column('created_by', Integer, ForeignKey('users.id'))),
+    Table('comments', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('content', Text, nullable=False),
+          Column('created', DateTime),
+          Column('trick_id', Integer, ForeignKey('tricks.id'), nullable=False),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False)),
+    Table('forum_replies', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('content', Text, nullable=False),
+          Column('created', DateTime),
+          Column('topic_id', Integer, ForeignKey('forum_topics.id'), nullable=False),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False)),
+    Table('trick_upvotes', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('trick_id', Integer, ForeignKey('tricks.id'), nullable=False),
+          Column('created_at', DateTime),
+          UniqueConstraint('user_id', 'trick_id', name='unique_trick_upvote')),
+    Table('reply_upvotes', SCHEMA,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('reply_id', Integer, ForeignKey('forum_replies.id'), nullable=False),
+          Column('created_at', DateTime),
+          UniqueConstraint('user_id', 'reply_id', name='unique_reply_upvote')),
+]
+
+LEADERBOARD_COUNTERS = Table(
+    'leaderboard_counters', SCHEMA,
+    Column('board', String(20), primary_key=True),
+    Column('subject_id', Integer, primary_key=True),
+    Column('total', Integer, nullable=False))
+
+RESOURCE_VERSIONS = Table(
+    'resource_versions', SCHEMA,
+    Column('tag', String(64), primary_key=True),
+    Column('version', BigInteger, nullable=False),
+    Column('updated_at', DateTime, nullable=False))
+
+EMAIL_OUTBOX = Table(
+    'email_outbox', SCHEMA,
+    Column('id', Integer, primary_key=True),
+    Column('recipient', String(120), nullable=False),
+    Column('subject', String(200), nullable=False),
+    Column('body', Text, nullable=False),
+    Column('status', String(10), nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('next_attempt_at', DateTime, nullable=False),
+    Column('last_error', Text),
+    Column('created_at', DateTime),
+    Column('sent_at', DateTime))
+
+def create_tables(*tables):
+    """Migration creating tables that don't exist yet"""
+    def migrate(connection):
+        for table in tables:
+            table.create(connection, checkfirst=True)
+    return migrate
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Cascading Deletes
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# (table, column, referred table, referred column) of the foreign keys made ON DELETE CASCADE by migration 2
+CASCADING_FOREIGN_KEYS = [
+    ('comments', 'trick_id', 'tricks', 'id'),
+    ('forum_replies', 'topic_id', 'forum_topics', 'id'),
+    ('trick_upvotes', 'trick_id', 'tricks', 'id'),
+    ('reply_upvotes', 'reply_id', 'forum_replies', 'id'),
+]
+
+def add_cascading_deletes(connection):
+    """
+    Recreate the foreign keys of CASCADING_FOREIGN_KEYS as ON DELETE CASCADE.
+    On Postgres the new constraint is added NOT VALID and validated afterwards,
+    so the tables are only locked for the swap and not for the scan of existing
+    rows. Keys already cascading are left alone, so running it again is a
+    no-op. Returns the constraints it changed.
+    """
+    if connection.dialect.name == 'sqlite':
+        return _add_sqlite_cascading_deletes(connection)
+    inspector = inspect(connection)
+    changed = []
+    for table, column, referred_table, referred_column in CASCADING_FOREIGN_KEYS:
+        for fk in inspector.get_foreign_keys(table):
+            if fk['constrained_columns'] != [column] or fk['referred_table'] != referred_table:
+                continue
+            if (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+                continue
+            name = fk['name']
+            connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {name}'))
+            connection.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                f'REFERENCES {referred_table} ({referred_column}) ON DELETE CASCADE NOT VALID'
+            ))
+            connection.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}'))
+            changed.append(name)
+    return changed
+
+def _add_sqlite_cascading_deletes(connection):
+    """
+    SQLite can't alter constraints. Changing the ON DELETE action of a key
+    doesn't touch the stored rows, so its table definition is edited in place,
+    as https://sqlite.org/lang_altertable.html#otheralter allows for such changes.
+    """
+    changed = []
+    for table, column, referred_table, referred_column in CASCADING_FOREIGN_KEYS:
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).scalar()
+        key = re.compile(rf'(FOREIGN KEY\s*\(\s*"?{column}"?\s*\)\s*REFERENCES\s+"?{referred_table}"?'
+                         rf'\s*\(\s*"?{referred_column}"?\s*\))(?!\s*ON DELETE)', re.IGNORECASE)
+        if not key.search(sql):
+            continue
+        schema_version = connection.exec_driver_sql('PRAGMA schema_version').scalar()
+        connection.exec_driver_sql('PRAGMA writable_schema=ON')
+        connection.exec_driver_sql("UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = ?",
+                                   (key.sub(r'\1 ON DELETE CASCADE', sql), table))
+        # Makes every connection, this one included, read the edited definition
+        connection.exec_driver_sql(f'PRAGMA schema_version={schema_version + 1}')
+        connection.exec_driver_sql('PRAGMA writable_schema=OFF')
+        changed.append(f'{table}.{column}')
+    return changed
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Columns
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def add_missing_columns(connection, table, columns):
+    """ALTER TABLE ... ADD COLUMN for each of columns the table lacks; returns their names"""
+    existing = {c['name'] for c in inspect(connection).get_columns(table)}
+    added = []
+    for column in columns:
+        if column.name in existing:
+            continue
+        ddl = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {ddl}'))
+        added.append(f'{table}.{column.name}')
+    return added
+
+def add_counter_columns(connection):
+    """Add the upvote and reply counters to tables created before them, and fill them"""
+    for table, name in (('tricks', 'upvote_count'), ('forum_replies', 'upvote_count'), ('forum_topics', 'reply_count')):
+        add_missing_columns(connection, table, [Column(name, Integer, nullable=False, server_default='0')])
+    backfill_counters(connection)
+
+def backfill_geohashes(connection):
+    """Compute the geohash of skateparks stored without one; returns how many were filled"""
+    parks = table('skateparks', column('id'), column('lat'), column('lng'), column('geohash'))
+    rows = connection.execute(select(parks.c.id, parks.c.lat, parks.c.lng).where(parks.c.geohash.is_(None))).all()
+    if rows:
+        connection.execute(
+            parks.update().where(parks.c.id == bindparam('park_id')).values(geohash=bindparam('hash')),
+            [{'park_id': row.id, 'hash': encode_geohash(float(row.lat), float(row.lng))} for row in rows]
+        )
+    return len(rows)
+
+def add_skatepark_geohashes(connection):
+    """Add the geohash column to a skateparks table created before it, and fill it"""
+    add_missing_columns(connection, 'skateparks', [Column('geohash', String(12))])
+    backfill_geohashes(connection)
+
+def build_leaderboard_snapshot(connection):
+    """Create the snapshot table; the write routes only keep an existing snapshot up to date"""
+    LEADERBOARD_COUNTERS.create(connection, checkfirst=True)
+    rebuild_snapshot(connection)
+
+def enable_trigram_matching(connection):
+    """The title suggestion index needs pg_trgm"""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Indexes
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class CreateIndexes:
+    """
+    Migration creating indexes, each given as (name, table, definition, dialect),
+    dialect being None for indexes every database gets. On Postgres they are
+    built CONCURRENTLY, which keeps the table writable during the build but
+    can't run in a transaction: upgrade() runs these migrations in autocommit,
+    outside the transactions of the other migrations.
+    """
+
+    def __init__(self, *indexes):
+        self.indexes = indexes
+
+    def __call__(self, connection):
+        postgres = connection.dialect.name == 'postgresql'
+        # An interrupted concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+        invalid = set(connection.execute(text(
+            'SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid'
+        )).scalars()) if postgres else set()
+        for name, table, definition, dialect in self.indexes:
+            if dialect is not None and dialect != connection.dialect.name:
+                continue
+            if name in invalid:
+                connection.execute(text(f'DROP INDEX CONCURRENTLY {name}'))
+            concurrently = 'CONCURRENTLY ' if postgres else ''
+            connection.execute(text(f'CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} {definition}'))
+
+def _search_document(*columns):
+    """The expression models.search_document builds, as it stood when the search indexes were added"""
+    return "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({column}, '')" for column in columns) + ")"
+
+LISTING_INDEXES = CreateIndexes(
+    ('ix_users_created_at', 'users', '(created_at)', None),
+    ('ix_tricks_created_id', 'tricks', '(created, id)', None),
+    ('ix_tricks_user_created_id', 'tricks', '(user_id, created, id)', None),
+    ('ix_comments_trick_created_id', 'comments', '(trick_id, created, id)', None),
+    ('ix_comments_user_created_id', 'comments', '(user_id, created, id)', None),
+    ('ix_forum_topics_pinned_created_id', 'forum_topics', '(is_pinned, created, id)', None),
+    ('ix_forum_topics_created_id', 'forum_topics', '(created, id)', None),
+    ('ix_forum_topics_user_created_id', 'forum_topics', '(user_id, created, id)', None),
+    ('ix_forum_replies_topic_created_id', 'forum_replies', '(topic_id, created, id)', None),
+    ('ix_forum_replies_user_created_id', 'forum_replies', '(user_id, created, id)', None),
+    ('ix_skateparks_created_by', 'skateparks', '(created_by)', None),
+    ('ix_trick_upvotes_trick_id', 'trick_upvotes', '(trick_id)', None),
+    ('ix_reply_upvotes_reply_id', 'reply_upvotes', '(reply_id)', None),
+)
+
+SEARCH_INDEXES = CreateIndexes(
+    ('ix_tricks_search', 'tricks', f"USING gin ({_search_document('title', 'description')})", 'postgresql'),
+    ('ix_forum_topics_search', 'forum_topics', f"USING gin ({_search_document('title', 'description')})", 'postgresql'),
+    ('ix_forum_replies_search', 'forum_replies', f"USING gin ({_search_document('content')})", 'postgresql'),
+    ('ix_tricks_title_trgm', 'tricks', 'USING gin (title gin_trgm_ops)', 'postgresql'),
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Migration Pipeline
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# Applied in order and recorded in schema_migrations; each runs in its own transaction,
+# except index builds (see CreateIndexes). Never edit an applied migration; append a new one.
+MIGRATIONS = [
+    (1, 'Create tables', create_tables(*BASELINE_TABLES)),
+    (2, 'Cascade deletes from tricks, topics and replies', add_cascading_deletes),
+    (3, 'Store upvote and reply counts on their parent rows', add_counter_columns),
+    (4, 'Store skatepark geohashes', add_skatepark_geohashes),
+    (5, 'Build the leaderboard snapshot', build_leaderboard_snapshot),
+    (6, 'Enable trigram matching', enable_trigram_matching),
+    (7, 'Create the resource version and email outbox tables', create_tables(RESOURCE_VERSIONS, EMAIL_OUTBOX)),
+    (8, 'Index foreign keys and listing orders', LISTING_INDEXES),
+    (9, 'Index skatepark geohashes', CreateIndexes(('ix_skateparks_geohash', 'skateparks', '(geohash)', None))),
+    (10, 'Index search documents and trick titles', SEARCH_INDEXES),
+    (11, 'Index leaderboard ranks and the email outbox', CreateIndexes(
+        ('ix_leaderboard_counters_rank', 'leaderboard_counters', '(board, total DESC, subject_id)', None),
+        ('ix_email_outbox_status_next_attempt', 'email_outbox', '(status, next_attempt_at, id)', None),
+    )),
+]
+
+# Arbitrary key of the Postgres advisory lock that serializes concurrent upgrades
+MIGRATION_LOCK_ID = 7202301
+
+def _lock(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+
+def _record(connection, version, name):
+    connection.execute(SchemaMigration.__table__.insert().values(
+        version=version, name=name, applied_at=datetime.datetime.utcnow()
+    ))
+
+def applied_versions(connection):
+    return set(connection.execute(select(SchemaMigration.version)).scalars())
+
+def _apply(engine, version, name, migrate):
+    """Run one migration in its own transaction; returns whether it was pending"""
+    with engine.begin() as connection:
+        _lock(connection)
+        if version in applied_versions(connection):
+            return False
+        migrate(connection)
+        _record(connection, version, name)
+    return True
+
+def _apply_outside_transaction(engine, version, name, migrate):
+    """
+    Run one migration in autocommit. On Postgres a session-level advisory lock,
+    held until it is recorded, keeps concurrent upgrades out.
+    """
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        postgres = connection.dialect.name == 'postgresql'
+        if postgres:
+            connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+        try:
+            if version in applied_versions(connection):
+                return False
+            migrate(connection)
+            _record(connection, version, name)
+        finally:
+            if postgres:
+                connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+    return True
+
+def upgrade(engine=None):
+    """
+    Apply the migrations this database has not seen yet and return their
+    names. Safe to run on every deploy: applied versions are skipped, and on
+    Postgres an advisory lock keeps two deploys from racing.
+    """
+    engine = engine or db.engine
+    with engine.begin() as connection:
+        SchemaMigration.__table__.create(connection, checkfirst=True)
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        apply = _apply_outside_transaction if isinstance(migrate, CreateIndexes) else _apply
+        if apply(engine, version, name, migrate):
+            applied.append(name)
+    return applied
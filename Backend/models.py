@@ -1,7 +1,26 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, literal_column, event, DDL
+# Registers the Postgres full-text search functions used by search_document
+import sqlalchemy.dialects.postgresql
 from datetime import datetime
+from geo import encode_geohash
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Postgres text search configuration; 'simple' does not stem, which suits mixed French/English content
+SEARCH_CONFIG = 'simple'
+
+def search_document(*columns):
+    """Build the tsvector expression used both by the GIN search indexes and by search queries."""
+    document = func.coalesce(columns[0], literal_column("''"))
+    for column in columns[1:]:
+        document = document + literal_column("' '") + func.coalesce(column, literal_column("''"))
+    return func.to_tsvector(literal_column(f"'{SEARCH_CONFIG}'"), document)
+
+def search_index(name, *columns):
+    """GIN index over search_document, only created on Postgres."""
+    return db.Index(name, search_document(*columns), postgresql_using='gin').ddl_if(dialect='postgresql')
 
 class Trick(db.Model):
     """Represents a skateboarding trick posted by a user."""
@@ -14,6 +33,15 @@ class Trick(db.Model):
     difficulty = db.Column(db.String(50), nullable=False, default='beginner')
     created = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    upvote_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_tricks_created_id', 'created', 'id'),
+        db.Index('ix_tricks_user_created_id', 'user_id', 'created', 'id'),
+        search_index('ix_tricks_search', title, description),
+        db.Index('ix_tricks_title_trgm', title, postgresql_using='gin',
+                 postgresql_ops={'title': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
 
     user = db.relationship('User', backref='tricks')
 
@@ -25,10 +53,14 @@ class Trick(db.Model):
             'video_url': self.video_url,
             'difficulty': self.difficulty,
             'created': self.created.isoformat(),
-            'upvote_count': len(self.upvotes),
+            'upvote_count': self.upvote_count,
             'user_id': self.user_id
         }
 
+# Trigram operators used by the title suggestion index
+event.listen(Trick.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+
 class User(db.Model):
     """Represents a registered user."""
     __tablename__ = 'users'
@@ -44,6 +76,8 @@ class User(db.Model):
     google_id = db.Column(db.String(100), unique=True, nullable=True)
     is_admin = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (db.Index('ix_users_created_at', 'created_at'),)
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -62,23 +96,16 @@ class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     created = db.Column(db.DateTime, default=datetime.utcnow)
-    trick_id = db.Column(db.Integer, db.ForeignKey('tricks.id'), nullable=False)
+    trick_id = db.Column(db.Integer, db.ForeignKey('tricks.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_comments_trick_created_id', 'trick_id', 'created', 'id'),
+        db.Index('ix_comments_user_created_id', 'user_id', 'created', 'id'),
+    )
+    
     user = db.relationship('User', backref='comments')
-    trick = db.relationship('Trick', backref='comments')
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'content': self.content,
-            'created': self.created.isoformat(),
-            'created_at': self.created.isoformat(),
-            'trick_id': self.trick_id,
-            'user_email': self.user.email,
-            'username': self.user.username,
-            'region': self.user.region
-        }
+    trick = db.relationship('Trick', backref=db.backref('comments', cascade='all, delete', passive_deletes=True))
 
 class ForumTopic(db.Model):
     """Represents a discussion topic in the forum."""
@@ -90,22 +117,17 @@ class ForumTopic(db.Model):
     created = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     is_pinned = db.Column(db.Boolean, default=False)
+    reply_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_forum_topics_pinned_created_id', 'is_pinned', 'created', 'id'),
+        db.Index('ix_forum_topics_created_id', 'created', 'id'),
+        db.Index('ix_forum_topics_user_created_id', 'user_id', 'created', 'id'),
+        search_index('ix_forum_topics_search', title, description),
+    )
     
     user = db.relationship('User', backref='forum_topics')
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'created': self.created.isoformat(),
-            'user_id': self.user_id,
-            'username': self.user.username,
-            'user_region': self.user.region,
-            'is_pinned': self.is_pinned,
-            'reply_count': len(self.replies)
-        }
-
 class ForumReply(db.Model):
     """Represents a reply to a forum topic."""
     __tablename__ = 'forum_replies'
@@ -113,23 +135,18 @@ class ForumReply(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     created = db.Column(db.DateTime, default=datetime.utcnow)
-    topic_id = db.Column(db.Integer, db.ForeignKey('forum_topics.id'), nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('forum_topics.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    upvote_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_forum_replies_topic_created_id', 'topic_id', 'created', 'id'),
+        db.Index('ix_forum_replies_user_created_id', 'user_id', 'created', 'id'),
+        search_index('ix_forum_replies_search', content),
+    )
     
     user = db.relationship('User', backref='forum_replies')
-    topic = db.relationship('ForumTopic', backref='replies')
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'content': self.content,
-            'created': self.created.isoformat(),
-            'topic_id': self.topic_id,
-            'user_id': self.user_id,
-            'username': self.user.username,
-            'user_region': self.user.region,
-            'upvote_count': len(self.upvotes)
-        }
+    topic = db.relationship('ForumTopic', backref=db.backref('replies', cascade='all, delete', passive_deletes=True))
 
 class Skatepark(db.Model):
     """Represents a skatepark location."""
@@ -141,8 +158,9 @@ class Skatepark(db.Model):
     description = db.Column(db.Text, nullable=False)
     lat = db.Column(db.Float, nullable=False)
     lng = db.Column(db.Float, nullable=False)
+    geohash = db.Column(db.String(12), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     
     creator = db.relationship('User', backref='created_skateparks')
     
@@ -158,19 +176,28 @@ class Skatepark(db.Model):
             'created_by': self.created_by
         }
 
+@event.listens_for(Skatepark, 'before_insert')
+@event.listens_for(Skatepark, 'before_update')
+def _set_skatepark_geohash(mapper, connection, skatepark):
+    skatepark.geohash = encode_geohash(float(skatepark.lat), float(skatepark.lng))
+
 class TrickUpvote(db.Model):
     """Tracks upvotes for tricks, ensuring one upvote per user per trick."""
     __tablename__ = 'trick_upvotes'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    trick_id = db.Column(db.Integer, db.ForeignKey('tricks.id'), nullable=False)
+    trick_id = db.Column(db.Integer, db.ForeignKey('tricks.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'trick_id', name='unique_trick_upvote'),)
+    # The unique constraint also serves lookups by user; cascades from tricks need trick_id
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'trick_id', name='unique_trick_upvote'),
+        db.Index('ix_trick_upvotes_trick_id', 'trick_id'),
+    )
     
     user = db.relationship('User', backref='trick_upvotes')
-    trick = db.relationship('Trick', backref='upvotes')
+    trick = db.relationship('Trick', backref=db.backref('upvotes', cascade='all, delete', passive_deletes=True))
 
 class ReplyUpvote(db.Model):
     """Tracks upvotes for forum replies, ensuring one upvote per user per reply."""
@@ -178,10 +205,57 @@ class ReplyUpvote(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    reply_id = db.Column(db.Integer, db.ForeignKey('forum_replies.id'), nullable=False)
+    reply_id = db.Column(db.Integer, db.ForeignKey('forum_replies.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'reply_id', name='unique_reply_upvote'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'reply_id', name='unique_reply_upvote'),
+        db.Index('ix_reply_upvotes_reply_id', 'reply_id'),
+    )
     
     user = db.relationship('User', backref='reply_upvotes')
-    reply = db.relationship('ForumReply', backref='upvotes')
\ No newline at end of file
+    reply = db.relationship('ForumReply', backref=db.backref('upvotes', cascade='all, delete', passive_deletes=True))
+
+class LeaderboardCounter(db.Model):
+    """Persisted leaderboard snapshot, one running total per board and subject."""
+    __tablename__ = 'leaderboard_counters'
+
+    board = db.Column(db.String(20), primary_key=True)
+    subject_id = db.Column(db.Integer, primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+db.Index('ix_leaderboard_counters_rank',
+         LeaderboardCounter.board, LeaderboardCounter.total.desc(), LeaderboardCounter.subject_id)
+
+class ResourceVersion(db.Model):
+    """Version counter of a group of API resources, bumped whenever one of them changes."""
+    __tablename__ = 'resource_versions'
+
+    tag = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class OutboxEmail(db.Model):
+    """Email waiting to be sent by the outbox worker, written in the same transaction as its cause."""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at', 'id'),)
+
+class SchemaMigration(db.Model):
+    """Version of a schema migration applied to this database, see migrations.py."""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,144 @@
+import json
+import logging
+from sqlalchemy import func
+from models import db, Trick, Comment, ForumTopic, ForumReply
+from counters import increment_counter
+from versions import record_changes
+import leaderboards
+import search
+import suggest
+
+# Items deleted per transaction, so a spam wave never holds locks for long
+CHUNK_SIZE = 500
+MAX_ITEMS = 10000
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Content Types
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _delete_comments(rows):
+    leaderboards.remove_comments([row.id for row in rows])
+
+def _delete_replies(rows):
+    ids = [row.id for row in rows]
+    leaderboards.remove_forum_replies(ids)
+    per_topic = db.session.query(ForumReply.topic_id, func.count(ForumReply.id)).filter(
+        ForumReply.id.in_(ids)
+    ).group_by(ForumReply.topic_id).all()
+    for topic_id, count in per_topic:
+        increment_counter(ForumTopic, topic_id, 'reply_count', -count)
+
+def _unindex_replies(rows):
+    for row in rows:
+        search.topic_index.remove(row.topic_id, row.content)
+
+def _unindex_tricks(rows):
+    for row in rows:
+        search.trick_index.remove(row.id)
+        suggest.title_trie.remove(row.id)
+
+def _unindex_topics(rows):
+    for row in rows:
+        search.topic_index.remove(row.id)
+
+class ContentType:
+    """
+    How one kind of content is bulk deleted: the columns its bookkeeping
+    needs, the leaderboard and counter updates made before the DELETE, and
+    the in-memory indexes updated after it. Bulk statements bypass the model
+    events that do this for single deletes.
+    """
+
+    def __init__(self, name, model, columns, before_delete, unindex=None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.before_delete = before_delete
+        self.unindex = unindex
+
+    def ids_by_user(self, user_id, since=None, limit=None):
+        query = db.session.query(self.model.id).filter(self.model.user_id == user_id)
+        if since is not None:
+            query = query.filter(self.model.created >= since)
+        return [row.id for row in query.order_by(self.model.created, self.model.id).limit(limit)]
+
+    def delete(self, ids):
+        """Delete the rows with these ids in one statement; returns the ids that existed"""
+        rows = db.session.query(*self.columns).filter(self.model.id.in_(ids)).all()
+        if not rows:
+            return set()
+        existing = [row.id for row in rows]
+        self.before_delete(rows)
+        record_changes(self.model, rows)
+        self.model.query.filter(self.model.id.in_(existing)).delete(synchronize_session=False)
+        if self.unindex:
+            search.on_commit(db.session, lambda: self.unindex(rows))
+        return set(existing)
+
+# Children before parents, so an item is reported deleted rather than swept away by its parent's cascade
+CONTENT_TYPES = [
+    ContentType('comments', Comment, [Comment.id, Comment.user_id, Comment.trick_id], _delete_comments),
+    ContentType('replies', ForumReply, [ForumReply.id, ForumReply.user_id, ForumReply.topic_id, ForumReply.content],
+                _delete_replies, _unindex_replies),
+    ContentType('tricks', Trick, [Trick.id, Trick.user_id],
+                lambda rows: leaderboards.remove_tricks([row.id for row in rows]), _unindex_tricks),
+    ContentType('topics', ForumTopic, [ForumTopic.id, ForumTopic.user_id],
+                lambda rows: leaderboards.remove_forum_topics([row.id for row in rows]), _unindex_topics),
+]
+CONTENT_TYPES_BY_NAME = {content_type.name: content_type for content_type in CONTENT_TYPES}
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Bulk Deletes
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def select_items(ids_by_type=None, user_id=None, since=None, limit=None):
+    """
+    (type, id) pairs to delete, from explicit ids per type and/or every item
+    of user_id created since a datetime, in deletion order. At most limit
+    pairs are selected, so a caller passing one more than it accepts can
+    tell a selection that is too large without loading all of it.
+    """
+    items = []
+    for content_type in CONTENT_TYPES:
+        remaining = None if limit is None else limit - len(items)
+        if remaining == 0:
+            break
+        ids = list((ids_by_type or {}).get(content_type.name, []))
+        if user_id is not None:
+            ids += content_type.ids_by_user(user_id, since, remaining)
+        items += [(content_type.name, item_id) for item_id in dict.fromkeys(ids)][:remaining]
+    return items
+
+def delete_chunk(items):
+    """Delete one chunk of (type, id) pairs in a single transaction; returns per-item results"""
+    try:
+        deleted = set()
+        for content_type in CONTENT_TYPES:
+            ids = [item_id for name, item_id in items if name == content_type.name]
+            if ids:
+                deleted |= {(content_type.name, item_id) for item_id in content_type.delete(ids)}
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logging.exception(e)
+        return [{'type': name, 'id': item_id, 'status': 'error'} for name, item_id in items]
+    return [{'type': name, 'id': item_id, 'status': 'deleted' if (name, item_id) in deleted else 'not_found'}
+            for name, item_id in items]
+
+def bulk_delete(items, chunk_size=None):
+    """
+    Delete items chunk by chunk, yielding one NDJSON line of progress with
+    the results of each chunk, then a summary line.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    summary = {'deleted': 0, 'not_found': 0, 'error': 0}
+    for start in range(0, len(items), chunk_size):
+        results = delete_chunk(items[start:start + chunk_size])
+        for result in results:
+            summary[result['status']] += 1
+        yield json.dumps({
+            'done': min(start + chunk_size, len(items)),
+            'total': len(items),
+            'results': results
+        }) + '\n'
+    yield json.dumps({'done': len(items), 'total': len(items), 'summary': summary}) + '\n'
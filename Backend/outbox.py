@@ -0,0 +1,86 @@
+import logging
+import smtplib
+import time
+from datetime import datetime, timedelta
+from flask_mail import Message
+from models import db, OutboxEmail
+
+BATCH_SIZE = 50
+POLL_INTERVAL_SECONDS = 5
+MAX_ATTEMPTS = 8
+# Retry delays double from the base up to the cap: 30s, 1m, 2m, ... 1h
+BASE_RETRY_SECONDS = 30
+MAX_RETRY_SECONDS = 3600
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+def queue_email(recipient, subject, body):
+    """Add an email to the outbox; it is sent once the caller's transaction commits"""
+    email = OutboxEmail(recipient=recipient, subject=subject, body=body)
+    db.session.add(email)
+    return email
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after a number of failed attempts"""
+    return timedelta(seconds=min(MAX_RETRY_SECONDS, BASE_RETRY_SECONDS * 2 ** (attempts - 1)))
+
+def _claim_batch(batch_size):
+    """Lock due emails; SKIP LOCKED lets several workers share the outbox on Postgres"""
+    return OutboxEmail.query.filter(
+        OutboxEmail.status == PENDING,
+        OutboxEmail.next_attempt_at <= datetime.utcnow()
+    ).order_by(OutboxEmail.next_attempt_at, OutboxEmail.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+def deliver_batch(connection, sender, batch_size=BATCH_SIZE):
+    """
+    Send one batch of due emails over an open Flask-Mail connection and
+    commit their outcome. Returns the number of emails processed. A dropped
+    connection ends the batch early, leaving the remaining emails due.
+    """
+    emails = _claim_batch(batch_size)
+    processed = 0
+    try:
+        for email in emails:
+            try:
+                connection.send(Message(email.subject, sender=sender, recipients=[email.recipient], body=email.body))
+            except smtplib.SMTPServerDisconnected:
+                raise
+            except Exception as e:
+                email.attempts += 1
+                email.last_error = str(e)[:1000]
+                if email.attempts >= MAX_ATTEMPTS:
+                    email.status = FAILED
+                    logging.error(f"Giving up on email {email.id} to {email.recipient}: {e}")
+                else:
+                    email.next_attempt_at = datetime.utcnow() + retry_delay(email.attempts)
+            else:
+                email.attempts += 1
+                email.status = SENT
+                email.sent_at = datetime.utcnow()
+            processed += 1
+    finally:
+        db.session.commit()
+    return processed
+
+def run_worker(mail, sender, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL_SECONDS, once=False):
+    """
+    Drain the outbox forever. One SMTP connection is opened when work is found
+    and reused for every batch until the outbox is empty, then closed while idle.
+    """
+    while True:
+        try:
+            if OutboxEmail.query.filter(
+                OutboxEmail.status == PENDING, OutboxEmail.next_attempt_at <= datetime.utcnow()
+            ).first() is not None:
+                with mail.connect() as connection:
+                    while deliver_batch(connection, sender, batch_size) == batch_size:
+                        pass
+            db.session.remove()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Email outbox worker error, retrying: {e}")
+        if once:
+            return
+        time.sleep(poll_interval)
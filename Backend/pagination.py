@@ -0,0 +1,124 @@
+import base64
+import datetime
+import json
+from flask import request, jsonify
+from sqlalchemy import tuple_, literal
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page into an opaque token"""
+    payload = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+def _decode_payload(token, length):
+    payload = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    if not isinstance(payload, list) or len(payload) != length:
+        raise ValueError('Cursor does not match this listing')
+    return payload
+
+def _cursor_value(column, value):
+    """A decoded cursor value as the Python type of its column; ValueError if it isn't one"""
+    if value is None:
+        return None
+    expected = column.type.python_type
+    if issubclass(expected, datetime.datetime) and isinstance(value, str):
+        return datetime.datetime.fromisoformat(value)
+    if expected is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    # bool is an int in Python, but a boolean column is not an integer one
+    if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+        raise ValueError('Cursor does not match this listing')
+    return value
+
+def decode_cursor(token, columns):
+    """Decode a cursor token back into typed values for the given sort columns"""
+    payload = _decode_payload(token, len(columns))
+    return [_cursor_value(column, value) for column, value in zip(columns, payload)]
+
+def paginate(query, columns, limit, cursor=None, descending=True):
+    """
+    Return one page of query ordered by columns plus the cursor of the next page.
+    Rows after the cursor are selected with a row-value comparison, so every page
+    is a single index range scan no matter how deep it is.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        after = tuple_(*[literal(value, column.type) for column, value in zip(columns, values)])
+        query = query.filter(key < after if descending else key > after)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
+
+def _page_limit():
+    limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, MAX_PAGE_SIZE)
+
+def paginated_response(query, columns, serialize, descending=True, annotate=None):
+    """
+    Serialize a listing, paginated when the client sends limit or cursor.
+    Without them the full list is returned as a plain array, as before.
+    annotate, if given, receives the serialized items to add fields in bulk.
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        order = [column.desc() if descending else column.asc() for column in columns]
+        items = [serialize(row) for row in query.order_by(*order).all()]
+        if annotate:
+            annotate(items)
+        return jsonify(items)
+
+    try:
+        rows, next_cursor = paginate(
+            query, columns, _page_limit(),
+            cursor=request.args.get('cursor'), descending=descending
+        )
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+
+    items = [serialize(row) for row in rows]
+    if annotate:
+        annotate(items)
+    return jsonify({
+        'items': items,
+        'next_cursor': next_cursor
+    })
+
+def ranked_response(fetch, serialize, annotate=None):
+    """
+    Serialize relevance-ranked results, which have no stable sort key to seek on.
+    fetch(limit, offset) returns rows; the cursor carries the offset of the next page.
+    Without limit or cursor every result is returned as a plain array.
+    """
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        items = [serialize(row) for row in fetch(None, 0)]
+        if annotate:
+            annotate(items)
+        return jsonify(items)
+
+    try:
+        limit = _page_limit()
+        cursor = request.args.get('cursor')
+        offset = _decode_payload(cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError('Cursor does not match this listing')
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid pagination parameters'}), 400
+
+    rows = fetch(limit + 1, offset)
+    items = [serialize(row) for row in rows[:limit]]
+    if annotate:
+        annotate(items)
+    return jsonify({
+        'items': items,
+        'next_cursor': encode_cursor([offset + limit]) if len(rows) > limit else None
+    })
@@ -0,0 +1,91 @@
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+DEFAULT_ROUNDS = 12
+# Hashes waiting for or running in the pool; further requests are refused
+DEFAULT_MAX_PENDING = 32
+# How long a request waits for a free slot before being refused
+QUEUE_TIMEOUT_SECONDS = 2
+
+ROUNDS_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool has too many pending requests"""
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Hashing Primitives (run in the pool)
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:
+        # Malformed hash, or a password past bcrypt's 72 byte limit
+        return False
+
+def hash_rounds(hashed):
+    """Work factor a bcrypt hash was created with, or None if it is not a bcrypt hash"""
+    match = ROUNDS_PATTERN.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Password Hasher
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class PasswordHasher:
+    """
+    bcrypt hashing at a configurable cost. With workers > 0, hashes run in a
+    process pool of that size, so a login burst uses at most that many cores
+    and waits in a queue of max_pending instead of starving the web workers;
+    past that, HasherBusy is raised. With workers = 0 hashes run inline.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=0, max_pending=DEFAULT_MAX_PENDING,
+                 queue_timeout=QUEUE_TIMEOUT_SECONDS):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._slots = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        # The pool is started on first use, after the settings are final
+        with self._lock:
+            if self._pool is None:
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusy('Too many password hashes pending')
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        if not hashed or not password:
+            return False
+        return self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        """Whether a stored hash was made at a different cost than the configured one"""
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,89 @@
+import threading
+from sqlalchemy import event
+from models import User
+
+ADMIN = 'admin'
+USER = 'user'
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Backends
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Per-process role versions; only suitable for a single worker"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def incr(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return self._versions[user_id]
+
+    def reset(self):
+        with self._lock:
+            self._versions.clear()
+
+class RedisBackend:
+    """Role versions shared by every worker through Redis"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='role-version:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, user_id):
+        return int(self.client.get(f'{self.prefix}{user_id}') or 0)
+
+    def incr(self, user_id):
+        return self.client.incr(f'{self.prefix}{user_id}')
+
+    def reset(self):
+        # Versions only ever grow, so outstanding tokens stay comparable
+        pass
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Role Claims
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class RoleVersions:
+    """
+    Per-user counter embedded in access tokens next to the role claim. Changing
+    a user's role bumps the counter, which makes every token issued before the
+    change stale, so authorization checks can trust the signed claims without
+    reading the users table.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def claims(self, user_id, is_admin):
+        """Role claims for a new access token"""
+        return {'role': ADMIN if is_admin else USER, 'role_version': self.backend.get(user_id)}
+
+    def is_current(self, claims):
+        """Whether the role claims of a decoded token still hold"""
+        return claims.get('role_version') == self.backend.get(claims['user_id'])
+
+    def revoke(self, user_id):
+        """Make the role claims of every outstanding token of a user stale"""
+        self.backend.incr(user_id)
+
+    def reset(self):
+        self.backend.reset()
+
+def is_admin(claims):
+    return claims.get('role') == ADMIN
+
+role_versions = RoleVersions(MemoryBackend())
+
+event.listen(User.__table__, 'after_create', lambda *args, **kwargs: role_versions.reset())
+event.listen(User.__table__, 'after_drop', lambda *args, **kwargs: role_versions.reset())
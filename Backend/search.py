@@ -0,0 +1,230 @@
+import bisect
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from sqlalchemy import event, func, literal_column, select, union_all
+from sqlalchemy.orm import object_session
+from models import db, Trick, ForumTopic, ForumReply, search_document, SEARCH_CONFIG
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text or '')]
+
+def uses_full_text_search():
+    """Postgres answers searches from GIN indexes, other databases use the in-process index"""
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# In-process Inverted Index
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def on_commit(session, change):
+    """Apply an in-process index change once the session commits; a rollback drops it"""
+    session.info.setdefault('index_changes', []).append(change)
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_index_changes(session):
+    for change in session.info.pop('index_changes', []):
+        change()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_index_changes(session, previous_transaction):
+    session.info.pop('index_changes', None)
+
+class InvertedIndex:
+    """
+    Pure-Python inverted index used when the database has no full-text search.
+    It is built lazily from the database on the first search and then kept up
+    to date by the model events registered below, as their transaction
+    commits. Each process holds its own copy and only sees the writes it
+    commits, so this fallback suits development and single-worker setups;
+    production searches run on Postgres.
+    """
+
+    def __init__(self, load_documents):
+        self._load_documents = load_documents
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._postings = defaultdict(dict)
+        self._terms = []
+        self._documents = {}
+        self._built = False
+
+    def _ensure_built(self):
+        if not self._built:
+            for doc_id, text in self._load_documents():
+                self._add(doc_id, text, sort_terms=False)
+            self._terms = sorted(self._postings)
+            self._built = True
+
+    def _add(self, doc_id, text, sort_terms=True):
+        terms = self._documents.setdefault(doc_id, Counter())
+        for token, count in Counter(tokenize(text)).items():
+            if sort_terms and token not in self._postings:
+                bisect.insort(self._terms, token)
+            terms[token] += count
+            self._postings[token][doc_id] = terms[token]
+
+    def add(self, doc_id, text):
+        with self._lock:
+            if self._built:
+                self._add(doc_id, text)
+
+    def remove(self, doc_id, text=None):
+        """Remove text from a document, or the whole document when text is None"""
+        with self._lock:
+            terms = self._documents.get(doc_id)
+            if not self._built or terms is None:
+                return
+            removed = Counter(tokenize(text)) if text is not None else Counter(terms)
+            for token, count in removed.items():
+                terms[token] -= count
+                if terms[token] > 0:
+                    self._postings[token][doc_id] = terms[token]
+                    continue
+                del terms[token]
+                postings = self._postings.get(token, {})
+                postings.pop(doc_id, None)
+                if not postings:
+                    self._postings.pop(token, None)
+                    del self._terms[bisect.bisect_left(self._terms, token)]
+            if not terms:
+                del self._documents[doc_id]
+
+    def _expand(self, token):
+        """Vocabulary terms starting with token, so partially typed words match"""
+        start = bisect.bisect_left(self._terms, token)
+        end = start
+        while end < len(self._terms) and self._terms[end].startswith(token):
+            end += 1
+        return self._terms[start:end]
+
+    def search(self, tokens):
+        """Return (doc_id, score) pairs matching every token, best first"""
+        with self._lock:
+            self._ensure_built()
+            total = len(self._documents)
+            scores = None
+            for token in tokens:
+                token_scores = defaultdict(float)
+                for term in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for doc_id, count in postings.items():
+                        token_scores[doc_id] += count * idf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {doc_id: score + token_scores[doc_id]
+                              for doc_id, score in scores.items() if doc_id in token_scores}
+                if not scores:
+                    return []
+        return sorted((scores or {}).items(), key=lambda item: (-item[1], -item[0]))
+
+def _trick_text(trick):
+    return f"{trick.title} {trick.description}"
+
+def _topic_text(topic):
+    return f"{topic.title} {topic.description or ''}"
+
+def _load_trick_documents():
+    for row in db.session.query(Trick.id, Trick.title, Trick.description):
+        yield row.id, _trick_text(row)
+
+def _load_topic_documents():
+    for row in db.session.query(ForumTopic.id, ForumTopic.title, ForumTopic.description):
+        yield row.id, _topic_text(row)
+    for row in db.session.query(ForumReply.topic_id, ForumReply.content):
+        yield row.topic_id, row.content
+
+trick_index = InvertedIndex(_load_trick_documents)
+topic_index = InvertedIndex(_load_topic_documents)
+
+@event.listens_for(Trick, 'after_insert')
+def _index_trick(mapper, connection, trick):
+    on_commit(object_session(trick), lambda doc_id=trick.id, text=_trick_text(trick): trick_index.add(doc_id, text))
+
+@event.listens_for(Trick, 'after_delete')
+def _unindex_trick(mapper, connection, trick):
+    on_commit(object_session(trick), lambda doc_id=trick.id: trick_index.remove(doc_id))
+
+@event.listens_for(ForumTopic, 'after_insert')
+def _index_topic(mapper, connection, topic):
+    on_commit(object_session(topic), lambda doc_id=topic.id, text=_topic_text(topic): topic_index.add(doc_id, text))
+
+@event.listens_for(ForumTopic, 'after_delete')
+def _unindex_topic(mapper, connection, topic):
+    on_commit(object_session(topic), lambda doc_id=topic.id: topic_index.remove(doc_id))
+
+@event.listens_for(ForumReply, 'after_insert')
+def _index_reply(mapper, connection, reply):
+    on_commit(object_session(reply), lambda doc_id=reply.topic_id, text=reply.content: topic_index.add(doc_id, text))
+
+@event.listens_for(ForumReply, 'after_delete')
+def _unindex_reply(mapper, connection, reply):
+    on_commit(object_session(reply), lambda doc_id=reply.topic_id, text=reply.content: topic_index.remove(doc_id, text))
+
+# Recreated tables must not inherit postings for reused IDs
+for _table, _index in ((Trick.__table__, trick_index),
+                       (ForumTopic.__table__, topic_index),
+                       (ForumReply.__table__, topic_index)):
+    event.listen(_table, 'after_create', lambda *args, index=_index, **kwargs: index.reset())
+    event.listen(_table, 'after_drop', lambda *args, index=_index, **kwargs: index.reset())
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Search Queries
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _ts_query(tokens):
+    """Prefix-matching tsquery requiring every token"""
+    return func.to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"), ' & '.join(f"{token}:*" for token in tokens))
+
+def _fetch_ranked(model, ranked_ids):
+    """Load rows for ranked IDs, preserving rank order and dropping deleted rows"""
+    rows = {row.id: row for row in model.query.filter(model.id.in_(ranked_ids))}
+    return [rows[row_id] for row_id in ranked_ids if row_id in rows]
+
+def search_tricks(text, limit=None, offset=0):
+    """Return tricks matching text in their title or description, most relevant first"""
+    tokens = tokenize(text)
+    if not uses_full_text_search():
+        ranked = trick_index.search(tokens)
+        end = None if limit is None else offset + limit
+        return _fetch_ranked(Trick, [doc_id for doc_id, _ in ranked[offset:end]])
+
+    document = search_document(Trick.title, Trick.description)
+    ts_query = _ts_query(tokens)
+    rank = func.ts_rank(document, ts_query)
+    query = Trick.query.filter(document.op('@@')(ts_query)).order_by(rank.desc(), Trick.id.desc())
+    return query.offset(offset).limit(limit).all()
+
+def search_forum_topics(text, limit=None, offset=0):
+    """Return topics matching text in their title, description or replies, most relevant first"""
+    tokens = tokenize(text)
+    if not uses_full_text_search():
+        ranked = topic_index.search(tokens)
+        end = None if limit is None else offset + limit
+        return _fetch_ranked(ForumTopic, [doc_id for doc_id, _ in ranked[offset:end]])
+
+    ts_query = _ts_query(tokens)
+    topic_document = search_document(ForumTopic.title, ForumTopic.description)
+    reply_document = search_document(ForumReply.content)
+    matches = union_all(
+        select(ForumTopic.id.label('topic_id'), func.ts_rank(topic_document, ts_query).label('rank'))
+        .where(topic_document.op('@@')(ts_query)),
+        select(ForumReply.topic_id.label('topic_id'), func.ts_rank(reply_document, ts_query).label('rank'))
+        .where(reply_document.op('@@')(ts_query))
+    ).subquery()
+    ranked = select(
+        matches.c.topic_id, func.max(matches.c.rank).label('rank')
+    ).group_by(matches.c.topic_id).subquery()
+
+    query = ForumTopic.query.join(ranked, ranked.c.topic_id == ForumTopic.id).order_by(
+        ranked.c.rank.desc(), ForumTopic.id.desc()
+    )
+    return query.offset(offset).limit(limit).all()
@@ -0,0 +1,96 @@
+from models import User, Comment, ForumTopic, ForumReply
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Row Serializers
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class RowSerializer:
+    """
+    Serialization contract of a list endpoint: the columns it reads, the joins
+    they need and how one row becomes a dict. select() turns a model query into
+    a column-only query, so a listing is one statement returning plain rows,
+    with no ORM objects to hydrate and no relationship loaded per item.
+    """
+
+    def __init__(self, model, columns, build, joins=()):
+        self.model = model
+        self.columns = columns
+        self.build = build
+        self.joins = joins
+
+    def select(self, query=None):
+        query = query if query is not None else self.model.query
+        for target, condition in self.joins:
+            query = query.join(target, condition)
+        return query.with_entities(*self.columns)
+
+    def rows_by_ids(self, ids):
+        """Rows with these ids in the given order, e.g. for ranked search results"""
+        if not ids:
+            return []
+        rows = {row.id: row for row in self.select().filter(self.model.id.in_(ids))}
+        return [rows[row_id] for row_id in ids if row_id in rows]
+
+    def one(self, id):
+        """Serialize a single row by id, or return None if it does not exist"""
+        row = self.select().filter(self.model.id == id).first()
+        return self.build(row) if row is not None else None
+
+    def __call__(self, row):
+        return self.build(row)
+
+def _author(model):
+    return [(User, model.user_id == User.id)]
+
+comment_serializer = RowSerializer(
+    Comment,
+    [Comment.id, Comment.content, Comment.created, Comment.trick_id,
+     User.email.label('user_email'), User.username.label('username'), User.region.label('region')],
+    lambda row: {
+        'id': row.id,
+        'content': row.content,
+        'created': row.created.isoformat(),
+        'created_at': row.created.isoformat(),
+        'trick_id': row.trick_id,
+        'user_email': row.user_email,
+        'username': row.username,
+        'region': row.region
+    },
+    joins=_author(Comment)
+)
+
+forum_topic_serializer = RowSerializer(
+    ForumTopic,
+    [ForumTopic.id, ForumTopic.title, ForumTopic.description, ForumTopic.created, ForumTopic.user_id,
+     ForumTopic.is_pinned, ForumTopic.reply_count,
+     User.username.label('username'), User.region.label('user_region')],
+    lambda row: {
+        'id': row.id,
+        'title': row.title,
+        'description': row.description,
+        'created': row.created.isoformat(),
+        'user_id': row.user_id,
+        'username': row.username,
+        'user_region': row.user_region,
+        'is_pinned': row.is_pinned,
+        'reply_count': row.reply_count
+    },
+    joins=_author(ForumTopic)
+)
+
+forum_reply_serializer = RowSerializer(
+    ForumReply,
+    [ForumReply.id, ForumReply.content, ForumReply.created, ForumReply.topic_id, ForumReply.user_id,
+     ForumReply.upvote_count, User.username.label('username'), User.region.label('user_region')],
+    lambda row: {
+        'id': row.id,
+        'content': row.content,
+        'created': row.created.isoformat(),
+        'topic_id': row.topic_id,
+        'user_id': row.user_id,
+        'username': row.username,
+        'user_region': row.user_region,
+        'upvote_count': row.upvote_count
+    },
+    joins=_author(ForumReply)
+)
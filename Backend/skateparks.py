@@ -0,0 +1,59 @@
+import math
+from sqlalchemy import and_, or_, case
+from models import Skatepark
+from geo import covering_ranges, haversine_km, bounding_box
+
+DEFAULT_RESULTS = 500
+MAX_RESULTS = 2000
+MAX_RADIUS_KM = 1000
+# Parks fetched per requested result; the database orders them by an approximate
+# distance, which the exact one then refines
+CANDIDATES_PER_RESULT = 2
+
+def box_center(south, west, north, east):
+    """Center of a box, accounting for boxes crossing the 180th meridian"""
+    span = (east - west) % 360 if west != east else 0
+    lng = west + span / 2
+    if lng > 180:
+        lng -= 360
+    return (south + north) / 2, lng
+
+def _box_query(south, west, north, east):
+    """Parks inside the box, located through geohash range scans on the indexed column"""
+    cells = [
+        and_(Skatepark.geohash >= low, Skatepark.geohash < high) if high else Skatepark.geohash >= low
+        for low, high in covering_ranges(south, west, north, east)
+    ]
+    if west <= east:
+        lng_filter = Skatepark.lng.between(west, east)
+    else:
+        lng_filter = or_(Skatepark.lng >= west, Skatepark.lng <= east)
+    return Skatepark.query.filter(or_(*cells), Skatepark.lat.between(south, north), lng_filter)
+
+def _approximate_distance(lat, lng):
+    """Squared flat-earth distance in degrees, which SQL can compute without trigonometry"""
+    lng_delta = Skatepark.lng - lng
+    lng_delta = case((lng_delta > 180, lng_delta - 360), (lng_delta < -180, lng_delta + 360), else_=lng_delta)
+    lng_delta = lng_delta * math.cos(math.radians(lat))
+    lat_delta = Skatepark.lat - lat
+    return lat_delta * lat_delta + lng_delta * lng_delta
+
+def _by_distance(query, lat, lng, limit, radius_km=None):
+    """Nearest parks of a query, without loading more than a few times limit rows"""
+    candidates = query.order_by(_approximate_distance(lat, lng), Skatepark.id).limit(limit * CANDIDATES_PER_RESULT)
+    located = []
+    for park in candidates:
+        distance = haversine_km(lat, lng, park.lat, park.lng)
+        if radius_km is None or distance <= radius_km:
+            located.append((park, distance))
+    located.sort(key=lambda item: (item[1], item[0].id))
+    return located[:limit]
+
+def parks_in_box(south, west, north, east, limit=DEFAULT_RESULTS):
+    """Return (park, distance_km) pairs inside a viewport, nearest to its center first"""
+    lat, lng = box_center(south, west, north, east)
+    return _by_distance(_box_query(south, west, north, east), lat, lng, limit)
+
+def parks_near(lat, lng, radius_km, limit=DEFAULT_RESULTS):
+    """Return (park, distance_km) pairs within radius_km of a point, nearest first"""
+    return _by_distance(_box_query(*bounding_box(lat, lng, radius_km)), lat, lng, limit, radius_km)
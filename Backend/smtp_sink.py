@@ -0,0 +1,108 @@
+"""
+Minimal SMTP server that keeps every message it receives instead of delivering
+it. Used by the tests and for local development:
+
+    python smtp_sink.py 1025
+
+then set MAIL_SERVER=localhost, MAIL_PORT=1025 and MAIL_USE_TLS=0.
+"""
+import email
+import email.policy
+import socketserver
+import sys
+import threading
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        sink._connected()
+        self.reply('220 smtp-sink ready')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 smtp-sink')
+            elif verb == 'MAIL':
+                sender, recipients = command.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                if sink._should_fail():
+                    self.reply('451 Temporary failure')
+                else:
+                    recipients.append(command.split(':', 1)[1].strip().strip('<>'))
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                sink._received(sender, recipients, email.message_from_bytes(b''.join(lines), policy=email.policy.default))
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+class SMTPSink:
+    """
+    Threaded fake SMTP server on localhost. messages holds (sender, recipients,
+    email.message.EmailMessage) tuples; connections counts SMTP sessions opened.
+    fail_next(n) makes the next n recipients be refused with a 4xx error.
+    """
+
+    def __init__(self, port=0):
+        self.messages = []
+        self.connections = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', port), _SMTPHandler)
+        self._server.daemon_threads = True
+        self._server.sink = self
+        self.port = self._server.server_address[1]
+
+    def _connected(self):
+        with self._lock:
+            self.connections += 1
+
+    def _should_fail(self):
+        with self._lock:
+            if self._failures:
+                self._failures -= 1
+                return True
+            return False
+
+    def _received(self, sender, recipients, message):
+        with self._lock:
+            self.messages.append((sender, recipients, message))
+
+    def fail_next(self, count=1):
+        with self._lock:
+            self._failures += count
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+if __name__ == '__main__':
+    sink = SMTPSink(int(sys.argv[1]) if len(sys.argv) > 1 else 1025)
+    sink._received = lambda sender, recipients, message: print(
+        f"── {sender} → {', '.join(recipients)}: {message['Subject']}\n{message.get_payload(decode=True).decode()}"
+    )
+    print(f"SMTP sink listening on 127.0.0.1:{sink.port}")
+    sink._server.serve_forever()
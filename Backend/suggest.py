@@ -0,0 +1,194 @@
+import heapq
+import threading
+from sqlalchemy import event, func, case
+from sqlalchemy.orm import object_session
+from models import db, Trick
+from search import on_commit
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+def max_typos(query):
+    """Edit distance tolerated for a query, growing with its length"""
+    if len(query) <= 3:
+        return 0
+    return 1 if len(query) <= 7 else 2
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# In-process Prefix Trie
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class _Node:
+    __slots__ = ('children', 'entries', 'completions')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = set()
+        # Cached shortest completions below this node, cleared when the subtree changes
+        self.completions = None
+
+class TitleTrie:
+    """
+    Prefix trie over trick titles, searched with a Levenshtein walk so that
+    misspelled prefixes like "kickflp" still match. Every word of a title
+    starts a key, so "flip" finds "Heel Flip". It is built lazily and kept
+    up to date by the model events registered below, as their transaction
+    commits. Like the search fallback, each process holds its own copy, so
+    it suits development and single-worker setups; Postgres answers from a
+    trigram index.
+    """
+
+    def __init__(self, load_titles):
+        self._load_titles = load_titles
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._root = _Node()
+        self._titles = {}
+        self._built = False
+
+    def _keys(self, title):
+        words = normalize(title).split(' ')
+        return [(' '.join(words[position:]), position) for position in range(len(words))]
+
+    def _add(self, trick_id, title):
+        self._titles[trick_id] = title
+        for key, position in self._keys(title):
+            node = self._root
+            node.completions = None
+            for char in key:
+                node = node.children.setdefault(char, _Node())
+                node.completions = None
+            node.entries.add((trick_id, position))
+
+    def _ensure_built(self):
+        if not self._built:
+            for trick_id, title in self._load_titles():
+                self._add(trick_id, title)
+            self._completions(self._root, 0)
+            self._built = True
+
+    def add(self, trick_id, title):
+        with self._lock:
+            if self._built:
+                self._add(trick_id, title)
+
+    def remove(self, trick_id):
+        with self._lock:
+            title = self._titles.pop(trick_id, None) if self._built else None
+            if title is None:
+                return
+            for key, position in self._keys(title):
+                path = [self._root]
+                for char in key:
+                    path.append(path[-1].children.get(char))
+                    if path[-1] is None:
+                        break
+                if path[-1] is None:
+                    continue
+                for node in path:
+                    node.completions = None
+                path[-1].entries.discard((trick_id, position))
+                for parent, char, node in zip(reversed(path[:-1]), reversed(key), reversed(path)):
+                    if node.entries or node.children:
+                        break
+                    del parent.children[char]
+
+    def _completions(self, node, depth):
+        """(key length, id, position) of the shortest keys below node"""
+        if node.completions is None:
+            candidates = [(depth, trick_id, position) for trick_id, position in node.entries]
+            for child in node.children.values():
+                candidates.extend(self._completions(child, depth + 1))
+            node.completions = heapq.nsmallest(MAX_SUGGESTIONS, candidates)
+        return node.completions
+
+    def _collect(self, node, depth, limit):
+        """Titles with a key below node, shortest keys first, up to limit"""
+        found = {}
+        for _, trick_id, position in self._completions(node, depth):
+            if trick_id not in found and len(found) >= limit:
+                break
+            found[trick_id] = min(position, found.get(trick_id, position))
+        return found
+
+    def suggest(self, query, limit=DEFAULT_SUGGESTIONS):
+        """Return (id, title) pairs whose title has a word starting like query"""
+        query = normalize(query)
+        if not query:
+            return []
+        typos = max_typos(query)
+
+        with self._lock:
+            self._ensure_built()
+            best = {}
+            # Each entry carries the lowest distance already matched on its path: a
+            # subtree is only worth collecting or descending into if it can beat it
+            stack = [(self._root, list(range(len(query) + 1)), typos + 1)]
+            while stack:
+                node, row, matched = stack.pop()
+                if row[-1] < matched:
+                    matched = row[-1]
+                    for trick_id, position in self._collect(node, row[0], limit).items():
+                        rank = (matched, position)
+                        if rank < best.get(trick_id, (typos + 1, 0)):
+                            best[trick_id] = rank
+                for char, child in node.children.items():
+                    next_row = [row[0] + 1]
+                    for column, query_char in enumerate(query, 1):
+                        next_row.append(min(
+                            next_row[column - 1] + 1,
+                            row[column] + 1,
+                            row[column - 1] + (query_char != char)
+                        ))
+                    if min(next_row) < matched:
+                        stack.append((child, next_row, matched))
+
+            ranked = sorted(best, key=lambda trick_id: (
+                best[trick_id], len(self._titles[trick_id]), self._titles[trick_id], trick_id
+            ))
+            return [(trick_id, self._titles[trick_id]) for trick_id in ranked[:limit]]
+
+def _load_titles():
+    return db.session.query(Trick.id, Trick.title).all()
+
+title_trie = TitleTrie(_load_titles)
+
+@event.listens_for(Trick, 'after_insert')
+def _add_title(mapper, connection, trick):
+    on_commit(object_session(trick), lambda trick_id=trick.id, title=trick.title: title_trie.add(trick_id, title))
+
+@event.listens_for(Trick, 'after_delete')
+def _remove_title(mapper, connection, trick):
+    on_commit(object_session(trick), lambda trick_id=trick.id: title_trie.remove(trick_id))
+
+event.listen(Trick.__table__, 'after_create', lambda *args, **kwargs: title_trie.reset())
+event.listen(Trick.__table__, 'after_drop', lambda *args, **kwargs: title_trie.reset())
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Suggestion Queries
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def suggest_tricks(query, limit=DEFAULT_SUGGESTIONS):
+    """Return up to limit {id, title} suggestions, tolerating typos"""
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return [{'id': trick_id, 'title': title} for trick_id, title in title_trie.suggest(query, limit)]
+
+    query = normalize(query)
+    if not query:
+        return []
+    # Both the % similarity operator and the prefix ILIKE are answered by the trigram index
+    prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    is_prefix = Trick.title.ilike(prefix, escape='\\')
+    rows = db.session.query(Trick.id, Trick.title).filter(
+        Trick.title.op('%', is_comparison=True)(query) | is_prefix
+    ).order_by(
+        case((is_prefix, 0), else_=1),
+        func.similarity(Trick.title, query).desc(),
+        Trick.id.desc()
+    ).limit(limit).all()
+    return [{'id': row.id, 'title': row.title} for row in rows]
@@ -1,14 +1,137 @@
 import unittest
 import json
-from app import app, db
-from models import User, Trick
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect
+from app import create_app, db, generate_access_token, url_serializer, google_verifier, password_hasher, limiter
+from models import (User, Trick, Comment, ForumTopic, ForumReply, Skatepark, ResourceVersion, OutboxEmail,
+                    TrickUpvote, ReplyUpvote)
+import migrations
+import skateparks
+from geo import encode_geohash, haversine_km
+import moderation
+import events
+from events import live_events
+from upvotes import upvote_buffer
+import unittest.mock
+import leaderboards
+from counters import backfill_counters
+import random
+from cache import response_cache
+from pagination import encode_cursor
+import datetime
+from flask_mail import Mail
+import outbox
+from smtp_sink import SMTPSink
+import jwt as pyjwt
+from jwt.algorithms import RSAAlgorithm
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google_tokens import KeyCache, StaticKeySource
+from passwords import PasswordHasher, HasherBusy, hash_rounds
+from token_store import MemoryTokenStore
+from database import engine_options, sticky_reads
+import shutil
+import tempfile
+import os
+import subprocess
+import runpy
+import sys
+
+# Upvotes are written through so tests read them back at once; test_upvotes_are_flushed_in_batches buffers them
+app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'UPVOTE_FLUSH_SECONDS': 0})
+
+# Cumulative time allowed for `import app`; Flask and SQLAlchemy alone take most of it
+IMPORT_TIME_BUDGET_MS = 1500
+
+# Tables as the first release created them, before any migration
+ORIGINAL_SCHEMA = [
+    """CREATE TABLE users (id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, username VARCHAR(50) NOT NULL,
+       region VARCHAR(100), password VARCHAR(255) NOT NULL, is_verified BOOLEAN, verification_token VARCHAR(255),
+       created_at DATETIME, google_id VARCHAR(100), is_admin BOOLEAN, PRIMARY KEY (id),
+       UNIQUE (email), UNIQUE (username), UNIQUE (google_id))""",
+    """CREATE TABLE tricks (id INTEGER NOT NULL, title VARCHAR(100) NOT NULL, description TEXT NOT NULL,
+       video_url VARCHAR(255) NOT NULL, difficulty VARCHAR(50) NOT NULL, created DATETIME, user_id INTEGER NOT NULL,
+       PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE forum_topics (id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, description TEXT, created DATETIME,
+       user_id INTEGER NOT NULL, is_pinned BOOLEAN, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE skateparks (id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, address VARCHAR(200) NOT NULL,
+       description TEXT NOT NULL, lat FLOAT NOT NULL, lng FLOAT NOT NULL, created_at DATETIME, created_by INTEGER,
+       PRIMARY KEY (id), FOREIGN KEY(created_by) REFERENCES users (id))""",
+    """CREATE TABLE comments (id INTEGER NOT NULL, content TEXT NOT NULL, created DATETIME, trick_id INTEGER NOT NULL,
+       user_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(trick_id) REFERENCES tricks (id),
+       FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE forum_replies (id INTEGER NOT NULL, content TEXT NOT NULL, created DATETIME,
+       topic_id INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (id),
+       FOREIGN KEY(topic_id) REFERENCES forum_topics (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE trick_upvotes (id INTEGER NOT NULL, user_id INTEGER NOT NULL, trick_id INTEGER NOT NULL,
+       created_at DATETIME, PRIMARY KEY (id), CONSTRAINT unique_trick_upvote UNIQUE (user_id, trick_id),
+       FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(trick_id) REFERENCES tricks (id))""",
+    """CREATE TABLE reply_upvotes (id INTEGER NOT NULL, user_id INTEGER NOT NULL, reply_id INTEGER NOT NULL,
+       created_at DATETIME, PRIMARY KEY (id), CONSTRAINT unique_reply_upvote UNIQUE (user_id, reply_id),
+       FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(reply_id) REFERENCES forum_replies (id))""",
+]
+ORIGINAL_ROWS = [
+    "INSERT INTO users (id, email, username, password) VALUES (1, 'a@example.com', 'alice', 'x'), (2, 'b@example.com', 'bob', 'x')",
+    "INSERT INTO tricks (id, title, description, video_url, difficulty, user_id) VALUES (1, 'Ollie', 'd', 'u', 'beginner', 1)",
+    "INSERT INTO trick_upvotes (user_id, trick_id) VALUES (1, 1), (2, 1)",
+    "INSERT INTO comments (content, trick_id, user_id) VALUES ('nice', 1, 2)",
+    "INSERT INTO forum_topics (id, title, user_id) VALUES (1, 'Spots', 1)",
+    "INSERT INTO forum_replies (id, content, topic_id, user_id) VALUES (1, 'a', 1, 2), (2, 'b', 1, 2)",
+    "INSERT INTO reply_upvotes (user_id, reply_id) VALUES (1, 1)",
+    "INSERT INTO skateparks (name, address, description, lat, lng) VALUES ('Paris', 'a', 'd', 48.8566, 2.3522)",
+]
+
+class VoterStore:
+    """Stands in for upvotes.RedisBackend: the voters of each item and the toggles waiting to be flushed"""
+
+    def __init__(self):
+        self.voters, self.changes = {}, {}
+
+    def load(self, key, user_ids):
+        if key not in self.voters:
+            self.voters[key] = set(user_ids)
+            for user_id, upvoted in self.changes.get(key, {}).items():
+                (self.voters[key].add if upvoted else self.voters[key].discard)(user_id)
+
+    def toggle(self, key, user_id):
+        voters = self.voters.get(key)
+        if voters is None:
+            return None
+        upvoted = user_id not in voters
+        (voters.add if upvoted else voters.discard)(user_id)
+        self.changes.setdefault(key, {})[user_id] = upvoted
+        return upvoted, len(voters)
+
+    def status(self, key, user_id):
+        voters = self.voters.get(key)
+        return None if voters is None else (user_id in voters, len(voters))
+
+    def count(self, key):
+        voters = self.voters.get(key)
+        return None if voters is None else len(voters)
+
+    def pending(self):
+        return {key: dict(users) for key, users in self.changes.items()}
+
+    def waiting(self, keys):
+        return [key for key in keys if key in self.changes]
+
+    def settle(self, key, users):
+        current = self.changes.get(key, {})
+        for user_id, upvoted in users.items():
+            if current.get(user_id) == upvoted:
+                del current[user_id]
+        if not current:
+            self.changes.pop(key, None)
+
+    def forget(self, key):
+        self.voters.pop(key, None)
+        self.changes.pop(key, None)
 
 class APITestCase(unittest.TestCase):
     def setUp(self):
         self.app = app
         self.client = self.app.test_client()
-        self.app.config['TESTING'] = True
-        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        limiter.reset()
         with self.app.app_context():
             db.create_all()
 
@@ -24,6 +147,39 @@ class APITestCase(unittest.TestCase):
             "password": password
         })
 
+    def create_user(self, username="skater", is_admin=False):
+        with self.app.app_context():
+            user = User(email=f"{username}@example.com", username=username,
+                        password="x", is_verified=True, is_admin=is_admin)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+
+    def auth_headers(self, user_id):
+        with self.app.app_context():
+            return {'Authorization': f'Bearer {generate_access_token(user_id)}'}
+
+    @contextmanager
+    def count_queries(self):
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+    @contextmanager
+    def assertQueryCount(self, expected):
+        """Fail unless the block runs expected statements, besides the ETag version lookups"""
+        with self.count_queries() as statements:
+            yield
+        statements = [s for s in statements if 'resource_versions' not in s]
+        self.assertEqual(len(statements), expected, statements)
+
     def test_register(self):
         response = self.register_user()
         self.assertEqual(response.status_code, 201)
@@ -55,9 +211,1009 @@ class APITestCase(unittest.TestCase):
         data = response.get_json()
         self.assertIsInstance(data, list)
 
+    def test_leaderboards_rankings(self):
+        alice = self.create_user("alice")
+        bob = self.create_user("bob")
+        with self.app.app_context():
+            trick = Trick(title="Ollie", description="d", video_url="u", user_id=alice)
+            topic = ForumTopic(title="Spots", user_id=bob)
+            db.session.add_all([trick, topic])
+            db.session.commit()
+            db.session.add_all([
+                Trick(title="Heelflip", description="d", video_url="u", user_id=alice),
+                Comment(content="nice", trick_id=trick.id, user_id=bob),
+                ForumReply(content="+1", topic_id=topic.id, user_id=alice),
+            ])
+            db.session.commit()
+            leaderboards.rebuild_snapshot()
+        data = self.client.get('/leaderboards').get_json()
+        self.assertEqual(data['trick_contributors'][0], {
+            'user_id': alice, 'username': 'alice', 'region': None, 'count': 2
+        })
+        self.assertEqual([u['user_id'] for u in data['commenters']], [bob])
+        self.assertEqual([(u['user_id'], u['count']) for u in data['forum_participants']],
+                         [(alice, 1), (bob, 1)])
+        self.assertEqual(len(data['top_upvoted_tricks']), 2)
+
+    def test_leaderboards_query_count_is_constant(self):
+        self.create_user("first")
+        with self.count_queries() as statements:
+            self.client.get('/leaderboards')
+        baseline = len(statements)
+        for i in range(20):
+            user_id = self.create_user(f"user{i}")
+            with self.app.app_context():
+                db.session.add(Trick(title="t", description="d", video_url="u", user_id=user_id))
+                db.session.commit()
+        with self.count_queries() as statements:
+            self.client.get('/leaderboards')
+        self.assertEqual(len(statements), baseline)
+
+    def test_listings_do_not_load_authors_per_item(self):
+        user_ids = [self.create_user(f"user{i}") for i in range(5)]
+        with self.app.app_context():
+            trick = Trick(title="t", description="d", video_url="u", user_id=user_ids[0])
+            topic = ForumTopic(title="Topic", description="d", user_id=user_ids[0])
+            db.session.add_all([trick, topic])
+            db.session.flush()
+            trick_id, topic_id = trick.id, topic.id
+            for user_id in user_ids:
+                db.session.add(Comment(content="c", trick_id=trick_id, user_id=user_id))
+                db.session.add(ForumTopic(title="More", description="d", user_id=user_id))
+                db.session.add(ForumReply(content="r", topic_id=topic_id, user_id=user_id))
+            db.session.commit()
+
+        with self.assertQueryCount(1):
+            comments = self.client.get(f'/tricks/{trick_id}/comments').get_json()
+        self.assertEqual(sorted(c['username'] for c in comments), [f"user{i}" for i in range(5)])
+        self.assertEqual(set(comments[0]), {'id', 'content', 'created', 'created_at', 'trick_id',
+                                            'user_email', 'username', 'region'})
+        with self.assertQueryCount(1):
+            topics = self.client.get('/forum/topics?limit=3').get_json()
+        self.assertEqual(len(topics['items']), 3)
+        self.assertIsNotNone(topics['next_cursor'])
+        with self.assertQueryCount(1):
+            replies = self.client.get(f'/forum/topics/{topic_id}/replies').get_json()
+        self.assertEqual([r['username'] for r in replies], [f"user{i}" for i in range(5)])
+        self.assertEqual(set(replies[0]), {'id', 'content', 'created', 'topic_id', 'user_id',
+                                           'username', 'user_region', 'upvote_count'})
+        self.assertEqual(self.client.get(f'/forum/topics/{topic_id}').get_json()['username'], 'user0')
+        self.assertEqual(self.client.get('/forum/topics/999').status_code, 404)
+
+    def test_deletes_cascade_in_the_database(self):
+        admin = self.create_user("admin", is_admin=True)
+        headers = self.auth_headers(admin)
+        voters = [self.create_user(f"voter{i}") for i in range(3)]
+
+        def thread(replies):
+            with self.app.app_context():
+                topic = ForumTopic(title="Thread", user_id=admin)
+                trick = Trick(title="t", description="d", video_url="u", user_id=admin)
+                db.session.add_all([topic, trick])
+                db.session.flush()
+                for i in range(replies):
+                    reply = ForumReply(content="r", topic_id=topic.id, user_id=voters[i % 3])
+                    db.session.add(reply)
+                    db.session.flush()
+                    db.session.add_all([ReplyUpvote(user_id=voter, reply_id=reply.id) for voter in voters])
+                    db.session.add(Comment(content="c", trick_id=trick.id, user_id=voters[i % 3]))
+                    if i < len(voters):
+                        db.session.add(TrickUpvote(user_id=voters[i], trick_id=trick.id))
+                db.session.commit()
+                return topic.id, trick.id
+
+        def delete_statements(replies):
+            topic_id, trick_id = thread(replies)
+            with self.count_queries() as statements:
+                self.assertEqual(self.client.delete(f'/admin/forum/topics/{topic_id}', headers=headers).status_code, 200)
+                self.assertEqual(self.client.delete(f'/admin/tricks/{trick_id}', headers=headers).status_code, 200)
+            return len(statements)
+
+        # Only the leaderboard adjustments depend on the thread, once per distinct author
+        self.assertEqual(delete_statements(3), delete_statements(30))
+        with self.app.app_context():
+            self.assertEqual([ForumReply.query.count(), ReplyUpvote.query.count(),
+                              Comment.query.count(), TrickUpvote.query.count()], [0, 0, 0, 0])
+        self.assertIn(('reply_upvotes', 'reply_id', 'forum_replies', 'id'), migrations.CASCADING_FOREIGN_KEYS)
+
+    def test_admin_bulk_delete_streams_results(self):
+        admin = self.create_user("admin", is_admin=True)
+        headers = self.auth_headers(admin)
+        spammer = self.create_user("spammer")
+        regular = self.create_user("regular")
+        spam_headers = self.auth_headers(spammer)
+        topic_id = self.client.post('/forum/topics', headers=self.auth_headers(regular),
+                                    json={'title': 'Legit'}).get_json()['id']
+        for i in range(4):
+            self.client.post(f'/forum/topics/{topic_id}/replies', headers=spam_headers, json={'content': f'spam {i}'})
+        spam_topic = self.client.post('/forum/topics', headers=spam_headers, json={'title': 'Spam'}).get_json()['id']
+        self.client.post(f'/forum/topics/{spam_topic}/replies', headers=self.auth_headers(regular),
+                         json={'content': 'reply to spam'})
+        with self.app.app_context():
+            trick = Trick(title="t", description="d", video_url="u", user_id=regular)
+            db.session.add(trick)
+            db.session.commit()
+            trick_id = trick.id
+        comment_id = self.client.post(f'/tricks/{trick_id}/comments', headers=spam_headers,
+                                      json={'content': 'spam'}).get_json()['id']
+        self.assertEqual(self.client.get('/forum/topics').headers['X-Cache'], 'MISS')
+
+        # Selections over the limit are refused after reading one item past it
+        with unittest.mock.patch('moderation.MAX_ITEMS', 2), self.count_queries() as statements:
+            response = self.client.post('/admin/moderation/delete', headers=headers, json={'user_id': spammer})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(statements and all('LIMIT' in statement for statement in statements))
+
+        with unittest.mock.patch('moderation.CHUNK_SIZE', 3):
+            response = self.client.post('/admin/moderation/delete', headers=headers,
+                                        json={'user_id': spammer, 'since': '2000-01-01T00:00:00Z', 'tricks': [999]})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['done'] for line in lines], [3, 6, 7, 7])
+        results = [result for line in lines[:-1] for result in line['results']]
+        self.assertIn({'type': 'tricks', 'id': 999, 'status': 'not_found'}, results)
+        self.assertIn({'type': 'comments', 'id': comment_id, 'status': 'deleted'}, results)
+        self.assertEqual(lines[-1]['summary'], {'deleted': 6, 'not_found': 1, 'error': 0})
+
+        topics = self.client.get('/forum/topics').get_json()
+        self.assertEqual([(t['id'], t['reply_count']) for t in topics], [(topic_id, 0)])
+        with self.app.app_context():
+            self.assertEqual(ForumReply.query.count(), 0)
+            self.assertEqual(Comment.query.count(), 0)
+        forum = {u['user_id']: u['count'] for u in self.client.get('/leaderboards').get_json()['forum_participants']}
+        self.assertEqual(forum, {regular: 1})
+
+        self.assertEqual(self.client.post('/admin/moderation/delete', headers=headers,
+                                          json={'tricks': ['x']}).status_code, 400)
+        self.assertEqual(self.client.post('/admin/moderation/delete', headers=spam_headers,
+                                          json={'tricks': [trick_id]}).status_code, 403)
+
+    def test_migrations_upgrade_the_original_schema(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        names = [name for _, name, _ in migrations.MIGRATIONS]
+        with self.app.app_context():
+            fresh = create_engine(f'sqlite:///{directory}/fresh.db')
+            self.assertEqual(migrations.upgrade(fresh), names)
+            self.assertEqual(migrations.upgrade(fresh), [])
+            self.assertSchemaMatchesModels(fresh)
+            fresh.dispose()
+
+            engine = create_engine(f'sqlite:///{directory}/original.db')
+            with engine.begin() as connection:
+                for statement in ORIGINAL_SCHEMA + ORIGINAL_ROWS:
+                    connection.exec_driver_sql(statement)
+            self.assertEqual(migrations.upgrade(engine), names)
+            self.assertEqual(migrations.upgrade(engine), [])
+            self.assertSchemaMatchesModels(engine)
+
+        with engine.connect() as connection:
+            self.assertEqual(migrations.applied_versions(connection),
+                             {version for version, _, _ in migrations.MIGRATIONS})
+            self.assertEqual(connection.exec_driver_sql('SELECT upvote_count FROM tricks').scalar(), 2)
+            self.assertEqual(connection.exec_driver_sql('SELECT reply_count FROM forum_topics').scalar(), 2)
+            self.assertEqual(connection.exec_driver_sql('SELECT upvote_count FROM forum_replies ORDER BY id').scalars().all(), [1, 0])
+            self.assertEqual(connection.exec_driver_sql('SELECT geohash FROM skateparks').scalar(), encode_geohash(48.8566, 2.3522))
+            self.assertEqual(set(connection.exec_driver_sql('SELECT board, subject_id, total FROM leaderboard_counters').all()), {
+                ('tricks', 1, 1), ('trick_upvotes', 1, 2), ('comments', 2, 1),
+                ('topics', 1, 1), ('forum', 1, 1), ('forum', 2, 2)
+            })
+            # The foreign keys cascade once the definitions of the original tables are edited
+            connection.exec_driver_sql('DELETE FROM forum_topics')
+            self.assertEqual(connection.exec_driver_sql('SELECT COUNT(*) FROM reply_upvotes').scalar(), 0)
+            connection.rollback()
+        engine.dispose()
+
+    def assertSchemaMatchesModels(self, engine):
+        """The migrated database has the tables, columns, cascades and SQLite indexes the models declare"""
+        indexes = [index for _, _, migrate in migrations.MIGRATIONS
+                   if isinstance(migrate, migrations.CreateIndexes) for index in migrate.indexes]
+        self.assertEqual({name for name, _, _, _ in indexes}, {index.name for table in db.metadata.sorted_tables for index in table.indexes})
+        postgres_only = {name for name, _, _, dialect in indexes if dialect == 'postgresql'}
+        inspector = inspect(engine)
+        self.assertEqual(set(inspector.get_table_names()), set(db.metadata.tables))
+        for table in db.metadata.sorted_tables:
+            self.assertEqual({c['name'] for c in inspector.get_columns(table.name)}, set(table.c.keys()), table.name)
+            self.assertEqual({index['name'] for index in inspector.get_indexes(table.name)},
+                             {index.name for index in table.indexes} - postgres_only, table.name)
+            self.assertEqual({(fk['constrained_columns'][0], (fk['options'].get('ondelete') or '').upper())
+                              for fk in inspector.get_foreign_keys(table.name)},
+                             {(fk.parent.name, (fk.ondelete or '').upper()) for fk in table.foreign_keys}, table.name)
+
+    def simulate_table_sizes(self, rows):
+        """Make SQLite plan queries as if every table held rows rows, by writing its statistics"""
+        with self.app.app_context():
+            connection = db.session.connection()
+            connection.exec_driver_sql('ANALYZE')
+            connection.exec_driver_sql('DELETE FROM sqlite_stat1')
+            for table in db.metadata.sorted_tables:
+                connection.exec_driver_sql('INSERT INTO sqlite_stat1 VALUES (?, NULL, ?)', (table.name, str(rows)))
+                for index in connection.exec_driver_sql(f'PRAGMA index_list({table.name})').all():
+                    columns = len(connection.exec_driver_sql(f'PRAGMA index_info({index.name})').all())
+                    # About ten rows per value of the leading column, unique beyond it
+                    stat = ' '.join([str(rows), '10'] + ['1'] * (columns - 1))
+                    connection.exec_driver_sql('INSERT INTO sqlite_stat1 VALUES (?, ?, ?)', (table.name, index.name, stat))
+            connection.exec_driver_sql('ANALYZE sqlite_schema')
+            db.session.commit()
+
+    def assertIndexedPlans(self, statements):
+        with self.app.app_context():
+            connection = db.session.connection()
+            for statement, parameters in statements:
+                plan = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                for row in plan:
+                    self.assertNotRegex(row.detail, r'^SCAN \w+$', statement)
+                    self.assertNotIn('TEMP B-TREE', row.detail, statement)
+
+    def test_hot_routes_use_indexes_at_a_million_rows(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        with self.app.app_context():
+            trick = Trick(title="Ollie", description="d", video_url="u", user_id=alice)
+            topic = ForumTopic(title="Topic", user_id=alice)
+            db.session.add_all([trick, topic])
+            db.session.commit()
+            trick_id, topic_id = trick.id, topic.id
+        self.simulate_table_sizes(1_000_000)
+
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            for path in ('/tricks?limit=20', f'/tricks/{trick_id}/comments?limit=20', '/forum/topics?limit=20',
+                         f'/forum/topics/{topic_id}/replies?limit=20', '/forum/search?limit=20',
+                         f'/tricks/upvote-status?ids={trick_id}', '/leaderboards'):
+                self.assertEqual(self.client.get(path, headers=headers).status_code, 200, path)
+            with self.app.app_context():
+                for content_type in moderation.CONTENT_TYPES:
+                    content_type.ids_by_user(alice, datetime.datetime(2000, 1, 1))
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        # Every foreign key is looked up by cascades and by the per-user queries
+        for table in db.metadata.sorted_tables:
+            for fk in table.foreign_keys:
+                statements.append((f'SELECT id FROM {table.name} WHERE {fk.parent.name} = ?', (1,)))
+        self.assertIndexedPlans(statements)
+
+    def test_live_events_stream_new_comments_and_replies(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        with self.app.app_context():
+            trick = Trick(title="Ollie", description="d", video_url="u", user_id=alice)
+            topic = ForumTopic(title="Topic", user_id=alice)
+            db.session.add_all([trick, topic])
+            db.session.commit()
+            trick_id, topic_id = trick.id, topic.id
+
+        def read_event(stream):
+            chunk = next(stream).decode()
+            event, data = chunk.strip().split('\n')
+            return event.split(': ', 1)[1], json.loads(data.split(': ', 1)[1])
+
+        response = self.client.get(f'/tricks/{trick_id}/events', buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = iter(response.response)
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        self.assertEqual(live_events.subscriber_count(), 1)
+
+        comment = self.client.post(f'/tricks/{trick_id}/comments', headers=headers, json={'content': 'Nice'}).get_json()
+        self.assertEqual(read_event(stream), ('comment', comment))
+        self.client.post(f'/tricks/{trick_id}/upvote', headers=headers)
+        self.assertEqual(read_event(stream), ('upvote', {'trick_id': trick_id, 'delta': 1, 'upvote_count': 1}))
+
+        live_events.heartbeat = 0.01
+        try:
+            self.assertEqual(next(stream), b': keep-alive\n\n')
+        finally:
+            live_events.heartbeat = events.DEFAULT_HEARTBEAT_SECONDS
+        response.close()
+        self.assertEqual(live_events.subscriber_count(), 0)
+
+        response = self.client.get(f'/forum/topics/{topic_id}/events', buffered=False)
+        stream = iter(response.response)
+        next(stream)
+        self.client.post(f'/tricks/{trick_id}/comments', headers=headers, json={'content': 'Elsewhere'})
+        reply = self.client.post(f'/forum/topics/{topic_id}/replies', headers=headers,
+                                 json={'content': 'First'}).get_json()
+        self.assertEqual(read_event(stream), ('reply', reply))
+        response.close()
+
+        self.assertEqual(self.client.get('/forum/topics/999/events').status_code, 404)
+
+    def test_live_events_reset_slow_subscribers(self):
+        broker = events.LiveEvents(events.MemoryBackend(), heartbeat=0.01, max_pending=2)
+        stream = broker.stream('topic:1')
+        next(stream)
+        for i in range(3):
+            broker.publish('topic:1', 'reply', {'id': i})
+        self.assertEqual(next(stream), events.format_event('reset', {}))
+        self.assertEqual(list(stream), [])
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_leaderboard_snapshot_tracks_writes(self):
+        alice = self.create_user("alice")
+        bob = self.create_user("bob")
+        headers = self.auth_headers(alice)
+        trick_id = self.client.post('/create-trick', headers=headers, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        }).get_json()['id']
+        self.client.post(f'/tricks/{trick_id}/comments', headers=self.auth_headers(bob), json={"content": "nice"})
+        self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(bob))
+        topic_id = self.client.post('/forum/topics', headers=headers, json={"title": "Spots"}).get_json()['id']
+        self.client.post(f'/forum/topics/{topic_id}/replies', headers=self.auth_headers(bob), json={"content": "+1"})
+        self.client.post('/forum/topics', headers=self.auth_headers(bob), json={"title": "Gear"})
+
+        with self.app.app_context():
+            self.assertEqual(leaderboards.read_leaderboards(), leaderboards.compute_leaderboards())
+
+        self.client.delete(f'/tricks/{trick_id}', headers=headers)
+        with self.app.app_context():
+            snapshot = leaderboards.read_leaderboards()
+            self.assertEqual(snapshot, leaderboards.compute_leaderboards())
+            self.assertEqual(snapshot['commenters'], [])
+            self.assertEqual(snapshot['top_upvoted_tricks'], [])
+
+    def test_counter_columns_follow_writes(self):
+        alice = self.create_user("alice")
+        bob = self.create_user("bob")
+        headers = self.auth_headers(alice)
+        trick_id = self.client.post('/create-trick', headers=headers, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        }).get_json()['id']
+        self.assertEqual(self.client.post(f'/tricks/{trick_id}/upvote', headers=headers).get_json()['upvote_count'], 1)
+        self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(bob))
+        self.assertEqual(self.client.post(f'/tricks/{trick_id}/upvote', headers=headers).get_json()['upvote_count'], 1)
+
+        topic_id = self.client.post('/forum/topics', headers=headers, json={"title": "Spots"}).get_json()['id']
+        reply_id = self.client.post(f'/forum/topics/{topic_id}/replies', headers=headers, json={"content": "a"}).get_json()['id']
+        self.client.post(f'/forum/topics/{topic_id}/replies', headers=headers, json={"content": "b"})
+        self.assertEqual(self.client.post(f'/replies/{reply_id}/upvote', headers=headers).get_json()['upvote_count'], 1)
+        self.assertEqual(self.client.get(f'/forum/topics/{topic_id}').get_json()['reply_count'], 2)
+
+        with self.count_queries() as statements:
+            tricks = self.client.get('/tricks').get_json()
+            self.client.get('/forum/topics')
+        self.assertEqual(tricks[0]['upvote_count'], 1)
+        self.assertFalse(any('trick_upvotes' in sql or 'forum_replies' in sql for sql in statements))
+
+        with self.app.app_context():
+            db.session.execute(Trick.__table__.update().values(upvote_count=42))
+            db.session.commit()
+            backfill_counters()
+            self.assertEqual(db.session.get(Trick, trick_id).upvote_count, 1)
+
+    def test_upvotes_are_flushed_in_batches(self):
+        alice = self.create_user("alice")
+        bob = self.create_user("bob")
+        trick_id = self.client.post('/create-trick', headers=self.auth_headers(alice), json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        }).get_json()['id']
+        doomed_id = self.client.post('/create-trick', headers=self.auth_headers(alice), json={
+            "name": "Kickflip", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        }).get_json()['id']
+
+        # Without Redis, toggles are written at once whatever the interval
+        with unittest.mock.patch.object(upvote_buffer, 'interval', 60):
+            self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(alice))
+            self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(alice))
+            with self.app.app_context():
+                self.assertEqual(TrickUpvote.query.count(), 0)
+
+        with unittest.mock.patch.object(upvote_buffer, 'interval', 60), \
+                unittest.mock.patch.object(upvote_buffer, 'backend', VoterStore()), \
+                unittest.mock.patch.object(upvote_buffer, '_start_flusher') as start_flusher:
+            self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(alice))
+            self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(bob))
+            # The item was found when its voters were loaded; later toggles don't touch the database
+            bob_headers = self.auth_headers(bob)
+            with self.count_queries() as statements:
+                self.client.post(f'/tricks/{trick_id}/upvote', headers=bob_headers)
+            self.assertEqual(statements, [])
+            response = self.client.post(f'/tricks/{trick_id}/upvote', headers=self.auth_headers(bob)).get_json()
+            self.assertEqual((response['upvoted'], response['upvote_count']), (True, 2))
+            self.client.post(f'/tricks/{doomed_id}/upvote', headers=self.auth_headers(bob))
+            self.assertTrue(start_flusher.called)
+
+            status = self.client.get(f'/tricks/{trick_id}/upvote-status', headers=self.auth_headers(alice)).get_json()
+            self.assertEqual(status, {'upvoted': True, 'upvote_count': 2})
+            # Batch statuses and listings include the toggles not written yet
+            statuses = self.client.get('/tricks/upvote-status', headers=self.auth_headers(alice),
+                                       query_string={'ids': f'{trick_id},{doomed_id}'}).get_json()
+            self.assertEqual(statuses, {str(trick_id): {'upvoted': True, 'upvote_count': 2},
+                                        str(doomed_id): {'upvoted': False, 'upvote_count': 1}})
+            listed = {t['id']: t for t in self.client.get('/tricks', headers=self.auth_headers(alice)).get_json()}
+            self.assertEqual((listed[trick_id]['upvoted'], listed[trick_id]['upvote_count']), (True, 2))
+            self.assertEqual(self.client.get(f'/tricks/{trick_id}').get_json()['upvote_count'], 2)
+            with self.app.app_context():
+                self.assertEqual(TrickUpvote.query.count(), 0)
+                self.assertEqual(db.session.get(Trick, trick_id).upvote_count, 0)
+
+            self.client.delete(f'/tricks/{doomed_id}', headers=self.auth_headers(alice))
+            with self.app.app_context():
+                # A worker dying between commit and settle leaves the batch pending; writing it again changes nothing
+                with unittest.mock.patch.object(upvote_buffer.backend, 'settle'):
+                    self.assertEqual(upvote_buffer.flush(), 3)
+                self.assertEqual(upvote_buffer.flush(), 2)
+                self.assertEqual(upvote_buffer.flush(), 0)
+                self.assertEqual({row.user_id for row in TrickUpvote.query.all()}, {alice, bob})
+                self.assertEqual(db.session.get(Trick, trick_id).upvote_count, 2)
+                self.assertEqual(leaderboards.read_leaderboards(), leaderboards.compute_leaderboards())
+            self.assertEqual(self.client.get('/tricks').get_json()[0]['upvote_count'], 2)
+            self.assertEqual(self.client.post(f'/tricks/{doomed_id}/upvote',
+                                              headers=self.auth_headers(bob)).status_code, 404)
+
+    def collect_pages(self, url, limit=2):
+        items, cursor = [], None
+        while True:
+            params = {'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.client.get(url, query_string=params).get_json()
+            self.assertLessEqual(len(page['items']), limit)
+            items.extend(page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return items
+
+    def test_cursor_pagination(self):
+        alice = self.create_user("alice")
+        with self.app.app_context():
+            topics = [ForumTopic(title=f"Topic {i}", user_id=alice, is_pinned=(i == 1)) for i in range(5)]
+            db.session.add_all(topics + [
+                Trick(title=f"Trick {i}", description="d", video_url="u", user_id=alice) for i in range(5)
+            ])
+            db.session.commit()
+            db.session.add_all([ForumReply(content=str(i), topic_id=topics[0].id, user_id=alice) for i in range(5)])
+            db.session.commit()
+            topic_id = topics[0].id
+
+        for url in ['/tricks', '/forum/topics', f'/forum/topics/{topic_id}/replies']:
+            self.assertEqual(self.collect_pages(url), self.client.get(url).get_json())
+        self.assertTrue(self.collect_pages('/forum/topics')[0]['is_pinned'])
+        replies = self.collect_pages(f'/forum/topics/{topic_id}/replies', limit=3)
+        self.assertEqual([r['content'] for r in replies], ['0', '1', '2', '3', '4'])
+
+        response = self.client.get('/tricks', query_string={'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        # Well-formed cursors whose values don't fit the sort columns
+        for url, values in [('/forum/topics', ['yes', '2024-01-01T00:00:00', 1]),
+                            ('/forum/topics', [True, '2024-01-01T00:00:00', True]),
+                            ('/tricks', [1, 1]), ('/tricks', ['2024-01-01T00:00:00', 'x'])]:
+            response = self.client.get(url, query_string={'cursor': encode_cursor(values)})
+            self.assertEqual(response.status_code, 400, values)
+
+    def test_batch_upvote_status(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        with self.app.app_context():
+            tricks = [Trick(title=f"Trick {i}", description="d", video_url="u", user_id=alice) for i in range(3)]
+            db.session.add_all(tricks)
+            db.session.commit()
+            ids = [trick.id for trick in tricks]
+        self.client.post(f'/tricks/{ids[0]}/upvote', headers=headers)
+
+        with self.count_queries() as statements:
+            response = self.client.get('/tricks/upvote-status', headers=headers,
+                                       query_string={'ids': ','.join(map(str, ids + [999]))})
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(response.get_json(), {
+            str(ids[0]): {'upvoted': True, 'upvote_count': 1},
+            str(ids[1]): {'upvoted': False, 'upvote_count': 0},
+            str(ids[2]): {'upvoted': False, 'upvote_count': 0},
+        })
+        self.assertEqual(self.client.get('/tricks/upvote-status', headers=headers,
+                                         query_string={'ids': 'a,b'}).status_code, 400)
+
+        listed = {t['id']: t['upvoted'] for t in self.client.get('/tricks', headers=headers).get_json()}
+        self.assertEqual(listed, {ids[0]: True, ids[1]: False, ids[2]: False})
+        self.assertNotIn('upvoted', self.client.get('/tricks').get_json()[0])
+
+    def test_search_ranks_and_paginates(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        for name, description in [("Kickflip", "flip the board with your toes"),
+                                  ("Heelflip", "flip with the heel"),
+                                  ("Ollie", "the basic jump")]:
+            self.client.post('/create-trick', headers=headers, json={
+                "name": name, "description": description, "videoUrl": "u", "difficulty": "beginner"
+            })
+        results = self.client.get('/tricks/search', query_string={'q': 'flip'}).get_json()
+        self.assertEqual({t['title'] for t in results}, {"Kickflip", "Heelflip"})
+        self.assertEqual([t['title'] for t in self.client.get('/tricks/search', query_string={'q': 'kick'}).get_json()],
+                         ["Kickflip"])
+        self.assertEqual(self.client.get('/tricks/search', query_string={'q': 'toes heel'}).get_json(), [])
+
+        first = self.client.get('/tricks/search', query_string={'q': 'flip', 'limit': 1}).get_json()
+        second = self.client.get('/tricks/search', query_string={
+            'q': 'flip', 'limit': 1, 'cursor': first['next_cursor']
+        }).get_json()
+        self.assertEqual(first['items'] + second['items'], results)
+        self.assertIsNone(second['next_cursor'])
+
+        topic_id = self.client.post('/forum/topics', headers=headers, json={"title": "Best spots"}).get_json()['id']
+        self.client.post('/forum/topics', headers=headers, json={"title": "Bearings"})
+        reply_id = self.client.post(f'/forum/topics/{topic_id}/replies', headers=headers,
+                                    json={"content": "Try the ledges downtown"}).get_json()['id']
+        found = self.client.get('/forum/search', query_string={'q': 'ledges'}).get_json()
+        self.assertEqual([t['id'] for t in found], [topic_id])
+
+        self.create_user("admin", is_admin=True)
+        with self.app.app_context():
+            admin_id = User.query.filter_by(username="admin").first().id
+        self.client.delete(f'/admin/forum/replies/{reply_id}', headers=self.auth_headers(admin_id))
+        self.assertEqual(self.client.get('/forum/search', query_string={'q': 'ledges'}).get_json(), [])
+
+    def test_trick_suggestions(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        ids = {}
+        for name in ["Kickflip", "Kickflip Underflip", "Heel Flip", "Ollie"]:
+            ids[name] = self.client.post('/create-trick', headers=headers, json={
+                "name": name, "description": "d", "videoUrl": "u", "difficulty": "beginner"
+            }).get_json()['id']
+
+        suggestions = self.client.get('/tricks/suggest', query_string={'q': 'kickflp'}).get_json()
+        self.assertEqual(suggestions, [{'id': ids["Kickflip"], 'title': "Kickflip"},
+                                       {'id': ids["Kickflip Underflip"], 'title': "Kickflip Underflip"}])
+        self.assertEqual([s['title'] for s in self.client.get('/tricks/suggest', query_string={'q': 'fli'}).get_json()],
+                         ["Heel Flip"])
+        self.assertEqual(self.client.get('/tricks/suggest', query_string={'q': 'kick', 'limit': 1}).get_json(),
+                         [{'id': ids["Kickflip"], 'title': "Kickflip"}])
+
+        self.client.delete(f'/tricks/{ids["Kickflip"]}', headers=headers)
+        self.assertEqual([s['title'] for s in self.client.get('/tricks/suggest', query_string={'q': 'kickflp'}).get_json()],
+                         ["Kickflip Underflip"])
+
+    def test_search_indexes_only_see_committed_tricks(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        self.client.post('/create-trick', headers=headers, json={
+            "name": "Kickflip", "description": "flip", "videoUrl": "u", "difficulty": "beginner"
+        })
+        self.assertEqual(len(self.client.get('/tricks/search', query_string={'q': 'flip'}).get_json()), 1)
+        self.assertEqual(self.client.get('/tricks/suggest', query_string={'q': 'heel'}).get_json(), [])
+
+        with self.app.app_context():
+            db.session.add(Trick(title="Heel Flip", description="flip", video_url="u",
+                                 difficulty="beginner", user_id=alice))
+            db.session.flush()
+            db.session.rollback()
+        self.assertEqual([t['title'] for t in self.client.get('/tricks/search', query_string={'q': 'flip'}).get_json()],
+                         ["Kickflip"])
+        self.assertEqual(self.client.get('/tricks/suggest', query_string={'q': 'heel'}).get_json(), [])
+
+        with self.app.app_context():
+            db.session.add(Trick(title="Heel Flip", description="flip", video_url="u",
+                                 difficulty="beginner", user_id=alice))
+            db.session.commit()
+        self.assertEqual(len(self.client.get('/tricks/search', query_string={'q': 'flip'}).get_json()), 2)
+        self.assertEqual([s['title'] for s in self.client.get('/tricks/suggest', query_string={'q': 'heel'}).get_json()],
+                         ["Heel Flip"])
+
+    def create_skateparks(self, coordinates):
+        with self.app.app_context():
+            parks = [Skatepark(name=f"Park {i}", address="a", description="d", lat=lat, lng=lng)
+                     for i, (lat, lng) in enumerate(coordinates)]
+            db.session.add_all(parks)
+            db.session.commit()
+            return [park.id for park in parks]
+
+    def test_skateparks_by_area(self):
+        paris, lyon, new_york, fiji_east, fiji_west = self.create_skateparks([
+            (48.8566, 2.3522), (45.7640, 4.8357), (40.7128, -74.0060), (-17.0, 179.5), (-17.0, -179.5)
+        ])
+        france = self.client.get('/skateparks', query_string={
+            'south': 43, 'west': -2, 'north': 51, 'east': 6
+        }).get_json()
+        self.assertEqual([p['id'] for p in france], [paris, lyon])
+
+        near_paris = self.client.get('/skateparks', query_string={'lat': 48.85, 'lng': 2.35, 'radius': 50}).get_json()
+        self.assertEqual([p['id'] for p in near_paris], [paris])
+        self.assertLess(near_paris[0]['distance_km'], 1)
+
+        pacific = self.client.get('/skateparks', query_string={
+            'south': -20, 'west': 179, 'north': -10, 'east': -179
+        }).get_json()
+        self.assertEqual({p['id'] for p in pacific}, {fiji_east, fiji_west})
+        self.assertEqual(len(self.client.get('/skateparks').get_json()), 5)
+        self.assertEqual(self.client.get('/skateparks', query_string={'south': 1}).status_code, 400)
+
+    def test_skatepark_box_matches_full_scan(self):
+        rng = random.Random(7)
+        points = [(rng.uniform(-60, 60), rng.uniform(-180, 180)) for _ in range(300)]
+        ids = self.create_skateparks(points)
+        for _ in range(20):
+            south, north = sorted(rng.uniform(-70, 70) for _ in range(2))
+            west, east = rng.uniform(-180, 180), rng.uniform(-180, 180)
+            expected = {
+                park_id for park_id, (lat, lng) in zip(ids, points)
+                if south <= lat <= north and (west <= lng <= east if west <= east else (lng >= west or lng <= east))
+            }
+            found = self.client.get('/skateparks', query_string={
+                'south': south, 'west': west, 'north': north, 'east': east, 'limit': 2000
+            }).get_json()
+            self.assertEqual({p['id'] for p in found}, expected)
+
+        # A small limit still returns the nearest parks, and only a few times as many rows are read
+        box = {'south': -60, 'west': -180, 'north': 60, 'east': 180}
+        center = skateparks.box_center(*box.values())
+        nearest = sorted(zip(ids, points), key=lambda park: (haversine_km(*center, *park[1]), park[0]))[:5]
+        with self.count_queries() as queries:
+            found = self.client.get('/skateparks', query_string=dict(box, limit=5)).get_json()
+        self.assertEqual([p['id'] for p in found], [park_id for park_id, _ in nearest])
+        self.assertTrue(any('LIMIT' in q for q in queries if 'skateparks' in q))
+
+    def test_skatepark_clusters(self):
+        self.create_skateparks([(48.8566, 2.3522), (48.8600, 2.3400), (45.7640, 4.8357), (40.7128, -74.0060)])
+        europe = {'south': 40, 'west': -5, 'north': 55, 'east': 10}
+
+        def fetch(zoom, box=europe):
+            return self.client.get('/skateparks/clusters', query_string=dict(box, zoom=zoom))
+
+        clusters = fetch(4).get_json()['clusters']
+        self.assertEqual(sorted(c['count'] for c in clusters), [1, 2])
+        paris = next(c for c in clusters if c['count'] == 2)
+        self.assertAlmostEqual(paris['lat'], 48.8583, places=3)
+        self.assertNotIn('id', paris)
+
+        with self.count_queries() as queries:
+            fetch(4)
+        # Only the version lookup behind the ETag reaches the database
+        self.assertEqual([q for q in queries if 'resource_versions' not in q], [])
+
+        response = self.client.post('/create-skatepark', json={
+            'name': 'New', 'address': 'a', 'description': 'd', 'lat': 48.85, 'lng': 2.35
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(c['count'] for c in fetch(4).get_json()['clusters']), [1, 3])
+        # A park added through another worker only bumps the shared skateparks version
+        self.create_skateparks([(48.9000, 2.5000)])
+        self.assertEqual(sorted(c['count'] for c in fetch(4).get_json()['clusters']), [1, 4])
+
+        paris_box = {'south': 48.84, 'west': 2.33, 'north': 48.87, 'east': 2.36}
+        self.assertEqual([c['count'] for c in fetch(14, paris_box).get_json()['clusters']], [1, 1, 1])
+        self.assertEqual(fetch(16).status_code, 400)
+        self.assertEqual(fetch(30).status_code, 400)
+
+    def test_response_cache_tags(self):
+        before = response_cache.stats()['endpoints'].get('api.get_tricks', {'hits': 0, 'misses': 0, 'bypassed': 0})
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        trick_id = self.client.post('/create-trick', headers=headers, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        }).get_json()['id']
+        self.assertEqual(self.client.get('/tricks').headers['X-Cache'], 'MISS')
+        self.client.get('/forum/topics')
+        with self.count_queries() as statements:
+            response = self.client.get('/tricks')
+            self.client.get('/forum/topics')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual([s for s in statements if 'resource_versions' not in s], [])
+
+        self.client.post(f'/tricks/{trick_id}/upvote', headers=headers)
+        self.assertEqual(self.client.get('/tricks').get_json()[0]['upvote_count'], 1)
+        self.assertEqual(self.client.get('/forum/topics').headers['X-Cache'], 'HIT')
+        self.assertNotIn('X-Cache', self.client.get('/tricks', headers=headers).headers)
+
+        with self.app.app_context():
+            db.session.add(Skatepark(name="Park", address="a", description="d", lat=1, lng=2))
+            db.session.commit()
+        self.client.get('/skateparks')
+        with self.app.app_context():
+            db.session.add(Skatepark(name="Park 2", address="a", description="d", lat=1, lng=2))
+            db.session.commit()
+        self.assertEqual(len(self.client.get('/skateparks').get_json()), 2)
+
+        admin = self.create_user("admin", is_admin=True)
+        stats = self.client.get('/admin/cache/stats', headers=self.auth_headers(admin)).get_json()
+        self.assertEqual({outcome: count - before[outcome] for outcome, count in stats['endpoints']['api.get_tricks'].items()},
+                         {'hits': 1, 'misses': 2, 'bypassed': 1})
+
+    def test_conditional_get(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        self.client.post('/create-trick', headers=headers, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        })
+        topic_id = self.client.post('/forum/topics', headers=headers, json={"title": "Spots"}).get_json()['id']
+        reply_id = self.client.post(f'/forum/topics/{topic_id}/replies', headers=headers, json={"content": "a"}).get_json()['id']
+
+        etag = self.client.get('/tricks').headers['ETag']
+        with self.count_queries() as statements:
+            response = self.client.get('/tricks', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(statements), 1)
+
+        replies_etag = self.client.get(f'/forum/topics/{topic_id}/replies').headers['ETag']
+        self.client.post(f'/replies/{reply_id}/upvote', headers=headers)
+        self.assertEqual(self.client.get(f'/forum/topics/{topic_id}/replies', headers={'If-None-Match': replies_etag}).status_code, 200)
+        self.assertEqual(self.client.get('/tricks', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.client.post('/create-skatepark', json={'name': 'P', 'address': 'a', 'description': 'd', 'lat': 1, 'lng': 2})
+        with self.app.app_context():
+            ResourceVersion.query.update({'updated_at': datetime.datetime(2024, 1, 1)})
+            db.session.commit()
+        response = self.client.get('/skateparks')
+        self.assertEqual(response.headers['Last-Modified'], 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(self.client.get('/skateparks', headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code, 304)
+        self.client.post('/create-skatepark', json={'name': 'P', 'address': 'a', 'description': 'd', 'lat': 1, 'lng': 2})
+        self.assertEqual(self.client.get('/skateparks', headers={'If-None-Match': response.headers['ETag']}).status_code, 200)
+
+    def test_cached_bodies_follow_versions_bumped_by_other_workers(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        self.client.post('/create-trick', headers=headers, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        })
+        etag = self.client.get('/tricks').headers['ETag']
+        self.assertEqual(self.client.get('/tricks').headers['X-Cache'], 'HIT')
+
+        # Another worker's commit bumps the shared counters, not this worker's cache
+        with unittest.mock.patch.object(response_cache, 'invalidate'), self.app.app_context():
+            db.session.add(Trick(title="Kickflip", description="d", video_url="u", user_id=alice))
+            db.session.commit()
+        response = self.client.get('/tricks')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_versions_counted_by_a_shared_cache(self):
+        alice = self.create_user("alice")
+        headers = self.auth_headers(alice)
+        with unittest.mock.patch.object(response_cache.backend, 'shared', True):
+            etag = self.client.get('/tricks').headers['ETag']
+            with self.count_queries() as statements:
+                self.client.post('/create-trick', headers=headers, json={
+                    "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+                })
+            self.assertEqual([s for s in statements if 'resource_versions' in s], [])
+
+            response = self.client.get('/tricks', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            with self.count_queries() as statements:
+                response = self.client.get('/tricks', headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(statements, [])
+        with self.app.app_context():
+            self.assertEqual(ResourceVersion.query.count(), 0)
+
+    def test_email_outbox_worker(self):
+        sink = SMTPSink().start()
+        self.addCleanup(sink.stop)
+        self.assertEqual(self.register_user().status_code, 201)
+        self.client.post('/forgot-password', json={'email': 'test@example.com'})
+        self.assertEqual(sink.connections, 0)
+
+        mail = Mail()
+        self.addCleanup(self.app.extensions.__setitem__, 'mail', self.app.extensions['mail'])
+        self.app.extensions['mail'] = mail.init_mail({'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': sink.port})
+        sink.fail_next()
+        with self.app.app_context():
+            outbox.run_worker(mail, 'noreply@example.com', once=True)
+            statuses = [(e.status, e.attempts) for e in OutboxEmail.query.order_by(OutboxEmail.id)]
+            self.assertEqual(statuses, [('pending', 1), ('sent', 1)])
+            retry = OutboxEmail.query.filter_by(status='pending').one()
+            self.assertGreater(retry.next_attempt_at, datetime.datetime.utcnow())
+            retry.next_attempt_at = datetime.datetime.utcnow()
+            db.session.commit()
+            outbox.run_worker(mail, 'noreply@example.com', once=True)
+            self.assertEqual(OutboxEmail.query.filter_by(status='sent').count(), 2)
+
+        self.assertEqual(sink.connections, 2)
+        self.assertEqual(sorted(message['Subject'] for _, _, message in sink.messages),
+                         ['Vérification de votre compte WikiTricks', 'WikiTricks Password Reset'])
+
+    def test_google_auth_uses_cached_keys(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = dict(RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True), kid='k1', alg='RS256', use='sig')
+        source = StaticKeySource({'keys': [jwk]})
+        self.addCleanup(setattr, google_verifier, 'keys', google_verifier.keys)
+        google_verifier.keys = KeyCache(source)
+
+        def id_token(kid='k1', **claims):
+            now = int(datetime.datetime.utcnow().timestamp())
+            payload = dict({'iss': 'https://accounts.google.com', 'aud': google_verifier.client_id,
+                            'sub': '42', 'email': 'g@example.com', 'name': 'G', 'iat': now, 'exp': now + 600}, **claims)
+            return pyjwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token()}).status_code, 200)
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token()}).status_code, 200)
+        self.assertEqual(source.fetches, 1)
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token(aud='other')}).status_code, 401)
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token(exp=1)}).status_code, 401)
+        # Unknown key ids refetch the key set at most once a minute
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token(kid='k2')}).status_code, 401)
+        self.assertEqual(self.client.post('/auth/google', json={'token': id_token(kid='k2')}).status_code, 401)
+        self.assertEqual(source.fetches, 1)
+
+    def test_role_claims_authorize_without_user_lookup(self):
+        admin = self.create_user("admin", is_admin=True)
+        alice = self.create_user("alice")
+        with self.app.app_context():
+            trick = Trick(title="Ollie", description="d", video_url="u", user_id=alice)
+            db.session.add(trick)
+            db.session.commit()
+            trick_id = trick.id
+        admin_headers = self.auth_headers(admin)
+        alice_headers = self.auth_headers(alice)
+
+        with self.count_queries() as statements:
+            self.assertEqual(self.client.get('/admin/cache/stats', headers=admin_headers).status_code, 200)
+        self.assertEqual(statements, [])
+        self.assertEqual(self.client.get('/admin/cache/stats', headers=alice_headers).status_code, 403)
+
+        # Promoting alice makes her old token stale until she gets a new one
+        self.client.post(f'/admin/users/{alice}/toggle-admin', headers=admin_headers)
+        self.assertEqual(self.client.get('/admin/cache/stats', headers=alice_headers).status_code, 401)
+        alice_headers = self.auth_headers(alice)
+        self.assertEqual(self.client.get('/admin/cache/stats', headers=alice_headers).status_code, 200)
+
+        self.client.post(f'/admin/users/{alice}/toggle-admin', headers=admin_headers)
+        self.assertEqual(self.client.get('/admin/cache/stats', headers=alice_headers).status_code, 401)
+
+        with self.count_queries() as statements:
+            self.assertEqual(self.client.delete(f'/tricks/{trick_id}', headers=admin_headers).status_code, 200)
+        self.assertFalse([s for s in statements if 'FROM users' in s])
+
+    def test_login_rehashes_at_configured_cost(self):
+        self.addCleanup(setattr, password_hasher, 'rounds', password_hasher.rounds)
+        password_hasher.rounds = 4
+        with self.app.app_context():
+            db.session.add(User(email="a@example.com", username="a", is_verified=True,
+                                password=PasswordHasher(rounds=5).hash("secret")))
+            db.session.commit()
+        login = lambda password: self.client.post('/login', json={"email": "a@example.com", "password": password})
+        self.assertEqual(login("wrong").status_code, 401)
+        with self.app.app_context():
+            self.assertEqual(hash_rounds(User.query.one().password), 5)
+        self.assertEqual(login("secret").status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(hash_rounds(User.query.one().password), 4)
+        self.assertEqual(login("secret").status_code, 200)
+
+    def test_gevent_workers_hash_passwords_in_a_pool(self):
+        with unittest.mock.patch.dict(os.environ):
+            os.environ.pop('PASSWORD_HASH_WORKERS', None)
+            config = runpy.run_path(os.path.join(os.path.dirname(__file__), 'gunicorn.conf.py'))
+            self.assertEqual(config['worker_class'], 'gevent')
+            self.assertGreater(int(os.environ['PASSWORD_HASH_WORKERS']), 0)
+
+    def test_password_hasher_pool(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, queue_timeout=0)
+        self.addCleanup(hasher.shutdown)
+        hashed = hasher.hash("secret")
+        self.assertTrue(hasher.check(hashed, "secret"))
+        self.assertFalse(hasher.check(hashed, "other"))
+        hasher._slots.acquire()
+        self.assertRaises(HasherBusy, hasher.hash, "secret")
+        hasher._slots.release()
+
+    def test_refresh_token_rotation_and_logout_all(self):
+        self.addCleanup(setattr, password_hasher, 'rounds', password_hasher.rounds)
+        password_hasher.rounds = 4
+        with self.app.app_context():
+            db.session.add(User(email="a@example.com", username="a", is_verified=True,
+                                password=password_hasher.hash("secret")))
+            db.session.commit()
+
+        def refresh_cookie(response):
+            return response.headers['Set-Cookie'].split(';')[0]
+        client = self.app.test_client(use_cookies=False)
+        def refresh(cookie):
+            return client.post('/refresh-token', headers={'Cookie': cookie})
+
+        login = client.post('/login', json={"email": "a@example.com", "password": "secret"})
+        other_session = refresh_cookie(client.post('/login', json={"email": "a@example.com", "password": "secret"}))
+        rotated = refresh(refresh_cookie(login))
+        self.assertEqual(rotated.status_code, 200)
+        self.assertEqual(refresh(refresh_cookie(login)).status_code, 401)
+
+        headers = {'Authorization': f"Bearer {rotated.get_json()['token']}"}
+        self.assertEqual(client.post('/logout-all', headers=headers).get_json()['sessions'], 2)
+        self.assertEqual(refresh(refresh_cookie(rotated)).status_code, 401)
+        self.assertEqual(refresh(other_session).status_code, 401)
+
+    def test_memory_token_store_is_bounded(self):
+        store = MemoryTokenStore(max_tokens=2)
+        store.store("expired", 1, 0)
+        store.store("a", 1, 60)
+        self.assertEqual(len(store), 1)
+        store.store("b", 2, 60)
+        store.store("c", 2, 60)
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get_user("a"))
+        self.assertEqual(store.rotate("b", "d", 60), 2)
+        self.assertIsNone(store.rotate("b", "e", 60))
+        self.assertEqual(store.delete_user(2), 2)
+        self.assertEqual(len(store), 0)
+
+    def test_import_time_budget(self):
+        # Importing the app must not connect to anything or load Redis and HTTP clients
+        env = dict(os.environ, DATABASE_URL='postgresql://nobody@192.0.2.1/unreachable',
+                   REDIS_URL='redis://192.0.2.1:6379/0')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                                capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        timings = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, module = line.split('|')
+            if cumulative.strip().isdigit():
+                timings[module.strip()] = int(cumulative) / 1000
+        self.assertNotIn('redis', timings)
+        self.assertNotIn('requests', timings)
+        self.assertLess(timings['app'], IMPORT_TIME_BUDGET_MS,
+                        sorted(timings.items(), key=lambda item: -item[1])[:15])
+
+    def test_reads_go_to_replica_except_after_own_writes(self):
+        # Two SQLite files stand in for a primary and a replica that has not caught up
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        replicated = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/primary.db',
+                                 'DATABASE_REPLICA_URL': f'sqlite:///{directory}/replica.db',
+                                 'UPVOTE_FLUSH_SECONDS': 0})
+        # Binding the replica registers an empty metadata the other tests' app has no engine for
+        db.metadatas.pop('replica')
+        with replicated.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica'])
+            admins = [User(email=f"{name}@example.com", username=name, password="x", is_verified=True, is_admin=True)
+                      for name in ("writer", "reader")]
+            db.session.add_all(admins)
+            db.session.commit()
+            writer, reader = ({'Authorization': f'Bearer {generate_access_token(admin.id, True)}'} for admin in admins)
+        self.addCleanup(sticky_reads.reset)
+        client = replicated.test_client()
+        trick_count = lambda headers: client.get('/admin/dashboard', headers=headers).get_json()['stats']['total_tricks']
+
+        self.assertEqual(client.get('/admin/dashboard', headers=reader).get_json()['stats']['total_users'], 0)
+        response = client.post('/create-trick', headers=writer, json={
+            "name": "Ollie", "description": "d", "videoUrl": "u", "difficulty": "beginner"
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(trick_count(writer), 1)
+        self.assertEqual(trick_count(reader), 0)
+        # Upvote voters are always read from the primary
+        self.assertEqual(client.get(f"/tricks/{response.get_json()['id']}/upvote-status", headers=reader).get_json(),
+                         {'upvoted': False, 'upvote_count': 0})
+        sticky_reads.reset()
+        self.assertEqual(trick_count(writer), 0)
+        # Versions counted in Redis run ahead of the replica: recently bumped resources are read from the primary
+        with unittest.mock.patch.object(response_cache.backend, 'shared', True):
+            self.assertEqual(len(client.get('/tricks').get_json()), 1)
+
+        # Email verification is a GET that writes, for a user the replica may not have yet
+        with replicated.app_context():
+            db.session.add(User(email="new@example.com", username="new", password="x"))
+            db.session.commit()
+        with replicated.test_request_context():
+            token = url_serializer().dumps("new@example.com", salt='email-verify')
+        self.assertEqual(client.get(f'/verify-email/{token}').status_code, 200)
+        with replicated.app_context():
+            self.assertTrue(User.query.filter_by(email="new@example.com").one().is_verified)
+
+        with replicated.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
     def test_health_check(self):
         response = self.client.get('/health')
         self.assertEqual(response.status_code, 200)
+        self.assertIn('pool', response.get_json()['pools']['primary'])
+
+    def test_engine_pool_options(self):
+        config = dict(app.config, DB_POOL_SIZE=3)
+        self.assertEqual(engine_options('postgresql://db/wikitricks', config), {
+            'pool_pre_ping': True, 'pool_size': 3, 'max_overflow': 10, 'pool_recycle': 1800, 'pool_timeout': 30
+        })
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'], {'pool_pre_ping': True})
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,198 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+MAX_MEMORY_TOKENS = 100000
+# Refresh tokens are secrets.token_urlsafe(64). Only strings of that shape are looked up as
+# legacy keys, so a forged cookie can't name another key of the Redis database
+LEGACY_TOKEN = re.compile(r'[A-Za-z0-9_-]{86}')
+
+def _digest(token):
+    """Refresh tokens are stored by hash so a leaked store can't be replayed"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# In-Memory Store
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+class MemoryTokenStore:
+    """
+    Per-process refresh tokens for single-worker deployments. Tokens are kept
+    in issue order; since they share one lifetime that is also expiry order,
+    so every write sweeps expired tokens off the front. Past max_tokens the
+    oldest sessions are dropped.
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_tokens=MAX_MEMORY_TOKENS):
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = OrderedDict()
+        self._by_user = {}
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _remove(self, key):
+        user_id, _ = self._tokens.pop(key)
+        sessions = self._by_user[user_id]
+        sessions.discard(key)
+        if not sessions:
+            del self._by_user[user_id]
+        return user_id
+
+    def _add(self, key, user_id, ttl):
+        self._tokens[key] = (user_id, time.monotonic() + ttl)
+        self._by_user.setdefault(user_id, set()).add(key)
+        now = time.monotonic()
+        while self._tokens:
+            oldest = next(iter(self._tokens))
+            if self._tokens[oldest][1] > now and len(self._tokens) <= self.max_tokens:
+                break
+            self._remove(oldest)
+
+    def _live_user(self, key):
+        entry = self._tokens.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry[0]
+
+    def store(self, token, user_id, ttl):
+        with self._lock:
+            self._add(_digest(token), user_id, ttl)
+
+    def get_user(self, token):
+        with self._lock:
+            return self._live_user(_digest(token))
+
+    def rotate(self, token, new_token, ttl):
+        """Replace a live token by a new one; returns its user id, or None if it was not live"""
+        key = _digest(token)
+        with self._lock:
+            user_id = self._live_user(key)
+            if user_id is None:
+                return None
+            self._remove(key)
+            self._add(_digest(new_token), user_id, ttl)
+            return user_id
+
+    def delete(self, token):
+        with self._lock:
+            key = _digest(token)
+            if key in self._tokens:
+                self._remove(key)
+
+    def delete_user(self, user_id):
+        """Revoke every session of a user; returns how many were revoked"""
+        with self._lock:
+            keys = list(self._by_user.get(user_id, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def reset(self):
+        with self._lock:
+            self._tokens.clear()
+            self._by_user.clear()
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Redis Store
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# KEYS: old token, new token, old token's legacy key. ARGV: ttl, user index prefix, old digest, new digest
+ROTATE_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if user_id then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', ARGV[2] .. user_id, ARGV[3])
+else
+    user_id = redis.call('GET', KEYS[3])
+    if not user_id or not tonumber(user_id) then
+        return false
+    end
+    redis.call('DEL', KEYS[3])
+end
+local index = ARGV[2] .. user_id
+redis.call('SET', KEYS[2], user_id, 'EX', ARGV[1])
+redis.call('SADD', index, ARGV[4])
+redis.call('EXPIRE', index, ARGV[1])
+return user_id
+"""
+
+class RedisTokenStore:
+    """
+    Refresh tokens shared by every worker. Each user has a set of their token
+    digests, expiring with their newest token, so logging out everywhere only
+    touches that user's sessions. Rotation is a single Lua script call.
+
+    Tokens issued before tokens were stored by digest are still read from
+    their legacy key, the raw token, and moved to a digest key on their next
+    rotation. They are in no user's set until then, so logging out everywhere
+    misses them; they expire within the refresh token lifetime.
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='refresh-token:'):
+        self.client = client
+        self.prefix = prefix
+        self.index_prefix = f'{prefix}user:'
+        self._rotate = client.register_script(ROTATE_SCRIPT)
+
+    def _key(self, digest):
+        return f'{self.prefix}{digest}'
+
+    def store(self, token, user_id, ttl):
+        digest = _digest(token)
+        index = f'{self.index_prefix}{user_id}'
+        pipe = self.client.pipeline()
+        pipe.set(self._key(digest), user_id, ex=ttl)
+        pipe.sadd(index, digest)
+        pipe.expire(index, ttl)
+        pipe.execute()
+
+    def _legacy_key(self, token):
+        """Key of a token issued before tokens were stored by digest, or None if it can't be one"""
+        return token if LEGACY_TOKEN.fullmatch(token) else None
+
+    def get_user(self, token):
+        user_id = self.client.get(self._key(_digest(token)))
+        legacy = self._legacy_key(token)
+        if not user_id and legacy:
+            user_id = self.client.get(legacy)
+        return int(user_id) if user_id and user_id.isdigit() else None
+
+    def rotate(self, token, new_token, ttl):
+        old, new = _digest(token), _digest(new_token)
+        # Not a legacy token: the script only reads its third key after finding the digest key missing
+        legacy = self._legacy_key(token) or self._key(old)
+        user_id = self._rotate(keys=[self._key(old), self._key(new), legacy],
+                               args=[ttl, self.index_prefix, old, new])
+        return int(user_id) if user_id else None
+
+    def delete(self, token):
+        digest = _digest(token)
+        user_id = self.client.get(self._key(digest))
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(digest))
+        if not user_id and self._legacy_key(token):
+            pipe.delete(token)
+        if user_id:
+            pipe.srem(f'{self.index_prefix}{int(user_id)}', digest)
+        pipe.execute()
+
+    def delete_user(self, user_id):
+        index = f'{self.index_prefix}{user_id}'
+        digests = self.client.smembers(index)
+        pipe = self.client.pipeline()
+        for digest in digests:
+            pipe.delete(self._key(digest.decode() if isinstance(digest, bytes) else digest))
+        pipe.delete(index)
+        pipe.execute()
+        return len(digests)
@@ -0,0 +1,371 @@
+import atexit
+import logging
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select, tuple_
+from models import db, Trick, ForumReply, TrickUpvote, ReplyUpvote
+from counters import recount_counters
+from versions import record_changes
+import leaderboards
+
+DEFAULT_FLUSH_SECONDS = 2
+# Voter sets are reloaded from the database after a day without votes
+VOTERS_TTL_SECONDS = 24 * 3600
+
+# Upvotable models by kind: the model, its upvote rows, their foreign key and
+# the columns that tell which cached responses a new count changes
+KINDS = {
+    'trick': (Trick, TrickUpvote, 'trick_id', [Trick.id]),
+    'reply': (ForumReply, ReplyUpvote, 'reply_id', [ForumReply.id, ForumReply.topic_id]),
+}
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Redis Store
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# Voter sets hold a '-' member so an item with no votes is still known to be loaded
+
+# KEYS: voters, pending. ARGV: ttl, user ids...
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('SADD', KEYS[1], '-')
+for i = 2, #ARGV do
+    redis.call('SADD', KEYS[1], ARGV[i])
+end
+local pending = redis.call('HGETALL', KEYS[2])
+for i = 1, #pending, 2 do
+    if pending[i + 1] == '1' then
+        redis.call('SADD', KEYS[1], pending[i])
+    else
+        redis.call('SREM', KEYS[1], pending[i])
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+# KEYS: voters, pending, pending index. ARGV: user id, ttl, item
+TOGGLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local upvoted = 1
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SREM', KEYS[1], ARGV[1])
+    upvoted = 0
+else
+    redis.call('SADD', KEYS[1], ARGV[1])
+end
+redis.call('HSET', KEYS[2], ARGV[1], upvoted)
+redis.call('SADD', KEYS[3], ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {upvoted, redis.call('SCARD', KEYS[1]) - 1}
+"""
+
+# KEYS: pending, pending index. ARGV: item, then user id and flushed value pairs
+SETTLE_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+class RedisBackend:
+    """
+    Voters and pending toggles shared by every worker. Each item has a set
+    of voters and a hash of toggles not yet in the database, and toggling
+    is a single script call, so concurrent clicks can't count a user twice.
+    """
+
+    def __init__(self, client, prefix='upvotes:', ttl=VOTERS_TTL_SECONDS):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.index = f'{prefix}pending'
+        self._load = client.register_script(LOAD_SCRIPT)
+        self._toggle = client.register_script(TOGGLE_SCRIPT)
+        self._settle = client.register_script(SETTLE_SCRIPT)
+
+    def _keys(self, key):
+        item = f'{key[0]}:{key[1]}'
+        return item, f'{self.prefix}voters:{item}', f'{self.prefix}pending:{item}'
+
+    def load(self, key, user_ids):
+        _, voters, pending = self._keys(key)
+        self._load(keys=[voters, pending], args=[self.ttl, *user_ids])
+
+    def toggle(self, key, user_id):
+        item, voters, pending = self._keys(key)
+        result = self._toggle(keys=[voters, pending, self.index], args=[user_id, self.ttl, item])
+        return None if result is None else (bool(result[0]), int(result[1]))
+
+    def status(self, key, user_id):
+        _, voters, _ = self._keys(key)
+        pipe = self.client.pipeline()
+        pipe.exists(voters)
+        pipe.sismember(voters, user_id)
+        pipe.scard(voters)
+        loaded, upvoted, count = pipe.execute()
+        return (bool(upvoted), count - 1) if loaded else None
+
+    def count(self, key):
+        _, voters, _ = self._keys(key)
+        pipe = self.client.pipeline()
+        pipe.exists(voters)
+        pipe.scard(voters)
+        loaded, count = pipe.execute()
+        return count - 1 if loaded else None
+
+    def pending(self):
+        items = [item.decode() if isinstance(item, bytes) else item for item in self.client.smembers(self.index)]
+        pipe = self.client.pipeline()
+        for item in items:
+            pipe.hgetall(f'{self.prefix}pending:{item}')
+        pending = {}
+        for item, changes in zip(items, pipe.execute()):
+            kind, item_id = item.split(':')
+            pending[(kind, int(item_id))] = {int(user_id): value in (b'1', '1') for user_id, value in changes.items()}
+        return pending
+
+    def waiting(self, keys):
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.sismember(self.index, self._keys(key)[0])
+        return [key for key, waiting in zip(keys, pipe.execute()) if waiting]
+
+    def settle(self, key, changes):
+        item, _, pending = self._keys(key)
+        args = [item]
+        for user_id, upvoted in changes.items():
+            args += [user_id, 1 if upvoted else 0]
+        self._settle(keys=[pending, self.index], args=args)
+
+    def forget(self, key):
+        item, voters, pending = self._keys(key)
+        pipe = self.client.pipeline()
+        pipe.delete(voters, pending)
+        pipe.srem(self.index, item)
+        pipe.execute()
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Write-Behind Buffer
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _insert_missing(upvote_model, foreign_key, rows):
+    """Insert upvote rows, skipping any the unique constraint already holds"""
+    table = upvote_model.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        pairs = [(row['user_id'], row[foreign_key]) for row in rows]
+        existing = set(db.session.execute(
+            table.select().with_only_columns(table.c.user_id, table.c[foreign_key])
+            .where(tuple_(table.c.user_id, table.c[foreign_key]).in_(pairs))
+        ).all())
+        rows = [row for row in rows if (row['user_id'], row[foreign_key]) not in existing]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        return
+    db.session.execute(dialect_insert(table).values(rows).on_conflict_do_nothing(
+        index_elements=[table.c.user_id, table.c[foreign_key]]
+    ))
+
+class UpvoteBuffer:
+    """
+    Upvote toggles are answered from the store and written to the database
+    in batches every interval seconds, so a viral trick costs one
+    transaction per batch instead of one per click. The store keeps the
+    set of voters of each item; a toggle flips the user's membership, so a
+    user counts once, as the unique constraint on the upvote tables also
+    ensures when the batch is written. Pending toggles hold the state to
+    write rather than a delta, so a batch written twice, by two workers or
+    after a crash, has the same effect as once. Toggles only wait in Redis:
+    a per-process store would lose them with its worker and hide them from
+    the others. Without Redis (backend None), or with an interval of 0,
+    every toggle is written before answering.
+    """
+
+    def __init__(self, backend, interval=DEFAULT_FLUSH_SECONDS):
+        self.backend = backend
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    @property
+    def buffered(self):
+        return self.interval > 0 and self.backend is not None
+
+    def _read(self, statement):
+        """Voters are read from the primary: a lagging replica would seed them with old votes"""
+        return db.session.execute(statement, bind_arguments={'bind': db.session().primary_bind()})
+
+    def _load(self, kind, item_id):
+        """Seed the store with an item's voters; returns False, dropping its voters, if the item does not exist"""
+        model, upvote_model, foreign_key, _ = KINDS[kind]
+        rows = self._read(select(model.id, upvote_model.user_id).outerjoin(
+            upvote_model, getattr(upvote_model, foreign_key) == model.id
+        ).where(model.id == item_id)).all()
+        if not rows:
+            self.backend.forget((kind, item_id))
+            return False
+        self.backend.load((kind, item_id), [row.user_id for row in rows if row.user_id is not None])
+        return True
+
+    def _status(self, key, user_id):
+        status = self.backend.status(key, user_id)
+        if status is None and self._load(*key):
+            status = self.backend.status(key, user_id)
+        return status
+
+    def _stored_status(self, kind, item_id, user_id):
+        """(upvoted, count) as written in the database, or None if the item does not exist"""
+        model, upvote_model, foreign_key, _ = KINDS[kind]
+        count = self._read(select(model.upvote_count).where(model.id == item_id)).scalar()
+        if count is None:
+            return None
+        upvoted = self._read(select(upvote_model.id).where(
+            upvote_model.user_id == user_id, getattr(upvote_model, foreign_key) == item_id
+        )).first() is not None
+        return upvoted, count
+
+    def status(self, kind, item_id, user_id):
+        """(upvoted, count) of an item for a user, or None if the item does not exist"""
+        if not self.buffered:
+            return self._stored_status(kind, item_id, user_id)
+        return self._status((kind, item_id), user_id)
+
+    def pending_statuses(self, kind, ids, user_id):
+        """(upvoted, count) by id of the items among ids with toggles the database doesn't have yet"""
+        if not self.buffered:
+            return {}
+        statuses = {key[1]: self._status(key, user_id) for key in self.backend.waiting([(kind, item_id) for item_id in ids])}
+        return {item_id: status for item_id, status in statuses.items() if status is not None}
+
+    def pending_counts(self, kind, ids):
+        """Count by id of the items among ids with toggles the database doesn't have yet"""
+        if not self.buffered:
+            return {}
+        counts = {}
+        for key in self.backend.waiting([(kind, item_id) for item_id in ids]):
+            count = self.backend.count(key)
+            if count is None and self._load(*key):
+                count = self.backend.count(key)
+            if count is not None:
+                counts[key[1]] = count
+        return counts
+
+    def toggle(self, kind, item_id, user_id):
+        """Toggle a user's upvote; returns (upvoted, count), or None if the item does not exist"""
+        if not self.buffered:
+            return self._write_toggle(kind, item_id, user_id)
+        # Voters are loaded once per item, which is also when the item is found to exist;
+        # toggles on an item deleted since then are dropped by the next flush
+        key = (kind, item_id)
+        result = self.backend.toggle(key, user_id)
+        if result is None:
+            if not self._load(kind, item_id):
+                return None
+            result = self.backend.toggle(key, user_id)
+        self._start_flusher()
+        return result
+
+    def _write_toggle(self, kind, item_id, user_id):
+        status = self._stored_status(kind, item_id, user_id)
+        if status is None:
+            return None
+        upvoted = not status[0]
+        self._write_changes({(kind, item_id): {user_id: upvoted}})
+        model = KINDS[kind][0]
+        count = db.session.query(model.upvote_count).filter(model.id == item_id).scalar()
+        db.session.commit()
+        return upvoted, count
+
+    def flush(self):
+        """Write the pending toggles in one transaction; returns how many were written"""
+        try:
+            return self._write()
+        except Exception as e:
+            db.session.rollback()
+            logging.exception(e)
+            return 0
+
+    def _write(self):
+        if self.backend is None:
+            return 0
+        pending = self.backend.pending()
+        if not pending:
+            return 0
+        gone = self._write_changes(pending)
+        db.session.commit()
+
+        for key, users in pending.items():
+            if key in gone:
+                self.backend.forget(key)
+            else:
+                self.backend.settle(key, users)
+        return sum(len(users) for users in pending.values())
+
+    def _write_changes(self, pending):
+        """Apply {(kind, item id): {user id: upvoted}} to the upvote rows and counters; returns the keys of deleted items"""
+        gone = []
+        for kind, (model, upvote_model, foreign_key, columns) in KINDS.items():
+            changes = {item_id: users for (name, item_id), users in pending.items() if name == kind}
+            if not changes:
+                continue
+            rows = db.session.query(*columns).filter(model.id.in_(list(changes))).all()
+            existing = {row.id for row in rows}
+            gone += [(kind, item_id) for item_id in changes if item_id not in existing]
+
+            added = [{'user_id': user_id, foreign_key: item_id}
+                     for item_id, users in changes.items() if item_id in existing
+                     for user_id, upvoted in users.items() if upvoted]
+            removed = [(user_id, item_id)
+                       for item_id, users in changes.items() if item_id in existing
+                       for user_id, upvoted in users.items() if not upvoted]
+            if added:
+                _insert_missing(upvote_model, foreign_key, added)
+            if removed:
+                db.session.query(upvote_model).filter(
+                    tuple_(upvote_model.user_id, getattr(upvote_model, foreign_key)).in_(removed)
+                ).delete(synchronize_session=False)
+            if existing:
+                recount_counters(model, list(existing))
+                if model is Trick:
+                    leaderboards.sync_trick_upvotes(list(existing))
+                record_changes(model, rows, 'update')
+        return gone
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                app = current_app._get_current_object()
+                self._flusher = threading.Thread(target=self._run, args=(app,), daemon=True)
+                self._flusher.start()
+                atexit.register(self._flush_in, app)
+
+    def _flush_in(self, app):
+        with app.app_context():
+            try:
+                self.flush()
+            finally:
+                db.session.remove()
+
+    def _run(self, app):
+        while True:
+            time.sleep(self.interval if self.interval > 0 else DEFAULT_FLUSH_SECONDS)
+            self._flush_in(app)
+
+upvote_buffer = UpvoteBuffer(None)
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import request, current_app, g, has_request_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from models import (db, User, Trick, TrickUpvote, Comment, ForumTopic, ForumReply, ReplyUpvote,
+                    Skatepark, LeaderboardCounter, ResourceVersion)
+from cache import response_cache, ALL_TAG
+from database import read_from_primary, reads_from_replica, sticky_reads
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Change Tracking
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+# User fields rendered by public listings
+USER_DISPLAY_FIELDS = ('username', 'region', 'email')
+
+def _user_tags(user, change):
+    """A new user has no content yet; only renames and deletions show up in listings"""
+    if change == 'delete':
+        return ['users']
+    state = inspect(user)
+    if change == 'update' and any(state.attrs[field].history.has_changes() for field in USER_DISPLAY_FIELDS):
+        return ['users']
+    return []
+
+def _reply_upvote_tags(upvote, change):
+    # The upvote routes load the reply first, so this is an identity map lookup
+    reply = object_session(upvote).get(ForumReply, upvote.reply_id)
+    return [f'topic:{reply.topic_id}'] if reply else []
+
+# Tags changed when a row of each model is inserted, updated or deleted
+MODEL_TAGS = {
+    Trick: lambda trick, change: ['tricks', f'trick:{trick.id}', 'leaderboards'],
+    TrickUpvote: lambda upvote, change: ['tricks', f'trick:{upvote.trick_id}', 'leaderboards'],
+    Comment: lambda comment, change: [f'trick:{comment.trick_id}', 'leaderboards'],
+    ForumTopic: lambda topic, change: ['forum_topics', f'topic:{topic.id}', 'leaderboards'],
+    ForumReply: lambda reply, change: ['forum_topics', f'topic:{reply.topic_id}', 'leaderboards'],
+    ReplyUpvote: _reply_upvote_tags,
+    Skatepark: lambda skatepark, change: ['skateparks'],
+    LeaderboardCounter: lambda counter, change: ['leaderboards'],
+    User: _user_tags
+}
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_tags(session, flush_context):
+    tags = session.info.setdefault('changed_tags', set())
+    for objects, change in ((session.new, 'insert'), (session.dirty, 'update'), (session.deleted, 'delete')):
+        for obj in objects:
+            tags_for = MODEL_TAGS.get(type(obj))
+            if tags_for and (change != 'update' or session.is_modified(obj)):
+                tags.update(tags_for(obj, change))
+
+def record_changes(model, rows, change='delete'):
+    """Queue the tags of rows written by a bulk statement, which the flush hook never sees"""
+    tags = db.session.info.setdefault('changed_tags', set())
+    for row in rows:
+        tags.update(MODEL_TAGS[model](row, change))
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_committed(session):
+    tags = session.info.pop('changed_tags', None)
+    if tags:
+        # A GET route that writes would otherwise be routed to the replica
+        bump_versions(tags, bind=session.primary_bind())
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_tags(session, previous_transaction):
+    session.info.pop('changed_tags', None)
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Version Counters
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def bump_versions(tags, bind=None):
+    """
+    Increment the version of each tag and invalidate the cached responses using it.
+    Versions are counted by the response cache's backend when it is shared
+    (Redis), and in the resource_versions table otherwise. Runs after the data
+    is committed, so a version never announces a change readers cannot see yet;
+    a reader racing the bump merely revalidates once more.
+    """
+    tags = sorted(set(tags))
+    response_cache.invalidate(*tags)
+    if response_cache.backend.shared:
+        # One INCR per tag, instead of upserting a few hot rows on the primary
+        return
+    table = ResourceVersion.__table__
+    now = datetime.utcnow()
+    engine = bind or db.engine
+    try:
+        with engine.begin() as connection:
+            dialect = connection.dialect.name
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                for tag in tags:
+                    updated = connection.execute(table.update().where(table.c.tag == tag).values(
+                        version=table.c.version + 1, updated_at=now
+                    ))
+                    if updated.rowcount == 0:
+                        connection.execute(table.insert().values(tag=tag, version=1, updated_at=now))
+                return
+
+            # Sorted rows keep concurrent upserts from deadlocking on each other
+            statement = dialect_insert(table).values([
+                {'tag': tag, 'version': 1, 'updated_at': now} for tag in tags
+            ])
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.tag],
+                set_={'version': table.c.version + 1, 'updated_at': statement.excluded.updated_at}
+            ))
+    except Exception as e:
+        logging.warning(f"Could not bump resource versions {tags}: {e}")
+
+def read_versions(tags):
+    """
+    {tag: (version, updated_at)} for the tags that have changed at least once.
+    Read once per request: the ETag and the response cache entry of a response
+    are both derived from this read, so a cached body is never sent under the
+    ETag of a newer version.
+    """
+    if not has_request_context():
+        return _stored_versions(tags)
+    read = g.setdefault('resource_versions', {})
+    if tuple(tags) not in read:
+        read[tuple(tags)] = _stored_versions(tags)
+    return read[tuple(tags)]
+
+def _stored_versions(tags):
+    if response_cache.backend.shared:
+        versions = response_cache.backend_versions(tags)
+        # Redis sees a bump as soon as the primary commits, the replica only once it
+        # catches up; reading the rows from it could pair old rows with the new version.
+        # The table needs no such care: the replica applies the bump after the rows.
+        horizon = datetime.utcnow() - timedelta(seconds=sticky_reads.seconds)
+        if reads_from_replica() and any(updated_at > horizon for _, updated_at in versions.values()):
+            read_from_primary()
+        return versions
+    table = ResourceVersion.__table__
+    rows = db.session.execute(
+        table.select().with_only_columns(table.c.tag, table.c.version, table.c.updated_at).where(table.c.tag.in_(tags))
+    )
+    return {row.tag: (row.version, row.updated_at) for row in rows}
+
+# ═══════════════════════════════════════════════════════════════════════════════════════
+# Conditional Requests
+# ═══════════════════════════════════════════════════════════════════════════════════════
+
+def _validators(tags, versions):
+    """Strong ETag and Last-Modified of a response built from the given tag versions"""
+    stamps = []
+    last_modified = None
+    for tag in tags:
+        version, updated_at = versions.get(tag, (0, None))
+        stamps.append(f"{tag}={version}@{updated_at.isoformat() if updated_at else ''}")
+        if updated_at and (last_modified is None or updated_at > last_modified):
+            last_modified = updated_at
+
+    # Bodies differ per user when a token is sent (upvote flags)
+    raw = '|'.join([request.full_path, request.headers.get('Authorization', '')] + stamps)
+    etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    # HTTP dates have second precision: a resource changed during the current second
+    # may change again within it, so only the ETag can describe it safely
+    if last_modified is not None:
+        last_modified = last_modified.replace(microsecond=0)
+        if last_modified >= datetime.utcnow().replace(microsecond=0):
+            last_modified = None
+    return etag, last_modified
+
+def conditional(*tags):
+    """
+    Decorate a GET view to send ETag and Last-Modified validators derived from
+    the versions of its tags, and answer 304 Not Modified from those versions
+    alone, before the view queries or serializes anything. Tags may reference
+    view arguments, e.g. 'trick:{trick_id}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            entry_tags = [ALL_TAG] + [tag.format(**kwargs) for tag in tags]
+            try:
+                etag, last_modified = _validators(entry_tags, read_versions(entry_tags))
+            except Exception as e:
+                logging.warning(f"Could not read resource versions: {e}")
+                return view(*args, **kwargs)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since and last_modified:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Authorization')
+            return response
+        return wrapper
+    return decorator
+
+response_cache.read_versions = read_versions
@@ -274,6 +274,7 @@ const TrickCard = ({ trick, onTrickDelete }) => {
           type="trick" 
           itemId={trick.id} 
           initialCount={trick.upvote_count || 0}
+          initialUpvoted={trick.upvoted}
         />
       </CardFooter>
     </Card>
@@ -43,18 +43,25 @@ const UpvoteCount = styled.span`
   font-size: 0.9rem;
 `;
 
-const UpvoteButton = ({ type, itemId, initialCount = 0, initialUpvoted = false }) => {
+const UpvoteButton = ({ type, itemId, initialCount = 0, initialUpvoted }) => {
   const { user } = useAuth();
-  const [upvoted, setUpvoted] = useState(initialUpvoted);
+  const [upvoted, setUpvoted] = useState(Boolean(initialUpvoted));
   const [count, setCount] = useState(initialCount);
   const [loading, setLoading] = useState(false);
 
   useEffect(() => {
-    if (user) {
+    // List responses include the status for authenticated users, so only
+    // fetch it when the parent could not provide it
+    if (user && initialUpvoted === undefined) {
       fetchUpvoteStatus();
     }
   }, [user, itemId]);
 
+  // Counts pushed to the parent by live events replace the displayed one
+  useEffect(() => {
+    setCount(initialCount);
+  }, [initialCount]);
+
   const fetchUpvoteStatus = async () => {
     try {
       const endpoint = type === 'trick' 
@@ -3,6 +3,7 @@ import { useParams, Link, useNavigate } from 'react-router-dom';
 import styled from 'styled-components';
 import { useAuth } from '../contexts/AuthContext';
 import axiosInstance from '../utils/axios';
+import { useLiveEvents, addUnique } from '../utils/liveEvents';
 import { 
   PageWrapper, 
   Button, 
@@ -259,6 +260,22 @@ const ForumTopic = () => {
     fetchTopicAndReplies();
   }, [id]);
 
+  // Replies and upvote counts from other users appear without refetching the thread
+  useLiveEvents(`/forum/topics/${id}/events`, {
+    reply: (reply) => setReplies(current => addUnique(current, reply)),
+    upvote: ({ reply_id, upvote_count }) => setReplies(current => current.map(
+      reply => reply.id === reply_id ? { ...reply, upvote_count } : reply
+    )),
+    reset: async () => {
+      try {
+        const response = await axiosInstance.get(`/forum/topics/${id}/replies`);
+        setReplies(response.data);
+      } catch (err) {
+        console.error('Failed to reload replies:', err);
+      }
+    }
+  });
+
   const handleReplySubmit = async (e) => {
     e.preventDefault();
     if (!replyContent.trim()) return;
@@ -268,7 +285,7 @@ const ForumTopic = () => {
       const response = await axiosInstance.post(`/forum/topics/${id}/replies`, {
         content: replyContent
       });
-      setReplies([...replies, response.data]);
+      setReplies(current => addUnique(current, response.data));
       setReplyContent('');
     } catch (err) {
       console.error('Failed to post reply:', err);
@@ -363,6 +380,7 @@ const ForumTopic = () => {
                 type="reply" 
                 itemId={reply.id} 
                 initialCount={reply.upvote_count || 0}
+                initialUpvoted={reply.upvoted}
               />
             </ReplyFooter>
           </ReplyCard>
@@ -2,8 +2,10 @@ import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import styled from 'styled-components';
 import axiosInstance from '../utils/axios';
+import { useLiveEvents, addUnique } from '../utils/liveEvents';
 import CommentList from '../components/CommentList';
 import CommentForm from '../components/CommentForm';
+import UpvoteButton from '../components/UpvoteButton';
 import { 
   PageWrapper, 
   LoadingMessage, 
@@ -165,23 +167,30 @@ const TrickDetails = () => {
     fetchTrick();
   }, [id]);
 
+  const fetchComments = async () => {
+    try {
+      const response = await axiosInstance.get(`/tricks/${id}/comments`);
+      setComments(response.data);
+    } catch (err) {
+      console.error('Failed to fetch comments:', err);
+    }
+  };
+
   useEffect(() => {
-    const fetchComments = async () => {
-      try {
-        const response = await axiosInstance.get(`/tricks/${id}/comments`);
-        setComments(response.data);
-      } catch (err) {
-        console.error('Failed to fetch comments:', err);
-      }
-    };
-    
     fetchComments();
   }, [id]);
 
+  // New comments and upvote counts from other users appear without refetching
+  useLiveEvents(`/tricks/${id}/events`, {
+    comment: (comment) => setComments(current => addUnique(current, comment, true)),
+    upvote: ({ upvote_count }) => setTrick(current => current && { ...current, upvote_count }),
+    reset: fetchComments
+  });
+
   const handleCommentSubmit = async (content) => {
     try {
       const response = await axiosInstance.post(`/tricks/${id}/comments`, { content });
-      setComments([response.data, ...comments]);
+      setComments(current => addUnique(current, response.data, true));
     } catch (err) {
       console.error('Failed to post comment:', err);
     }
@@ -267,6 +276,11 @@ const TrickDetails = () => {
             <strong>Posted:</strong> {new Date(trick.created_at).toLocaleDateString()}
           </div>
         )}
+        <UpvoteButton
+          type="trick"
+          itemId={trick.id}
+          initialCount={trick.upvote_count || 0}
+        />
       </TrickMeta>
 
       {canDeleteTrick && (
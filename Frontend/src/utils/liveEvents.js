@@ -0,0 +1,31 @@
+import { useEffect, useRef } from 'react';
+
+const EVENT_NAMES = ['comment', 'reply', 'upvote', 'reset'];
+
+// Listen to a server-sent events stream of the API while the component is mounted.
+// handlers maps event names to callbacks receiving the event data; 'reset' means
+// events were missed and the list should be fetched again.
+export const useLiveEvents = (path, handlers) => {
+    const handlersRef = useRef(handlers);
+    handlersRef.current = handlers;
+
+    useEffect(() => {
+        if (!path || typeof EventSource === 'undefined') return undefined;
+
+        const source = new EventSource(`${process.env.REACT_APP_API_URL}${path}`);
+        EVENT_NAMES.forEach((name) => {
+            source.addEventListener(name, (event) => {
+                const handler = handlersRef.current[name];
+                if (handler) handler(JSON.parse(event.data));
+            });
+        });
+        return () => source.close();
+    }, [path]);
+};
+
+// Append an item unless it is already listed, as a post can arrive both from the
+// POST response and from the stream
+export const addUnique = (items, item, prepend = false) => {
+    if (items.some(existing => existing.id === item.id)) return items;
+    return prepend ? [item, ...items] : [...items, item];
+};